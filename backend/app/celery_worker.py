@@ -1,5 +1,7 @@
 import os
+from typing import Optional
 from celery import Celery
+from kombu import Queue
 from celery.utils.log import get_task_logger
 
 # Initialize logger
@@ -29,13 +31,98 @@ celery.conf.update(
     worker_max_tasks_per_child=200,  # Restart worker after processing 200 tasks
     task_time_limit=3600,  # 1 hour time limit for tasks
     task_soft_time_limit=3000,  # 50 minutes soft time limit
+    task_queues=(Queue("light"), Queue("media"), Queue("document")),
+    task_default_queue="light",  # Maintenance tasks and anything unrouted
+    task_routes={
+        # Parts of segmented video conversions
+        "transcode_video_segment": {"queue": "media"},
+        "encode_video_audio": {"queue": "media"},
+        "join_video_segments": {"queue": "media"},
+        "abort_segmented_conversion": {"queue": "media"},
+    },
 )
 
+# Queue for each conversion type; light conversions are short, media and
+# document conversions can run for minutes
+QUEUE_BY_CONVERSION_TYPE = {
+    "text": "light",
+    "image": "light",
+    "audio": "media",
+    "video": "media",
+    "document": "document",
+    "compressed": "document",
+}
+
+# Inputs above this size are too slow for the light queue
+LIGHT_QUEUE_MAX_BYTES = int(os.getenv("LIGHT_QUEUE_MAX_BYTES", str(20 * 1024 * 1024)))  # 20MB
+
+def select_queue(conversion_type: str, file_size: Optional[int] = None) -> str:
+    """
+    Pick the queue a conversion should run on.
+    
+    Args:
+        conversion_type: Type of conversion
+        file_size: Size of the input file in bytes, if known
+        
+    Returns:
+        Name of the queue
+    """
+    queue = QUEUE_BY_CONVERSION_TYPE.get(conversion_type, "document")
+    
+    # Keep large inputs from holding up the light workers
+    if queue == "light" and file_size is not None and file_size > LIGHT_QUEUE_MAX_BYTES:
+        queue = "document"
+    
+    return queue
+
+# Worker profiles, selected with the WORKER_PROFILE environment variable.
+# Each profile consumes its own queue and is sized for its workload: light
+# workers run many short tasks at once and may prefetch, media workers run
+# one CPU-heavy transcode per core at most and never hold tasks back.
+CPU_COUNT = os.cpu_count() or 1
+WORKER_PROFILES = {
+    "light": {
+        "task_queues": (Queue("light"),),
+        "worker_concurrency": CPU_COUNT * 2,
+        "worker_prefetch_multiplier": 4,
+        "worker_max_tasks_per_child": 1000,
+        "task_time_limit": 600,
+        "task_soft_time_limit": 540,
+    },
+    "media": {
+        "task_queues": (Queue("media"),),
+        "worker_concurrency": max(1, CPU_COUNT // 2),  # ffmpeg uses several threads per job
+        "worker_prefetch_multiplier": 1,
+        "worker_max_tasks_per_child": 50,
+        "task_time_limit": 3600,
+        "task_soft_time_limit": 3000,
+    },
+    "document": {
+        "task_queues": (Queue("document"),),
+        "worker_concurrency": CPU_COUNT,
+        "worker_prefetch_multiplier": 1,
+        "worker_max_tasks_per_child": 100,
+        "task_time_limit": 1800,
+        "task_soft_time_limit": 1500,
+    },
+}
+
+worker_profile = os.getenv("WORKER_PROFILE")
+if worker_profile:
+    if worker_profile not in WORKER_PROFILES:
+        raise ValueError(f"Unknown worker profile: {worker_profile}")
+    celery.conf.update(WORKER_PROFILES[worker_profile])
+    logger.info(f"Using the {worker_profile} worker profile")
+
 # Optional: Add periodic tasks
 celery.conf.beat_schedule = {
     "cleanup-old-files": {
-        "task": "app.tasks.cleanup_old_files",
-        "schedule": 3600.0,  # Run every hour
+        "task": "cleanup_old_files",
+        "schedule": 300.0,  # Run every 5 minutes (only expired entries are visited)
+    },
+    "sweep-old-files": {
+        "task": "sweep_old_files",
+        "schedule": 24 * 3600.0,  # Run daily
     },
 }
 
@@ -1,10 +1,9 @@
 import os
-import asyncio
 import subprocess
-from typing import List, Optional
-import aiofiles
+from typing import Optional
 
 from app.utils.base_converter import BaseConverter
+from app.utils.ffmpeg import probe_duration, run_ffmpeg
 
 class AudioConverter(BaseConverter):
     """
@@ -12,12 +11,15 @@ class AudioConverter(BaseConverter):
     Supports conversions between various audio formats like mp3, wav, ogg, etc.
     """
     
-    def __init__(self):
-        super().__init__()
-        
-        # Define supported formats
-        self._input_formats = ["mp3", "wav", "ogg", "flac", "aac", "m4a", "wma", "aiff"]
-        self._output_formats = ["mp3", "wav", "ogg", "flac", "aac", "m4a"]
+    # ffmpeg is now tried before pydub
+    version = "2"
+    
+    warm_modules = ("pydub",)
+    
+    edge_cost = 3.0
+    
+    input_formats = ("mp3", "wav", "ogg", "flac", "aac", "m4a", "wma", "aiff")
+    output_formats = ("mp3", "wav", "ogg", "flac", "aac", "m4a")
     
     async def convert(
         self, 
@@ -45,45 +47,41 @@ class AudioConverter(BaseConverter):
         
         output_path = self._generate_output_path(file_path, target_format, output_filename)
         
-        # Try to use pydub for conversion (which uses ffmpeg under the hood)
+        # Use ffmpeg directly: it streams the audio and reports progress, while pydub
+        # decodes the whole file into memory first
         try:
-            await self._convert_with_pydub(file_path, output_path, target_format)
+            await self._convert_with_ffmpeg(file_path, output_path, target_format)
         except Exception as e:
-            # Fallback to direct ffmpeg if pydub fails
+            # Fallback to pydub if ffmpeg fails
             try:
-                await self._convert_with_ffmpeg(file_path, output_path, target_format)
-            except Exception as ffmpeg_error:
-                raise Exception(f"Audio conversion failed: {str(e)}. FFmpeg fallback also failed: {str(ffmpeg_error)}")
+                await self._run_cpu(self._convert_with_pydub, file_path, output_path, target_format)
+            except Exception as pydub_error:
+                raise Exception(f"Audio conversion failed: {str(e)}. Pydub fallback also failed: {str(pydub_error)}")
         
         return output_path
     
-    def get_supported_input_formats(self) -> List[str]:
-        """Get a list of supported input formats"""
-        return self._input_formats
-    
-    def get_supported_output_formats(self) -> List[str]:
-        """Get a list of supported output formats"""
-        return self._output_formats
-    
     # Helper methods
     
-    async def _convert_with_pydub(self, file_path: str, output_path: str, target_format: str):
-        """Convert audio using pydub and ffmpeg"""
+    def _convert_with_pydub(self, file_path: str, output_path: str, target_format: str):
+        """Convert audio using pydub and ffmpeg (run in an executor thread)"""
         from pydub import AudioSegment
         
         # Load the audio file
+        self.report_progress("decoding audio")
         audio = AudioSegment.from_file(file_path)
         
         # Export the audio file to the target format
-        async with aiofiles.open(output_path, "wb") as f:
-            audio.export(f, format=target_format)
+        self.report_progress("encoding audio")
+        audio.export(output_path, format=target_format)
     
     async def _convert_with_ffmpeg(self, file_path: str, output_path: str, target_format: str):
         """Convert audio using ffmpeg directly"""
-        command = [
-            "ffmpeg",
+        args = [
             "-i", file_path,
+            "-y",  # Overwrite output file if it exists
             output_path
         ]
-        process = await asyncio.create_subprocess_exec(*command)
-        await process.communicate() 
\ No newline at end of file
+        
+        # Progress is reported as seconds of output written out of the input's duration
+        duration = await probe_duration(file_path)
+        await run_ffmpeg(args, duration, stage="encoding audio") 
\ No newline at end of file
@@ -3,10 +3,8 @@ import zipfile
 import tarfile
 import shutil
 import tempfile
-import asyncio
-from typing import List, Optional
+from typing import Optional
 import aiofiles
-from concurrent.futures import ThreadPoolExecutor
 
 from app.utils.base_converter import BaseConverter
 
@@ -16,12 +14,12 @@ class CompressedConverter(BaseConverter):
     Supports conversions between various compressed formats like zip, tar, gz, etc.
     """
     
-    def __init__(self):
-        super().__init__()
-        
-        # Define supported formats
-        self._input_formats = ["zip", "tar", "gz", "bz2", "xz", "7z", "rar"]
-        self._output_formats = ["zip", "tar", "gz", "bz2", "xz", "7z"]
+    warm_modules = ("py7zr",)
+    
+    edge_cost = 1.0
+    
+    input_formats = ("zip", "tar", "gz", "bz2", "xz", "7z", "rar")
+    output_formats = ("zip", "tar", "gz", "bz2", "xz", "7z")
     
     async def convert(
         self, 
@@ -53,37 +51,30 @@ class CompressedConverter(BaseConverter):
         with tempfile.TemporaryDirectory() as temp_dir:
             # Extract the input file
             try:
-                # Run the extraction in a thread pool to avoid blocking
-                with ThreadPoolExecutor() as executor:
-                    await asyncio.get_event_loop().run_in_executor(
-                        executor, self._extract_archive, file_path, temp_dir, input_format
-                    )
+                # Run the extraction in the shared io pool to avoid blocking
+                await self._run_io(self._extract_archive, file_path, temp_dir, input_format)
                 
-                # Create the output archive
-                with ThreadPoolExecutor() as executor:
-                    await asyncio.get_event_loop().run_in_executor(
-                        executor, self._create_archive, temp_dir, output_path, target_format
-                    )
+                # Create the output archive; compressing it keeps a core busy
+                await self._run_cpu(self._create_archive, temp_dir, output_path, target_format)
                 
                 return output_path
             except Exception as e:
                 raise Exception(f"Compression conversion failed: {str(e)}")
     
-    def get_supported_input_formats(self) -> List[str]:
-        """Get a list of supported input formats"""
-        return self._input_formats
-    
-    def get_supported_output_formats(self) -> List[str]:
-        """Get a list of supported output formats"""
-        return self._output_formats
-    
     # Helper methods
     
     def _extract_archive(self, file_path: str, extract_dir: str, format: str) -> None:
         """Extract an archive to a directory (efficient non-blocking implementation)"""
         if format == "zip":
             with zipfile.ZipFile(file_path, 'r') as zip_ref:
-                zip_ref.extractall(extract_dir)
+                # Extract member by member to report the bytes done
+                members = zip_ref.infolist()
+                total = sum(member.file_size for member in members)
+                done = 0
+                for member in members:
+                    zip_ref.extract(member, extract_dir)
+                    done += member.file_size
+                    self.report_progress("extracting", done, total, "bytes")
         elif format in ["tar", "gz", "bz2", "xz"]:
             mode = "r"
             if format == "gz":
@@ -94,8 +85,17 @@ class CompressedConverter(BaseConverter):
                 mode = "r:xz"
                 
             with tarfile.open(file_path, mode) as tar_ref:
-                tar_ref.extractall(extract_dir)
+                # Extract member by member to report the bytes done
+                members = tar_ref.getmembers()
+                total = sum(member.size for member in members)
+                done = 0
+                for member in members:
+                    tar_ref.extract(member, extract_dir)
+                    done += member.size
+                    self.report_progress("extracting", done, total, "bytes")
         elif format in ["7z", "rar"]:
+            self.report_progress("extracting")
+            
             # Use py7zr for 7z files
             if format == "7z":
                 import py7zr
@@ -109,13 +109,21 @@ class CompressedConverter(BaseConverter):
                     
     def _create_archive(self, source_dir: str, output_path: str, format: str) -> None:
         """Create an archive from a directory (efficient non-blocking implementation)"""
+        # Sizes of the files to add, for progress reporting
+        files = []
+        for root, _, names in os.walk(source_dir):
+            for name in names:
+                file_path = os.path.join(root, name)
+                files.append((file_path, os.path.relpath(file_path, source_dir), os.path.getsize(file_path)))
+        total = sum(size for _, _, size in files)
+        done = 0
+        
         if format == "zip":
             with zipfile.ZipFile(output_path, 'w', zipfile.ZIP_DEFLATED) as zip_ref:
-                for root, _, files in os.walk(source_dir):
-                    for file in files:
-                        file_path = os.path.join(root, file)
-                        arcname = os.path.relpath(file_path, source_dir)
-                        zip_ref.write(file_path, arcname)
+                for file_path, arcname, size in files:
+                    zip_ref.write(file_path, arcname)
+                    done += size
+                    self.report_progress("compressing", done, total, "bytes")
         elif format in ["tar", "gz", "bz2", "xz"]:
             mode = "w"
             if format == "gz":
@@ -126,8 +134,12 @@ class CompressedConverter(BaseConverter):
                 mode = "w:xz"
                 
             with tarfile.open(output_path, mode) as tar_ref:
-                tar_ref.add(source_dir, arcname="")
+                for file_path, arcname, size in files:
+                    tar_ref.add(file_path, arcname=arcname)
+                    done += size
+                    self.report_progress("compressing", done, total, "bytes")
         elif format == "7z":
+            self.report_progress("compressing")
             import py7zr
             with py7zr.SevenZipFile(output_path, mode='w') as z:
                 z.writeall(source_dir, arcname="") 
\ No newline at end of file
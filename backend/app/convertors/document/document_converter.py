@@ -1,7 +1,6 @@
-import os
 import asyncio
 import subprocess
-from typing import List, Optional
+from typing import Any, BinaryIO, Callable, List, Optional, Tuple
 
 from app.utils.base_converter import BaseConverter
 
@@ -11,12 +10,37 @@ class DocumentConverter(BaseConverter):
     Supports conversions between various document formats like pdf, docx, txt, etc.
     """
     
-    def __init__(self):
-        super().__init__()
-        
-        # Define supported formats
-        self._input_formats = ["pdf", "docx", "doc", "txt", "rtf", "odt", "html", "md"]
-        self._output_formats = ["pdf", "docx", "txt", "html", "md"]
+    warm_modules = ("PyPDF2", "pdf2docx", "docx", "bs4", "reportlab.platypus")
+    
+    edge_cost = 2.0
+    
+    input_formats = ("pdf", "docx", "doc", "txt", "rtf", "odt", "html", "md")
+    output_formats = ("pdf", "docx", "txt", "html", "md")
+    
+    # Methods of the conversions performed directly on files; Markdown reaches PDF
+    # and DOCX through HTML
+    _conversions = {
+        ("pdf", "docx"): "_pdf_to_docx",
+        ("pdf", "txt"): "_pdf_to_txt",
+        ("pdf", "html"): "_pdf_to_html",
+        ("docx", "pdf"): "_docx_to_pdf",
+        ("docx", "txt"): "_docx_to_txt",
+        ("docx", "html"): "_docx_to_html",
+    }
+    
+    # Methods of the conversions of text-based inputs, performed on streams
+    _stream_conversions = {
+        ("txt", "pdf"): "_txt_to_pdf",
+        ("txt", "docx"): "_txt_to_docx",
+        ("txt", "html"): "_txt_to_html",
+        ("html", "pdf"): "_html_to_pdf",
+        ("html", "docx"): "_html_to_docx",
+        ("html", "txt"): "_html_to_txt",
+        ("md", "html"): "_md_to_html",
+    }
+    
+    # Conversions that mostly wait on an external program; the others keep a core busy
+    _io_bound_conversions = frozenset({("docx", "pdf"), ("html", "pdf")})
     
     async def convert(
         self, 
@@ -44,64 +68,84 @@ class DocumentConverter(BaseConverter):
         
         output_path = self._generate_output_path(file_path, target_format, output_filename)
         
+        if self.supports_stream(input_format, target_format):
+            return await self._convert_file_with_stream(file_path, output_path, input_format, target_format)
+        
         # Perform the conversion based on input and output formats
-        if input_format == "pdf" and target_format == "docx":
-            await self._pdf_to_docx(file_path, output_path)
-        elif input_format == "pdf" and target_format == "txt":
-            await self._pdf_to_txt(file_path, output_path)
-        elif input_format == "pdf" and target_format == "html":
-            await self._pdf_to_html(file_path, output_path)
-        elif input_format == "docx" and target_format == "pdf":
-            await self._docx_to_pdf(file_path, output_path)
-        elif input_format == "docx" and target_format == "txt":
-            await self._docx_to_txt(file_path, output_path)
-        elif input_format == "docx" and target_format == "html":
-            await self._docx_to_html(file_path, output_path)
-        elif input_format == "txt" and target_format == "pdf":
-            await self._txt_to_pdf(file_path, output_path)
-        elif input_format == "txt" and target_format == "docx":
-            await self._txt_to_docx(file_path, output_path)
-        elif input_format == "txt" and target_format == "html":
-            await self._txt_to_html(file_path, output_path)
-        elif input_format == "html" and target_format == "pdf":
-            await self._html_to_pdf(file_path, output_path)
-        elif input_format == "html" and target_format == "docx":
-            await self._html_to_docx(file_path, output_path)
-        elif input_format == "html" and target_format == "txt":
-            await self._html_to_txt(file_path, output_path)
-        elif input_format == "md" and target_format == "pdf":
-            await self._md_to_pdf(file_path, output_path)
-        elif input_format == "md" and target_format == "docx":
-            await self._md_to_docx(file_path, output_path)
-        elif input_format == "md" and target_format == "html":
-            await self._md_to_html(file_path, output_path)
-        else:
+        method_name = self._conversions.get((input_format, target_format))
+        if method_name is None:
             raise ValueError(f"Conversion from {input_format} to {target_format} is not supported")
+        await self._run_conversion(input_format, target_format, getattr(self, method_name), file_path, output_path)
         
         return output_path
     
-    def get_supported_input_formats(self) -> List[str]:
-        """Get a list of supported input formats"""
-        return self._input_formats
+    def supports_stream(self, input_format: str, target_format: str) -> bool:
+        """Conversions of text-based inputs work on streams"""
+        return (input_format, target_format) in self._stream_conversions
     
-    def get_supported_output_formats(self) -> List[str]:
-        """Get a list of supported output formats"""
-        return self._output_formats
+    async def convert_stream(
+        self,
+        src: BinaryIO,
+        dst: BinaryIO,
+        input_format: str,
+        target_format: str
+    ) -> None:
+        """
+        Convert a text-based document from one stream into another.
+        
+        Args:
+            src: Readable stream positioned at the start of the input
+            dst: Writable stream receiving the output
+            input_format: Format of the input
+            target_format: Format to convert to
+            
+        Raises:
+            NotImplementedError: If the conversion only works on files
+            Exception: If the conversion fails
+        """
+        method_name = self._stream_conversions.get((input_format, target_format))
+        if method_name is None:
+            await super().convert_stream(src, dst, input_format, target_format)
+        await self._run_conversion(input_format, target_format, getattr(self, method_name), src, dst)
     
-    # Conversion methods
+    @classmethod
+    def get_conversion_edges(cls) -> List[Tuple[str, str]]:
+        """Get the pairs of formats converted directly"""
+        return [*cls._conversions, *cls._stream_conversions]
     
-    async def _pdf_to_docx(self, input_path: str, output_path: str) -> None:
+    async def _run_conversion(
+        self,
+        input_format: str,
+        target_format: str,
+        conversion: Callable[[Any, Any], None],
+        source: Any,
+        target: Any
+    ) -> None:
+        """Run one of the blocking conversion methods in the shared thread pools"""
+        if (input_format, target_format) in self._io_bound_conversions:
+            await self._run_io(conversion, source, target)
+        else:
+            await self._run_cpu(conversion, source, target)
+    
+    # Conversion methods; they block, and run in the shared thread pools
+    
+    def _pdf_to_docx(self, input_path: str, output_path: str) -> None:
         """Convert PDF to DOCX"""
         try:
             from pdf2docx import Converter
             
             cv = Converter(input_path)
+            
+            # pdf2docx writes the whole document in one call, so only its start and end are reported
+            page_count = len(cv.fitz_doc)
+            self.report_progress("converting pages", 0, page_count, "pages")
             cv.convert(output_path)
+            self.report_progress("converting pages", page_count, page_count, "pages")
             cv.close()
         except ImportError:
             raise Exception("pdf2docx library is required for PDF to DOCX conversion")
     
-    async def _pdf_to_txt(self, input_path: str, output_path: str) -> None:
+    def _pdf_to_txt(self, input_path: str, output_path: str) -> None:
         """Convert PDF to TXT"""
         try:
             import PyPDF2
@@ -110,15 +154,17 @@ class DocumentConverter(BaseConverter):
                 reader = PyPDF2.PdfReader(file)
                 text = ""
                 
-                for page_num in range(len(reader.pages)):
+                page_count = len(reader.pages)
+                for page_num in range(page_count):
                     text += reader.pages[page_num].extract_text()
+                    self.report_progress("extracting text", page_num + 1, page_count, "pages")
             
             with open(output_path, 'w', encoding='utf-8') as file:
                 file.write(text)
         except ImportError:
             raise Exception("PyPDF2 library is required for PDF to TXT conversion")
     
-    async def _pdf_to_html(self, input_path: str, output_path: str) -> None:
+    def _pdf_to_html(self, input_path: str, output_path: str) -> None:
         """Convert PDF to HTML"""
         try:
             # This is a placeholder. For a production app, you might want to use a more robust solution
@@ -129,8 +175,10 @@ class DocumentConverter(BaseConverter):
                 reader = PyPDF2.PdfReader(file)
                 text = ""
                 
-                for page_num in range(len(reader.pages)):
+                page_count = len(reader.pages)
+                for page_num in range(page_count):
                     text += reader.pages[page_num].extract_text()
+                    self.report_progress("extracting text", page_num + 1, page_count, "pages")
             
             # Convert text to HTML
             html_content = f"""<!DOCTYPE html>
@@ -148,7 +196,7 @@ class DocumentConverter(BaseConverter):
         except ImportError:
             raise Exception("PyPDF2 library is required for PDF to HTML conversion")
     
-    async def _docx_to_pdf(self, input_path: str, output_path: str) -> None:
+    def _docx_to_pdf(self, input_path: str, output_path: str) -> None:
         """Convert DOCX to PDF"""
         try:
             from docx2pdf import convert
@@ -156,7 +204,7 @@ class DocumentConverter(BaseConverter):
         except ImportError:
             raise Exception("docx2pdf library is required for DOCX to PDF conversion")
     
-    async def _docx_to_txt(self, input_path: str, output_path: str) -> None:
+    def _docx_to_txt(self, input_path: str, output_path: str) -> None:
         """Convert DOCX to TXT"""
         try:
             import docx
@@ -169,7 +217,7 @@ class DocumentConverter(BaseConverter):
         except ImportError:
             raise Exception("python-docx library is required for DOCX to TXT conversion")
     
-    async def _docx_to_html(self, input_path: str, output_path: str) -> None:
+    def _docx_to_html(self, input_path: str, output_path: str) -> None:
         """Convert DOCX to HTML"""
         try:
             import docx
@@ -189,7 +237,7 @@ class DocumentConverter(BaseConverter):
         except ImportError:
             raise Exception("python-docx library is required for DOCX to HTML conversion")
     
-    async def _txt_to_pdf(self, input_path: str, output_path: str) -> None:
+    def _txt_to_pdf(self, src: BinaryIO, dst: BinaryIO) -> None:
         """Convert TXT to PDF"""
         try:
             from reportlab.pdfgen import canvas
@@ -200,12 +248,11 @@ class DocumentConverter(BaseConverter):
             import html
             
             # Read the text file
-            with open(input_path, 'r', encoding='utf-8', errors='replace') as file:
-                text = file.read()
+            text = src.read().decode('utf-8', errors='replace')
             
             # Create a PDF document
             doc = SimpleDocTemplate(
-                output_path,
+                dst,
                 pagesize=letter,
                 rightMargin=72,
                 leftMargin=72,
@@ -239,13 +286,12 @@ class DocumentConverter(BaseConverter):
         except Exception as e:
             raise Exception(f"Error in TXT to PDF conversion: {str(e)}")
     
-    async def _txt_to_docx(self, input_path: str, output_path: str) -> None:
+    def _txt_to_docx(self, src: BinaryIO, dst: BinaryIO) -> None:
         """Convert TXT to DOCX"""
         try:
             import docx
             
-            with open(input_path, 'r', encoding='utf-8') as file:
-                text = file.read()
+            text = src.read().decode('utf-8')
             
             doc = docx.Document()
             
@@ -257,32 +303,33 @@ class DocumentConverter(BaseConverter):
                 if paragraph.strip():
                     doc.add_paragraph(paragraph)
             
-            doc.save(output_path)
+            doc.save(dst)
         except ImportError:
             raise Exception("python-docx library is required for TXT to DOCX conversion")
     
-    async def _txt_to_html(self, input_path: str, output_path: str) -> None:
+    def _txt_to_html(self, src: BinaryIO, dst: BinaryIO) -> None:
         """Convert TXT to HTML"""
         try:
             from bs4 import BeautifulSoup
             
-            with open(input_path, 'r', encoding='utf-8') as file:
-                text = file.read()
+            text = src.read().decode('utf-8')
             
             soup = BeautifulSoup(text, 'html.parser')
             html_content = soup.get_text()
             
-            with open(output_path, 'w', encoding='utf-8') as file:
-                file.write(html_content)
+            dst.write(html_content.encode('utf-8'))
         except ImportError:
             raise Exception("BeautifulSoup library is required for TXT to HTML conversion")
     
-    async def _html_to_pdf(self, input_path: str, output_path: str) -> None:
+    def _html_to_pdf(self, src: BinaryIO, dst: BinaryIO) -> None:
         """Convert HTML to PDF"""
         try:
             import pdfkit
             
-            pdfkit.from_file(input_path, output_path)
+            html_content = src.read().decode('utf-8')
+            
+            # Passing False as the output path makes pdfkit return the PDF
+            dst.write(pdfkit.from_string(html_content, False))
         except ImportError:
             # Fallback to a simpler approach if pdfkit is not available
             try:
@@ -290,13 +337,12 @@ class DocumentConverter(BaseConverter):
                 from reportlab.pdfgen import canvas
                 from reportlab.lib.pagesizes import letter
                 
-                with open(input_path, 'r', encoding='utf-8') as file:
-                    html_content = file.read()
+                html_content = src.read().decode('utf-8')
                 
                 soup = BeautifulSoup(html_content, 'html.parser')
                 text = soup.get_text()
                 
-                c = canvas.Canvas(output_path, pagesize=letter)
+                c = canvas.Canvas(dst, pagesize=letter)
                 width, height = letter
                 
                 # Split text into lines
@@ -325,14 +371,13 @@ class DocumentConverter(BaseConverter):
             except ImportError:
                 raise Exception("BeautifulSoup and reportlab libraries are required for HTML to PDF conversion")
     
-    async def _html_to_docx(self, input_path: str, output_path: str) -> None:
+    def _html_to_docx(self, src: BinaryIO, dst: BinaryIO) -> None:
         """Convert HTML to DOCX"""
         try:
             from bs4 import BeautifulSoup
             import docx
             
-            with open(input_path, 'r', encoding='utf-8') as file:
-                html_content = file.read()
+            html_content = src.read().decode('utf-8')
             
             soup = BeautifulSoup(html_content, 'html.parser')
             text = soup.get_text()
@@ -347,57 +392,30 @@ class DocumentConverter(BaseConverter):
                 if paragraph.strip():
                     doc.add_paragraph(paragraph)
             
-            doc.save(output_path)
+            doc.save(dst)
         except ImportError:
             raise Exception("BeautifulSoup and python-docx libraries are required for HTML to DOCX conversion")
     
-    async def _html_to_txt(self, input_path: str, output_path: str) -> None:
+    def _html_to_txt(self, src: BinaryIO, dst: BinaryIO) -> None:
         """Convert HTML to TXT"""
         try:
             from bs4 import BeautifulSoup
             
-            with open(input_path, 'r', encoding='utf-8') as file:
-                html_content = file.read()
+            html_content = src.read().decode('utf-8')
             
             soup = BeautifulSoup(html_content, 'html.parser')
             text = soup.get_text()
             
-            with open(output_path, 'w', encoding='utf-8') as file:
-                file.write(text)
+            dst.write(text.encode('utf-8'))
         except ImportError:
             raise Exception("BeautifulSoup library is required for HTML to TXT conversion")
     
-    async def _md_to_pdf(self, input_path: str, output_path: str) -> None:
-        """Convert Markdown to PDF"""
-        # First convert MD to HTML, then HTML to PDF
-        html_path = output_path.replace('.pdf', '.html')
-        
-        await self._md_to_html(input_path, html_path)
-        await self._html_to_pdf(html_path, output_path)
-        
-        # Clean up temporary HTML file
-        if os.path.exists(html_path):
-            os.remove(html_path)
-    
-    async def _md_to_docx(self, input_path: str, output_path: str) -> None:
-        """Convert Markdown to DOCX"""
-        # First convert MD to HTML, then HTML to DOCX
-        html_path = output_path.replace('.docx', '.html')
-        
-        await self._md_to_html(input_path, html_path)
-        await self._html_to_docx(html_path, output_path)
-        
-        # Clean up temporary HTML file
-        if os.path.exists(html_path):
-            os.remove(html_path)
-    
-    async def _md_to_html(self, input_path: str, output_path: str) -> None:
+    def _md_to_html(self, src: BinaryIO, dst: BinaryIO) -> None:
         """Convert Markdown to HTML"""
         try:
             import markdown
             
-            with open(input_path, 'r', encoding='utf-8') as file:
-                md_content = file.read()
+            md_content = src.read().decode('utf-8')
             
             html_content = markdown.markdown(md_content)
             
@@ -412,7 +430,6 @@ class DocumentConverter(BaseConverter):
 </body>
 </html>"""
             
-            with open(output_path, 'w', encoding='utf-8') as file:
-                file.write(html_document)
+            dst.write(html_document.encode('utf-8'))
         except ImportError:
             raise Exception("markdown library is required for Markdown to HTML conversion") 
\ No newline at end of file
@@ -1,11 +1,22 @@
 import os
-import asyncio
-from typing import List, Optional
+import importlib.util
+from typing import BinaryIO, Optional
 import aiofiles
 import io
-from concurrent.futures import ThreadPoolExecutor
 
 from app.utils.base_converter import BaseConverter
+from app.utils.executors import ExecutorService
+
+# Pillow format names of the raster output formats
+PILLOW_FORMATS = {
+    "jpg": "JPEG",
+    "png": "PNG",
+    "gif": "GIF",
+    "bmp": "BMP",
+    "tiff": "TIFF",
+    "webp": "WEBP",
+    "ico": "ICO",
+}
 
 class ImageConverter(BaseConverter):
     """
@@ -13,12 +24,18 @@ class ImageConverter(BaseConverter):
     Supports conversions between various image formats like jpg, png, webp, etc.
     """
     
-    def __init__(self):
-        super().__init__()
+    warm_modules = ("PIL.Image", "reportlab.pdfgen.canvas")
+    
+    edge_cost = 0.5
+    
+    input_formats = ("jpg", "jpeg", "png", "gif", "bmp", "tiff", "webp", "svg", "ico", "heic")
+    output_formats = ("jpg", "jpeg", "png", "gif", "bmp", "tiff", "webp", "ico", "pdf")
+    
+    def __init__(self, executors: Optional[ExecutorService] = None):
+        super().__init__(executors)
         
-        # Define supported formats
-        self._input_formats = ["jpg", "jpeg", "png", "gif", "bmp", "tiff", "webp", "svg", "ico", "heic"]
-        self._output_formats = ["jpg", "jpeg", "png", "gif", "bmp", "tiff", "webp", "ico", "pdf"]
+        # Without CairoSVG, SVG files are converted by Inkscape, which needs files
+        self._cairosvg_available = importlib.util.find_spec("cairosvg") is not None
     
     async def convert(
         self, 
@@ -53,74 +70,98 @@ class ImageConverter(BaseConverter):
         
         output_path = self._generate_output_path(file_path, target_format, output_filename)
         
+        # Conversions that work on streams run on the two files
+        if self.supports_stream(input_format, target_format):
+            return await self._convert_file_with_stream(file_path, output_path, input_format, target_format)
+        
         # Special case for SVG to other formats
         if input_format == "svg":
-            return await self._convert_svg(file_path, output_path, target_format)
+            return await self._convert_svg_with_inkscape(file_path, output_path)
         
         # Special case for PDF output
-        if target_format == "pdf":
-            return await self._convert_to_pdf(file_path, output_path)
+        await self._convert_to_pdf(file_path, output_path)
+        return output_path
+    
+    def supports_stream(self, input_format: str, target_format: str) -> bool:
+        """Raster outputs are produced on streams, as are all SVG conversions when CairoSVG is installed"""
+        if input_format == "svg":
+            return self._cairosvg_available
+        return self._normalize_format(target_format) in PILLOW_FORMATS
+    
+    async def convert_stream(
+        self,
+        src: BinaryIO,
+        dst: BinaryIO,
+        input_format: str,
+        target_format: str
+    ) -> None:
+        """
+        Convert an image from one stream into another.
+        
+        Args:
+            src: Readable stream positioned at the start of the input
+            dst: Writable stream receiving the output
+            input_format: Format of the input
+            target_format: Format to convert to
+            
+        Raises:
+            NotImplementedError: If the conversion only works on files
+            Exception: If the conversion fails
+        """
+        input_format = self._normalize_format(input_format)
+        target_format = self._normalize_format(target_format)
+        if not self.supports_stream(input_format, target_format):
+            await super().convert_stream(src, dst, input_format, target_format)
+        
+        if input_format == "svg":
+            await self._run_cpu(self._convert_svg, src, dst, target_format)
+            return
         
-        # Use Pillow for most image conversions
+        # Use Pillow for most image conversions, in the shared cpu pool to avoid blocking
         try:
-            # Run the image conversion in a thread pool to avoid blocking
-            with ThreadPoolExecutor() as executor:
-                result = await asyncio.get_event_loop().run_in_executor(
-                    executor, self._convert_with_pillow, file_path, output_path, target_format
-                )
-            return result
+            await self._run_cpu(self._convert_with_pillow, src, dst, target_format)
         except Exception as e:
             raise Exception(f"Image conversion failed: {str(e)}")
     
-    def get_supported_input_formats(self) -> List[str]:
-        """Get a list of supported input formats"""
-        return self._input_formats
+    # Helper methods
     
-    def get_supported_output_formats(self) -> List[str]:
-        """Get a list of supported output formats"""
-        return self._output_formats
+    @staticmethod
+    def _normalize_format(image_format: str) -> str:
+        """Treat jpeg as jpg"""
+        return "jpg" if image_format == "jpeg" else image_format
     
-    # Helper methods
+    def _convert_svg(self, src: BinaryIO, dst: BinaryIO, target_format: str) -> None:
+        """Convert SVG to a raster format or PDF with CairoSVG (run in an executor thread)"""
+        import cairosvg
+        
+        if target_format == "png":
+            cairosvg.svg2png(file_obj=src, write_to=dst)
+        elif target_format == "pdf":
+            cairosvg.svg2pdf(file_obj=src, write_to=dst)
+        else:
+            # For other formats, rasterize to PNG in memory, then use Pillow
+            png = io.BytesIO()
+            cairosvg.svg2png(file_obj=src, write_to=png)
+            png.seek(0)
+            self._convert_with_pillow(png, dst, target_format)
     
-    async def _convert_svg(self, input_path: str, output_path: str, target_format: str) -> str:
-        """Convert SVG to a raster format"""
+    async def _convert_svg_with_inkscape(self, input_path: str, output_path: str) -> str:
+        """Convert SVG with Inkscape, when CairoSVG is not installed"""
         try:
-            import cairosvg
+            import subprocess
             
-            if target_format == "png":
-                cairosvg.svg2png(url=input_path, write_to=output_path)
-            elif target_format == "pdf":
-                cairosvg.svg2pdf(url=input_path, write_to=output_path)
-            else:
-                # For other formats, convert to PNG first, then use Pillow
-                temp_png = output_path.replace(f".{target_format}", ".png")
-                cairosvg.svg2png(url=input_path, write_to=temp_png)
-                
-                from PIL import Image
-                with Image.open(temp_png) as img:
-                    img.save(output_path)
-                
-                # Clean up temporary file
-                if os.path.exists(temp_png):
-                    os.remove(temp_png)
-        
-        except ImportError:
-            # Fallback using Inkscape if available
-            try:
-                import subprocess
-                
-                # Check if Inkscape is installed
-                subprocess.run(["inkscape", "--version"], check=True, capture_output=True)
-                
-                # Use Inkscape for conversion
-                subprocess.run([
-                    "inkscape",
-                    "--export-filename", output_path,
-                    input_path
-                ], check=True)
+            # Check if Inkscape is installed
+            await self._run_process(["inkscape", "--version"])
             
-            except (ImportError, subprocess.SubprocessError):
-                raise Exception("CairoSVG or Inkscape is required for SVG conversion")
+            # Use Inkscape for conversion
+            await self._run_process([
+                "inkscape",
+                "--export-filename", output_path,
+                input_path
+            ])
+        
+        except (ImportError, subprocess.SubprocessError, FileNotFoundError):
+            raise Exception("CairoSVG or Inkscape is required for SVG conversion")
         
         return output_path
     
@@ -158,15 +199,14 @@ class ImageConverter(BaseConverter):
                 # If all else fails, try using ffmpeg
                 try:
                     import subprocess
-                    import os
                     
                     # Run ffmpeg command to convert HEIC to target format
-                    subprocess.run([
+                    await self._run_process([
                         "ffmpeg",
                         "-i", input_path,
                         "-y",  # Overwrite output file if it exists
                         output_path
-                    ], check=True)
+                    ])
                     
                     if not os.path.exists(output_path):
                         raise Exception("FFmpeg conversion failed")
@@ -207,12 +247,12 @@ class ImageConverter(BaseConverter):
         except ImportError:
             raise Exception("Pillow and reportlab libraries are required for image to PDF conversion")
     
-    def _convert_with_pillow(self, file_path: str, output_path: str, target_format: str) -> str:
-        """Convert image using Pillow (efficient non-blocking implementation)"""
+    def _convert_with_pillow(self, src: BinaryIO, dst: BinaryIO, target_format: str) -> None:
+        """Convert image using Pillow (run in an executor thread)"""
         from PIL import Image
         
         # Open the image
-        with Image.open(file_path) as img:
+        with Image.open(src) as img:
             # Convert RGBA to RGB if target format is JPG (JPG doesn't support alpha channel)
             if target_format == "jpg" and img.mode == "RGBA":
                 img = img.convert("RGB")
@@ -226,7 +266,5 @@ class ImageConverter(BaseConverter):
             elif target_format == "webp":
                 save_args = {"quality": 85, "method": 6}  # Higher method = better compression but slower
             
-            # Save the image
-            img.save(output_path, **save_args)
-            
-        return output_path 
\ No newline at end of file
+            # Save the image; streams have no extension to infer the format from
+            img.save(dst, format=PILLOW_FORMATS[target_format], **save_args) 
\ No newline at end of file
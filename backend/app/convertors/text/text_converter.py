@@ -1,9 +1,6 @@
 import os
 import asyncio
-from typing import List, Optional
-import aiofiles
-import hashlib
-from functools import lru_cache
+from typing import BinaryIO, List, Optional, Tuple
 
 from app.utils.base_converter import BaseConverter
 
@@ -13,12 +10,33 @@ class TextConverter(BaseConverter):
     Supports conversions between various text formats like txt, md, html, etc.
     """
     
-    def __init__(self):
-        super().__init__()
-        
-        # Define supported formats
-        self._input_formats = ["txt", "md", "html", "xml", "json", "csv", "yaml", "yml"]
-        self._output_formats = ["txt", "md", "html", "xml", "json", "csv", "yaml", "yml", "pdf"]
+    # Conversions between text formats are performed instead of copying the content
+    version = "2"
+    
+    warm_modules = ("mistune", "bs4", "html2text", "yaml", "reportlab.platypus")
+    
+    edge_cost = 0.1
+    
+    input_formats = ("txt", "md", "html", "xml", "json", "csv", "yaml", "yml")
+    output_formats = ("txt", "md", "html", "xml", "json", "csv", "yaml", "yml", "pdf")
+    
+    # Methods of the conversions performed directly on the content; any input can
+    # also be rendered to PDF
+    _conversions = {
+        ("txt", "html"): "_txt_to_html",
+        ("md", "html"): "_md_to_html",
+        ("md", "txt"): "_md_to_txt",
+        ("html", "txt"): "_html_to_txt",
+        ("html", "md"): "_html_to_md",
+        ("csv", "json"): "_csv_to_json",
+        ("json", "csv"): "_json_to_csv",
+        ("json", "yaml"): "_json_to_yaml",
+        ("json", "yml"): "_json_to_yaml",
+        ("yaml", "json"): "_yaml_to_json",
+        ("yml", "json"): "_yaml_to_json",
+        ("xml", "json"): "_xml_to_json",
+        ("json", "xml"): "_json_to_xml",
+    }
     
     async def convert(
         self, 
@@ -46,35 +64,51 @@ class TextConverter(BaseConverter):
         
         output_path = self._generate_output_path(file_path, target_format, output_filename)
         
-        # Read the input file asynchronously
-        async with aiofiles.open(file_path, "r", encoding="utf-8") as f:
-            content = await f.read()
+        return await self._convert_file_with_stream(file_path, output_path, input_format, target_format)
+    
+    def supports_stream(self, input_format: str, target_format: str) -> bool:
+        """Every text conversion works on the content in memory"""
+        return target_format == "pdf" or (input_format, target_format) in self._conversions
+    
+    async def convert_stream(
+        self,
+        src: BinaryIO,
+        dst: BinaryIO,
+        input_format: str,
+        target_format: str
+    ) -> None:
+        """
+        Convert UTF-8 text from one stream into another.
         
-        # Check cache before conversion
-        cache_key = self._generate_cache_key(content, target_format)
-        cached_result = self._get_cached_result(cache_key)
-        if cached_result:
-            return cached_result
+        Args:
+            src: Readable stream positioned at the start of the input
+            dst: Writable stream receiving the output
+            input_format: Format of the input
+            target_format: Format to convert to
+            
+        Raises:
+            ValueError: If the conversion is not supported
+            Exception: If the conversion fails
+        """
+        # Parsing and rendering keep a core busy, so they stay off the event loop
+        await self._run_cpu(self._convert_content, src, dst, input_format, target_format)
+    
+    def _convert_content(self, src: BinaryIO, dst: BinaryIO, input_format: str, target_format: str) -> None:
+        """Read, convert and write the content of a stream conversion"""
+        content = src.read().decode("utf-8")
+        
+        if target_format == "pdf":
+            self._convert_to_pdf(content, dst)
+            return
         
         # Perform the conversion based on input and output formats
         converted_content = self._perform_conversion(content, input_format, target_format)
-        
-        # Write the output file asynchronously
-        async with aiofiles.open(output_path, "w", encoding="utf-8") as f:
-            await f.write(converted_content)
-        
-        # Cache the result
-        self._cache_result(cache_key, output_path)
-        
-        return output_path
+        dst.write(converted_content.encode("utf-8"))
     
-    def get_supported_input_formats(self) -> List[str]:
-        """Get a list of supported input formats"""
-        return self._input_formats
-    
-    def get_supported_output_formats(self) -> List[str]:
-        """Get a list of supported output formats"""
-        return self._output_formats
+    @classmethod
+    def get_conversion_edges(cls) -> List[Tuple[str, str]]:
+        """Get the pairs of formats converted directly"""
+        return list(cls._conversions) + [(input_format, "pdf") for input_format in cls.input_formats]
     
     # Conversion methods
     
@@ -230,7 +264,7 @@ class TextConverter(BaseConverter):
         dom = parseString(xml_data)
         return dom.toprettyxml()
     
-    async def _convert_to_pdf(self, content: str, output_path: str) -> str:
+    def _convert_to_pdf(self, content: str, dst: BinaryIO) -> None:
         """Convert text content to PDF"""
         try:
             from reportlab.pdfgen import canvas
@@ -242,7 +276,7 @@ class TextConverter(BaseConverter):
             
             # Create a PDF document
             doc = SimpleDocTemplate(
-                output_path,
+                dst,
                 pagesize=letter,
                 rightMargin=72,
                 leftMargin=72,
@@ -272,25 +306,12 @@ class TextConverter(BaseConverter):
             
             # Build the PDF
             doc.build(content_elements)
-            
-            return output_path
         except Exception as e:
             raise Exception(f"Error in text to PDF conversion: {str(e)}")
 
-    def _generate_cache_key(self, content: str, target_format: str) -> str:
-        # Generate a unique cache key based on content and target format
-        return hashlib.md5((content + target_format).encode()).hexdigest()
-
-    @lru_cache(maxsize=128)
-    def _get_cached_result(self, cache_key: str) -> Optional[str]:
-        # Retrieve cached result if available
-        return None  # Placeholder for actual cache retrieval logic
-
-    def _cache_result(self, cache_key: str, output_path: str):
-        # Cache the conversion result
-        pass  # Placeholder for actual cache storage logic
-
     def _perform_conversion(self, content: str, input_format: str, target_format: str) -> str:
-        # Perform the conversion based on input and output formats
-        # This is a placeholder for the actual conversion logic
-        return content  # Replace with actual conversion logic 
\ No newline at end of file
+        """Convert text content between two formats"""
+        method_name = self._conversions.get((input_format, target_format))
+        if method_name is None:
+            raise ValueError(f"Conversion from {input_format} to {target_format} is not supported")
+        return getattr(self, method_name)(content) 
\ No newline at end of file
@@ -1,11 +1,22 @@
 import os
-import asyncio
 import subprocess
 from typing import List, Optional
 import aiofiles
-from concurrent.futures import ThreadPoolExecutor
 
 from app.utils.base_converter import BaseConverter
+from app.utils.ffmpeg import has_audio_stream, probe_duration, probe_keyframes, run_ffmpeg
+
+# ffmpeg encoder options per target format, for the video and audio streams
+VIDEO_CODEC_ARGS = {
+    "mp4": ["-c:v", "libx264", "-preset", "medium", "-crf", "23"],
+    "webm": ["-c:v", "libvpx", "-crf", "10", "-b:v", "1M"],
+    "avi": ["-c:v", "mpeg4", "-q:v", "6"],
+}
+AUDIO_CODEC_ARGS = {
+    "mp4": ["-c:a", "aac", "-b:a", "128k"],
+    "webm": ["-c:a", "libvorbis"],
+    "avi": ["-c:a", "libmp3lame", "-q:a", "4"],
+}
 
 class VideoConverter(BaseConverter):
     """
@@ -13,12 +24,18 @@ class VideoConverter(BaseConverter):
     Supports conversions between various video formats like mp4, avi, mkv, etc.
     """
     
-    def __init__(self):
-        super().__init__()
-        
-        # Define supported formats
-        self._input_formats = ["mp4", "avi", "mkv", "mov", "wmv", "flv", "webm", "m4v", "3gp"]
-        self._output_formats = ["mp4", "avi", "mkv", "mov", "webm", "gif"]
+    # The moviepy path now actually runs (it was an un-awaited coroutine before)
+    version = "2"
+    
+    warm_modules = ("proglog", "moviepy.editor")
+    
+    edge_cost = 20.0
+    
+    input_formats = ("mp4", "avi", "mkv", "mov", "wmv", "flv", "webm", "m4v", "3gp")
+    output_formats = ("mp4", "avi", "mkv", "mov", "webm", "gif", "wav")
+    
+    # Audio-only outputs; the audio converter takes them on to other audio formats
+    audio_output_formats = ("wav",)
     
     async def convert(
         self, 
@@ -46,16 +63,17 @@ class VideoConverter(BaseConverter):
         
         output_path = self._generate_output_path(file_path, target_format, output_filename)
         
+        if target_format in self.audio_output_formats:
+            await self._extract_audio(file_path, output_path)
+            return output_path
+        
         # Try to use moviepy for conversion
         try:
+            # Run the video conversion in the shared cpu pool to avoid blocking
             if target_format == "gif":
-                await self._convert_to_gif(file_path, output_path)
+                await self._run_cpu(self._convert_to_gif, file_path, output_path)
             else:
-                # Run the video conversion in a thread pool to avoid blocking
-                with ThreadPoolExecutor() as executor:
-                    await asyncio.get_event_loop().run_in_executor(
-                        executor, self._convert_with_moviepy, file_path, output_path, target_format
-                    )
+                await self._run_cpu(self._convert_with_moviepy, file_path, output_path, target_format)
         except Exception as e:
             # Fallback to ffmpeg if moviepy fails
             try:
@@ -65,18 +83,24 @@ class VideoConverter(BaseConverter):
         
         return output_path
     
-    def get_supported_input_formats(self) -> List[str]:
-        """Get a list of supported input formats"""
-        return self._input_formats
-    
-    def get_supported_output_formats(self) -> List[str]:
-        """Get a list of supported output formats"""
-        return self._output_formats
-    
     # Helper methods
     
-    async def _convert_with_moviepy(self, file_path: str, output_path: str, target_format: str) -> None:
-        """Convert video using moviepy (efficient non-blocking implementation)"""
+    def _moviepy_logger(self):
+        """Create a proglog logger that forwards moviepy's progress bars as progress reports"""
+        import proglog
+        
+        converter = self
+        stages = {"t": "encoding video", "chunk": "encoding audio"}
+        
+        class ProgressLogger(proglog.ProgressBarLogger):
+            def bars_callback(self, bar, attr, value, old_value=None):
+                if attr == "index" and bar in stages:
+                    converter.report_progress(stages[bar], value, self.bars[bar].get("total"), "frames")
+        
+        return ProgressLogger()
+    
+    def _convert_with_moviepy(self, file_path: str, output_path: str, target_format: str) -> None:
+        """Convert video using moviepy (run in an executor thread)"""
         from moviepy.editor import VideoFileClip
         
         # Optimize conversion parameters based on format
@@ -93,11 +117,12 @@ class VideoConverter(BaseConverter):
                 codec=codec,
                 threads=4,  # Use multiple threads for encoding
                 preset='medium',  # Balance between speed and quality
-                audio_codec='aac' if target_format == 'mp4' else 'libvorbis'
+                audio_codec='aac' if target_format == 'mp4' else 'libvorbis',
+                logger=self._moviepy_logger()
             )
             
-    async def _convert_to_gif(self, input_path: str, output_path: str) -> None:
-        """Convert video to GIF using moviepy"""
+    def _convert_to_gif(self, input_path: str, output_path: str) -> None:
+        """Convert video to GIF using moviepy (run in an executor thread)"""
         try:
             from moviepy.editor import VideoFileClip
             
@@ -108,7 +133,7 @@ class VideoConverter(BaseConverter):
             # video = video.resize(width=480)
             
             # Convert to GIF
-            video.write_gif(output_path, fps=10)
+            video.write_gif(output_path, fps=10, logger=self._moviepy_logger())
             
             # Close the video file
             video.close()
@@ -119,26 +144,164 @@ class VideoConverter(BaseConverter):
     async def _convert_with_ffmpeg(self, file_path: str, output_path: str, target_format: str) -> None:
         """Convert video using ffmpeg directly (optimized version)"""
         # Optimize ffmpeg parameters based on format
-        extra_args = []
-        if target_format == "mp4":
-            extra_args = ["-c:v", "libx264", "-preset", "medium", "-crf", "23", "-c:a", "aac", "-b:a", "128k"]
-        elif target_format == "webm":
-            extra_args = ["-c:v", "libvpx", "-crf", "10", "-b:v", "1M", "-c:a", "libvorbis"]
-        elif target_format == "avi":
-            extra_args = ["-c:v", "mpeg4", "-q:v", "6", "-c:a", "libmp3lame", "-q:a", "4"]
+        extra_args = [*VIDEO_CODEC_ARGS.get(target_format, []), *AUDIO_CODEC_ARGS.get(target_format, [])]
             
-        command = [
-            "ffmpeg",
+        args = [
             "-i", file_path,
             "-y",  # Overwrite output file if it exists
             *extra_args,
             output_path
         ]
         
-        process = await asyncio.create_subprocess_exec(
-            *command,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
+        # Progress is reported as seconds of output written out of the input's duration
+        duration = await probe_duration(file_path)
+        await run_ffmpeg(args, duration, stage="encoding video") 
+    
+    async def _extract_audio(self, file_path: str, output_path: str) -> None:
+        """Extract a video's audio stream as uncompressed PCM"""
+        if not await has_audio_stream(file_path):
+            raise ValueError("The video has no audio stream")
+        
+        duration = await probe_duration(file_path)
+        await run_ffmpeg(
+            ["-i", file_path, "-y", "-vn", "-c:a", "pcm_s16le", output_path],
+            duration,
+            stage="extracting audio"
+        )
+    
+    # Segment-parallel transcoding: the input's video stream is cut at keyframes
+    # without re-encoding, the segments are encoded independently (on different
+    # workers) and joined back with the concat demuxer, and the audio is encoded
+    # once and muxed in at the end.
+    
+    def supports_segments(self, target_format: str) -> bool:
+        """Check whether conversions to a format can be split into segments"""
+        return target_format in VIDEO_CODEC_ARGS
+    
+    async def split_segments(self, file_path: str, work_dir: str, segment_seconds: float) -> List[str]:
+        """
+        Cut a video's video stream into keyframe-aligned segments without re-encoding.
+        
+        Args:
+            file_path: Path to the video file
+            work_dir: Directory to write the segments to
+            segment_seconds: Target length of each segment
+            
+        Returns:
+            Paths of the segments in order
+        """
+        # Cut at the first keyframe after each multiple of the segment length
+        cut_times = []
+        next_cut = segment_seconds
+        for keyframe in await probe_keyframes(file_path):
+            if keyframe >= next_cut:
+                cut_times.append(keyframe)
+                next_cut = keyframe + segment_seconds
+        
+        if not cut_times:
+            return []
+        
+        os.makedirs(work_dir, exist_ok=True)
+        segment_pattern = os.path.join(work_dir, "segment_%05d.mkv")
+        await run_ffmpeg(
+            [
+                "-i", file_path,
+                "-map", "0:v:0",
+                "-c", "copy",
+                "-f", "segment",
+                "-segment_times", ",".join(f"{time:.6f}" for time in cut_times),
+                "-reset_timestamps", "1",
+                "-y",
+                segment_pattern
+            ],
+            await probe_duration(file_path),
+            stage="splitting"
         )
         
-        await process.communicate() 
\ No newline at end of file
+        return sorted(
+            os.path.join(work_dir, name)
+            for name in os.listdir(work_dir)
+            if name.startswith("segment_")
+        )
+    
+    async def transcode_segment(self, segment_path: str, output_path: str, target_format: str) -> str:
+        """
+        Encode one video segment with the target format's video codec.
+        
+        Args:
+            segment_path: Path to the segment
+            output_path: Path to write the encoded segment to (Matroska)
+            target_format: Format the whole video is converted to
+            
+        Returns:
+            Path to the encoded segment
+        """
+        await run_ffmpeg(
+            ["-i", segment_path, "-an", *VIDEO_CODEC_ARGS[target_format], "-y", output_path],
+            await probe_duration(segment_path),
+            stage="encoding video"
+        )
+        return output_path
+    
+    async def encode_audio(self, file_path: str, output_path: str, target_format: str) -> Optional[str]:
+        """
+        Encode a video's audio with the target format's audio codec.
+        
+        Args:
+            file_path: Path to the video file
+            output_path: Path to write the audio to (Matroska)
+            target_format: Format the video is converted to
+            
+        Returns:
+            Path to the encoded audio, or None if the video has no audio
+        """
+        if not await has_audio_stream(file_path):
+            return None
+        
+        await run_ffmpeg(
+            ["-i", file_path, "-vn", *AUDIO_CODEC_ARGS[target_format], "-y", output_path],
+            await probe_duration(file_path),
+            stage="encoding audio"
+        )
+        return output_path
+    
+    async def join_segments(
+        self,
+        segment_paths: List[str],
+        audio_path: Optional[str],
+        output_path: str,
+        target_format: str
+    ) -> str:
+        """
+        Join encoded segments losslessly with the concat demuxer and mux in the audio.
+        
+        Args:
+            segment_paths: Paths of the encoded segments in order
+            audio_path: Path to the encoded audio, if any
+            output_path: Path to write the joined video to
+            target_format: Format of the joined video
+            
+        Returns:
+            Path to the joined video
+        """
+        list_path = f"{output_path}.segments.txt"
+        with open(list_path, "w") as f:
+            for segment_path in segment_paths:
+                escaped = os.path.abspath(segment_path).replace("'", "'\\''")
+                f.write(f"file '{escaped}'\n")
+        
+        args = ["-f", "concat", "-safe", "0", "-i", list_path]
+        if audio_path:
+            args += ["-i", audio_path, "-map", "0:v:0", "-map", "1:a:0"]
+        args += ["-c", "copy"]
+        if target_format == "mp4":
+            # Put the index first so playback can start before the download ends
+            args += ["-movflags", "+faststart"]
+        args += ["-y", output_path]
+        
+        try:
+            await run_ffmpeg(args, stage="joining segments")
+        finally:
+            os.remove(list_path)
+        
+        return output_path
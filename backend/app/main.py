@@ -1,14 +1,20 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
 import os
 import uvicorn
 import multiprocessing
-import redis
 from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
-from app.routers import conversion_router, chat_router
+from app.routers import conversion_router, chat_router, upload_router
 from app.utils.file_manager import FileManager
+from app.utils.redis_client import get_redis, get_async_redis
+from app.utils.task_results import task_result_waiter
+from app.utils.dispatcher import init_fast_path_process
+from app.utils.admission import admission_controller
+from app.utils.executors import executor_service
 
 # Initialize file manager
 file_manager = FileManager()
@@ -22,13 +28,13 @@ cpu_count = multiprocessing.cpu_count()
 thread_workers = min(32, cpu_count * 2)  # 2 threads per CPU core, max 32
 process_workers = max(1, cpu_count - 1)  # Leave one CPU core free for system tasks
 
-# Create thread and process pool executors for parallel processing
+# Create thread and process pool executors for parallel processing.
+# The process pool runs cheap conversions without a Celery round trip.
 thread_pool = ThreadPoolExecutor(max_workers=thread_workers)
-process_pool = ProcessPoolExecutor(max_workers=process_workers)
+process_pool = ProcessPoolExecutor(max_workers=process_workers, initializer=init_fast_path_process)
 
 # Initialize Redis connection
-redis_url = os.getenv("REDIS_URL", "redis://localhost:6379/0")
-redis_client = redis.from_url(redis_url)
+redis_client = get_redis()
 
 app = FastAPI(
     title="Format Conversion API",
@@ -51,13 +57,58 @@ async def add_process_time_header(request, call_next):
     response = await call_next(request)
     return response
 
+# Endpoints that accept an upload to convert
+ADMISSION_PATHS = {
+    "/api/convert/file",
+    "/api/convert/file/async",
+    "/api/convert/stream",
+    "/api/convert/batch",
+    "/api/upload/sessions",
+}
+
+# Refuse conversions the workers cannot take on before their upload is read
+@app.middleware("http")
+async def admission_control(request: Request, call_next):
+    if request.method != "POST" or request.url.path not in ADMISSION_PATHS:
+        return await call_next(request)
+    
+    # Only headers and the query string are available without reading the body;
+    # clients can send the conversion type as a header to get a precise check
+    conversion_type = request.query_params.get("conversion_type") or request.headers.get("X-Conversion-Type")
+    content_length = request.headers.get("Content-Length")
+    decision = await run_in_threadpool(
+        admission_controller.check,
+        conversion_type,
+        request.headers.get("X-User-ID"),
+        int(content_length) if content_length and content_length.isdigit() else None
+    )
+    if not decision["admitted"]:
+        return JSONResponse(
+            status_code=429,
+            content={"detail": decision["reason"], **decision},
+            headers={"Retry-After": str(decision["retry_after"])}
+        )
+    return await call_next(request)
+
 # Mount static files directories
 app.mount("/uploads", StaticFiles(directory=file_manager.base_upload_dir), name="uploads")
-app.mount("/outputs", StaticFiles(directory=file_manager.base_output_dir), name="outputs")
+
+# Converted files are served with byte ranges and content-hash ETags
+@app.api_route("/outputs/{file_path:path}", methods=["GET", "HEAD"])
+async def serve_output(request: Request, file_path: str):
+    output_path = file_manager.resolve_path(file_manager.base_output_dir, file_path)
+    if output_path is None:
+        # Outputs written on another node are only known to the output catalog
+        entry = await run_in_threadpool(file_manager.find_output, os.path.basename(file_path))
+        if entry is None:
+            raise HTTPException(status_code=404, detail="Not Found")
+        return await conversion_router.serve_file(request, entry["path"], content_hash=entry["hash"])
+    return await conversion_router.serve_file(request, output_path)
 
 # Include routers
 app.include_router(conversion_router.router)
 app.include_router(chat_router.router)
+app.include_router(upload_router.router)
 
 @app.get("/")
 async def root():
@@ -68,7 +119,7 @@ async def root():
 async def health_check():
     # Check Redis connection
     try:
-        redis_client.ping()
+        await get_async_redis().ping()
         redis_status = "ok"
     except Exception as e:
         redis_status = f"error: {str(e)}"
@@ -79,7 +130,8 @@ async def health_check():
         "workers": {
             "thread_pool": thread_workers,
             "process_pool": process_workers
-        }
+        },
+        "executors": executor_service.stats()
     }
 
 # Provide the thread and process pools to the application state
@@ -96,6 +148,8 @@ async def startup_event():
 async def shutdown_event():
     app.state.thread_pool.shutdown()
     app.state.process_pool.shutdown()
+    executor_service.shutdown()
+    await task_result_waiter.close()
     print("Server shutting down, cleaning up resources")
 
 if __name__ == "__main__":
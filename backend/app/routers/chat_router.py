@@ -1,4 +1,5 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form, BackgroundTasks, Request
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form, Request
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import List, Dict, Optional, Any
 from app.services.groq_service import GroqService
@@ -8,9 +9,9 @@ import json
 import os
 
 # Import conversion related modules
-from app.routers.conversion_router import convert_file as conversion_endpoint
+from app.routers.conversion_router import convert_file as conversion_endpoint, check_upload, require_admission
 from app.utils.file_manager import FileManager
-from app.tasks import convert_file_task, cleanup_old_files
+from app.utils.dispatcher import convert_and_wait, is_fast_path
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -63,6 +64,7 @@ class ConversionRequest(BaseModel):
 class ConversionResponse(BaseModel):
     success: bool
     message: str
+    result_id: Optional[str] = None
     file_path: Optional[str] = None
     download_url: Optional[str] = None
     error: Optional[str] = None
@@ -199,9 +201,8 @@ async def chat_completion(chat_request: ChatRequest):
 @router.post("/convert", response_model=ConversionResponse)
 async def chat_convert_file(
     request: Request,
-    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
-    conversion_type: str = Form(...),
+    conversion_type: Optional[str] = Form(None),
     target_format: str = Form(...),
     user_message: str = Form(...)
 ):
@@ -213,31 +214,45 @@ async def chat_convert_file(
         # We'll handle the Depends differently than the main conversion endpoint
         # This fixes the "Object of type Depends is not JSON serializable" error
         
+        # Reject files that cannot be converted to the target format before storing them
+        stored_filename, conversion_type = await check_upload(file, target_format, conversion_type)
+        
+        # Refuse conversions that would be queued while the workers are overloaded
+        if not is_fast_path(conversion_type, target_format, file.size or 0):
+            await require_admission(conversion_type, None, file.size)
+        
         # Save the uploaded file using the file manager
         file_path, file_hash, unique_id = await file_manager.save_uploaded_file(
             file=file,
             conversion_type=conversion_type,
-            user_id=None  # Use None instead of Depends(get_user_id)
+            user_id=None,  # Use None instead of Depends(get_user_id)
+            original_filename=stored_filename
         )
         
         output_filename = os.path.basename(file.filename)
         
-        # Submit the conversion task to Celery
-        task = convert_file_task.delay(
+        # Convert in the API's process pool if the conversion is cheap, otherwise
+        # on Celery, waiting without blocking the event loop (5 minutes timeout)
+        output_path, result_id = await convert_and_wait(
+            request.app.state.process_pool,
             file_path=file_path,
             target_format=target_format,
             conversion_type=conversion_type,
             output_filename=output_filename,
             file_hash=file_hash,
             unique_id=unique_id,
-            user_id=None
+            user_id=None,
+            timeout=300
         )
         
-        # Wait for the task to complete (with a timeout)
-        output_path = task.get(timeout=300)  # 5 minutes timeout
-        
-        # Schedule file cleanup after response is sent
-        background_tasks.add_task(cleanup_old_files, file_path, output_path, delay=3600)  # Clean up after 1 hour
+        # Clean up the files an hour after the response is sent
+        await run_in_threadpool(file_manager.schedule_upload_expiry, file_path, file_hash, ttl_seconds=3600)
+        await run_in_threadpool(
+            file_manager.schedule_output_expiry,
+            output_path,
+            ttl_seconds=3600,
+            result_id=result_id
+        )
         
         # Get the download URL
         download_url = file_manager.get_file_url(output_path)
@@ -247,6 +262,7 @@ async def chat_convert_file(
         return {
             "success": True,
             "message": "File converted successfully",
+            "result_id": result_id,
             "file_path": output_path,
             "download_url": download_url
         }
@@ -1,38 +1,38 @@
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException, BackgroundTasks, Request, Depends
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Request, Depends, WebSocket, WebSocketDisconnect
+from fastapi.responses import Response, RedirectResponse, StreamingResponse, JSONResponse
+from starlette.concurrency import run_in_threadpool
 import os
 import uuid
-import shutil
-import asyncio
-from typing import Optional, List, Dict, Any, Callable
-from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, Future
-import aiofiles
-import time
-import hashlib
+import functools
+from typing import Optional, List, Dict, Any, AsyncIterator, Tuple
+import json
 from pydantic import BaseModel, EmailStr
-from datetime import datetime
 
-from app.utils.conversion_handler import ConversionHandler
+from app.utils.conversion_handler import conversion_handler
 from app.utils.file_manager import FileManager
+from app.utils.format_detection import SNIFF_BYTES, UnrecognizedFormatError, peek_stream
 from app.utils.email_service import email_service
-from app.tasks import convert_file_task, cleanup_old_files
+from app.utils.result_cache import result_cache
+from app.utils.file_response import file_response, backend_file_response
+from app.utils.task_results import task_result_waiter
+from app.utils.dispatcher import convert_and_wait, is_fast_path
+from app.utils.admission import admission_controller
+from app.utils.cancellation import cancellation_registry
+from app.utils.single_flight import single_flight
+from app.utils.batches import BATCH_MAX_FILES, batch_registry, expand_archive, is_archive, iter_zip
+from app.tasks import convert_file_task, submit_conversion_task, submit_conversion_batch
+from app.celery_worker import celery
 
 router = APIRouter(
     prefix="/api/convert",
     tags=["conversion"],
 )
 
-# Initialize the conversion handler
-conversion_handler = ConversionHandler()
-
 # Initialize the file manager
 file_manager = FileManager()
 
-# In-memory cache for conversion results
-conversion_cache: Dict[str, str] = {}
-
-# Track active conversions to prevent duplicates
-active_conversions: Dict[str, Future] = {}
+# How long synchronous conversion requests wait for their result
+SYNC_WAIT_SECONDS = 300
 
 # Define the email sharing request model
 class ShareFileRequest(BaseModel):
@@ -46,13 +46,70 @@ async def get_user_id(request: Request) -> Optional[str]:
     # This is a placeholder - in a real app, you'd get this from auth
     return request.headers.get("X-User-ID")
 
+def resolve_upload(
+    head: bytes,
+    filename: str,
+    target_format: str,
+    conversion_type: Optional[str] = None
+) -> Tuple[str, str]:
+    """
+    Detect an upload's format and check that it can be converted, before it is queued.
+    
+    Returns:
+        Tuple of (filename to store the upload under, conversion type)
+    
+    Raises:
+        HTTPException: 415 if the format is not recognized, 422 if it cannot be
+            converted to the target format
+    """
+    try:
+        return conversion_handler.resolve_upload(head, filename, target_format, conversion_type)
+    except UnrecognizedFormatError as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+async def require_admission(
+    conversion_type: str,
+    user_id: Optional[str] = None,
+    file_size: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Check that the workers can take on a conversion of a known type.
+    The middleware's check runs before the type is known, so it can only look at
+    the least loaded queue; every route that queues work checks again here.
+    
+    Returns:
+        The admission decision, with the conversion's queue and estimated wait
+    
+    Raises:
+        HTTPException: 429 with a Retry-After header if the conversion is refused
+    """
+    decision = await run_in_threadpool(admission_controller.check, conversion_type, user_id, file_size)
+    if not decision["admitted"]:
+        raise HTTPException(
+            status_code=429,
+            detail=decision["reason"],
+            headers={"Retry-After": str(decision["retry_after"])}
+        )
+    return decision
+
+async def check_upload(
+    file: UploadFile,
+    target_format: str,
+    conversion_type: Optional[str] = None
+) -> Tuple[str, str]:
+    """Sniff the start of an uploaded file and resolve it with resolve_upload"""
+    head = await file.read(SNIFF_BYTES)
+    await file.seek(0)
+    return await run_in_threadpool(resolve_upload, head, file.filename, target_format, conversion_type)
+
 @router.post("/file")
 async def convert_file(
     request: Request,
-    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     target_format: str = Form(...),
-    conversion_type: str = Form(...),
+    conversion_type: Optional[str] = Form(None),
     user_id: Optional[str] = Depends(get_user_id),
 ):
     """
@@ -61,63 +118,107 @@ async def convert_file(
     Args:
         file: The file to convert
         target_format: The format to convert to (e.g., 'pdf', 'docx', 'jpg')
-        conversion_type: The type of conversion ('text', 'document', 'image', 'audio', 'video', 'compressed')
+        conversion_type: The type of conversion ('text', 'document', 'image', 'audio', 'video', 'compressed');
+            inferred from the file's content when omitted
     
     Returns:
         A JSON response with the path to the converted file
     """
+    # Reject files that cannot be converted before storing anything
+    stored_filename, conversion_type = await check_upload(file, target_format, conversion_type)
+    
     try:
         # Save the uploaded file using the file manager
         file_path, file_hash, unique_id = await file_manager.save_uploaded_file(
             file=file,
             conversion_type=conversion_type,
-            user_id=user_id
+            user_id=user_id,
+            original_filename=stored_filename
         )
         
-        # Generate a cache key for this conversion
-        cache_key = f"{file_hash}:{target_format}:{conversion_type}"
-        
-        # Check Redis cache
-        redis_client = request.app.state.redis
-        cached_result = redis_client.get(f"conversion:{cache_key}")
-        
-        if cached_result:
-            cached_path = cached_result.decode('utf-8')
-            if os.path.exists(cached_path):
-                download_url = file_manager.get_file_url(cached_path)
-                return {
-                    "success": True,
-                    "message": "File converted successfully (cached)",
-                    "file_path": cached_path,
-                    "download_url": download_url
-                }
-        
         # Get the output path for the converted file
         output_filename = os.path.basename(file.filename)
         
-        # Submit the conversion task to Celery
-        task = convert_file_task.delay(
-            file_path=file_path,
+        # Serve repeat conversions straight from the result cache without reaching a worker
+        cache_key = await run_in_threadpool(conversion_handler.get_cache_key, file_path, file_hash, target_format)
+        output_path = file_manager.get_output_path(
+            original_filename=output_filename,
             target_format=target_format,
-            conversion_type=conversion_type,
-            output_filename=output_filename,
             file_hash=file_hash,
             unique_id=unique_id,
             user_id=user_id
         )
+        if await run_in_threadpool(result_cache.materialize, cache_key, output_path):
+            # The input is not needed for a cached result
+            await run_in_threadpool(file_manager.discard_upload, file_path, file_hash)
+            output_hash = await run_in_threadpool(result_cache.get_content_hash, cache_key)
+            await run_in_threadpool(
+                file_manager.register_output,
+                result_id=unique_id,
+                output_path=output_path,
+                content_hash=output_hash,
+                user_id=user_id,
+                # Like a converted file, the cached copy is cleaned up an hour after the response
+                ttl_seconds=3600
+            )
+            download_url = file_manager.get_file_url(output_path)
+            return {
+                "success": True,
+                "message": "File converted successfully (cached)",
+                "result_id": unique_id,
+                "file_path": output_path,
+                "download_url": download_url
+            }
         
-        # Wait for the task to complete (with a timeout)
-        output_path = task.get(timeout=300)  # 5 minutes timeout
+        # When the queue is too long to finish within this request, hand back a
+        # task to follow instead of holding the connection until it times out
+        file_size = os.path.getsize(file_path)
+        if not is_fast_path(conversion_type, target_format, file_size):
+            decision = await require_admission(conversion_type, user_id, file_size)
+            if decision["estimated_wait"] is not None and decision["estimated_wait"] > SYNC_WAIT_SECONDS:
+                task = await run_in_threadpool(
+                    submit_conversion_task,
+                    file_path=file_path,
+                    target_format=target_format,
+                    conversion_type=conversion_type,
+                    output_filename=output_filename,
+                    file_hash=file_hash,
+                    unique_id=unique_id,
+                    user_id=user_id
+                )
+                return JSONResponse(
+                    status_code=202,
+                    content={
+                        "success": True,
+                        "message": "Conversion queued; follow it with the status URL",
+                        "task_id": task.id,
+                        "status_url": f"/api/convert/status/{task.id}",
+                        "estimated_wait": decision["estimated_wait"]
+                    }
+                )
         
-        # Cache the result in Redis
-        redis_client.setex(
-            f"conversion:{cache_key}",
-            3600 * 24,  # 24 hours expiration
-            output_path
+        # Convert in the API's process pool if the conversion is cheap, otherwise
+        # on Celery, waiting without blocking the event loop (5 minutes timeout)
+        output_path, result_id = await convert_and_wait(
+            request.app.state.process_pool,
+            file_path=file_path,
+            target_format=target_format,
+            conversion_type=conversion_type,
+            output_filename=output_filename,
+            file_hash=file_hash,
+            unique_id=unique_id,
+            user_id=user_id,
+            timeout=SYNC_WAIT_SECONDS
         )
         
-        # Schedule file cleanup after response is sent
-        background_tasks.add_task(cleanup_files, file_path, output_path, delay=3600)  # Clean up after 1 hour
+        # Clean up the files an hour after the response is sent
+        await run_in_threadpool(file_manager.schedule_upload_expiry, file_path, file_hash, ttl_seconds=3600)
+        await run_in_threadpool(
+            file_manager.schedule_output_expiry,
+            output_path,
+            ttl_seconds=3600,
+            result_id=result_id
+        )
         
         # Get the download URL
         download_url = file_manager.get_file_url(output_path)
@@ -125,14 +226,20 @@ async def convert_file(
         return {
             "success": True,
             "message": "File converted successfully",
+            "result_id": result_id,
             "file_path": output_path,
             "download_url": download_url
         }
     
+    except HTTPException:
+        # Refused conversions leave nothing behind either
+        if 'file_path' in locals():
+            await run_in_threadpool(file_manager.discard_upload, file_path, file_hash)
+        raise
     except Exception as e:
         # Clean up the uploaded file if conversion fails
-        if 'file_path' in locals() and os.path.exists(file_path):
-            os.remove(file_path)
+        if 'file_path' in locals():
+            await run_in_threadpool(file_manager.discard_upload, file_path, file_hash)
         
         raise HTTPException(
             status_code=500,
@@ -144,7 +251,7 @@ async def convert_file_async(
     request: Request,
     file: UploadFile = File(...),
     target_format: str = Form(...),
-    conversion_type: str = Form(...),
+    conversion_type: Optional[str] = Form(None),
     user_id: Optional[str] = Depends(get_user_id),
 ):
     """
@@ -153,24 +260,32 @@ async def convert_file_async(
     Args:
         file: The file to convert
         target_format: The format to convert to (e.g., 'pdf', 'docx', 'jpg')
-        conversion_type: The type of conversion ('text', 'document', 'image', 'audio', 'video', 'compressed')
+        conversion_type: The type of conversion ('text', 'document', 'image', 'audio', 'video', 'compressed');
+            inferred from the file's content when omitted
     
     Returns:
         A JSON response with the task ID
     """
+    # Reject files that cannot be converted, or that the workers cannot take on,
+    # before storing anything
+    stored_filename, conversion_type = await check_upload(file, target_format, conversion_type)
+    await require_admission(conversion_type, user_id, file.size)
+    
     try:
         # Save the uploaded file using the file manager
         file_path, file_hash, unique_id = await file_manager.save_uploaded_file(
             file=file,
             conversion_type=conversion_type,
-            user_id=user_id
+            user_id=user_id,
+            original_filename=stored_filename
         )
         
         # Get the output filename
         output_filename = os.path.basename(file.filename)
         
         # Submit the conversion task to Celery
-        task = convert_file_task.delay(
+        task = await run_in_threadpool(
+            submit_conversion_task,
             file_path=file_path,
             target_format=target_format,
             conversion_type=conversion_type,
@@ -189,16 +304,347 @@ async def convert_file_async(
     
     except Exception as e:
         # Clean up the uploaded file if task submission fails
-        if 'file_path' in locals() and os.path.exists(file_path):
-            os.remove(file_path)
+        if 'file_path' in locals():
+            await run_in_threadpool(file_manager.discard_upload, file_path, file_hash)
+        
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to submit conversion task: {str(e)}"
+        )
+
+@router.post("/stream")
+async def convert_stream(
+    request: Request,
+    filename: str,
+    target_format: str,
+    conversion_type: Optional[str] = None,
+    user_id: Optional[str] = Depends(get_user_id),
+):
+    """
+    Convert a file sent as the raw request body and return a task ID.
+    The body is streamed straight to disk, avoiding the temporary file that
+    multipart parsing spools large uploads to.
+    
+    Args:
+        filename: Original name of the file, used for its extension
+        target_format: The format to convert to (e.g., 'pdf', 'docx', 'jpg')
+        conversion_type: The type of conversion ('text', 'document', 'image', 'audio', 'video', 'compressed');
+            inferred from the file's content when omitted
+    
+    Returns:
+        A JSON response with the task ID
+    """
+    # Reject bodies that cannot be converted before storing anything; the
+    # sniffed bytes are replayed into the file manager
+    head, chunks = await peek_stream(request.stream())
+    stored_filename, conversion_type = await run_in_threadpool(
+        resolve_upload, head, filename, target_format, conversion_type
+    )
+    content_length = request.headers.get("Content-Length")
+    await require_admission(
+        conversion_type,
+        user_id,
+        int(content_length) if content_length and content_length.isdigit() else None
+    )
+    
+    try:
+        # Stream the request body into the file manager
+        file_path, file_hash, unique_id = await file_manager.save_stream(
+            chunks=chunks,
+            original_filename=stored_filename,
+            conversion_type=conversion_type,
+            user_id=user_id
+        )
+        
+        # Submit the conversion task to Celery
+        task = await run_in_threadpool(
+            submit_conversion_task,
+            file_path=file_path,
+            target_format=target_format,
+            conversion_type=conversion_type,
+            output_filename=os.path.basename(filename),
+            file_hash=file_hash,
+            unique_id=unique_id,
+            user_id=user_id
+        )
+        
+        return {
+            "success": True,
+            "message": "Conversion task submitted",
+            "task_id": task.id,
+            "status_url": f"/api/convert/status/{task.id}"
+        }
+    
+    except Exception as e:
+        # Clean up the uploaded file if task submission fails
+        if 'file_path' in locals():
+            await run_in_threadpool(file_manager.discard_upload, file_path, file_hash)
         
         raise HTTPException(
             status_code=500,
             detail=f"Failed to submit conversion task: {str(e)}"
         )
 
+@router.post("/batch")
+async def convert_batch(
+    request: Request,
+    files: List[UploadFile] = File(...),
+    target_format: str = Form(...),
+    conversion_type: Optional[str] = Form(None),
+    user_id: Optional[str] = Depends(get_user_id),
+):
+    """
+    Convert many files at once and return a batch ID.
+    The conversions fan out across the workers as one Celery group. A single
+    zip or tar upload is expanded and each file inside it is converted.
+    
+    Args:
+        files: The files to convert, or one archive of them
+        target_format: The format to convert every file to
+        conversion_type: The type of conversion ('text', 'document', 'image', 'audio', 'video', 'compressed');
+            inferred from each file's content when omitted
+    
+    Returns:
+        A JSON response with the batch ID and its status and download URLs
+    """
+    # Without a conversion type, an archive converted to an archive format is
+    # converted as a whole rather than expanded
+    expand = len(files) == 1 and conversion_type != "compressed" and is_archive(files[0].filename)
+    if expand and conversion_type is None:
+        compressed_formats = conversion_handler.converters.get_class("compressed").get_supported_output_formats()
+        expand = target_format.lower() not in compressed_formats
+    
+    uploads = []
+    submitted = False
+    try:
+        if expand:
+            # Convert the files inside the archive rather than the archive itself;
+            # each of them is checked as it is stored
+            archive_path, archive_hash, _ = await file_manager.save_uploaded_file(
+                file=files[0],
+                conversion_type="compressed",
+                user_id=user_id
+            )
+            try:
+                uploads = await run_in_threadpool(
+                    expand_archive,
+                    file_manager,
+                    archive_path,
+                    functools.partial(
+                        resolve_upload,
+                        target_format=target_format,
+                        conversion_type=conversion_type
+                    ),
+                    user_id
+                )
+            finally:
+                await run_in_threadpool(file_manager.discard_upload, archive_path, archive_hash)
+        else:
+            if len(files) > BATCH_MAX_FILES:
+                raise HTTPException(
+                    status_code=413,
+                    detail=f"A batch can hold at most {BATCH_MAX_FILES} files"
+                )
+            
+            # Reject the whole batch before storing any of it if a file cannot be converted
+            resolved = [await check_upload(file, target_format, conversion_type) for file in files]
+            
+            for file, (stored_filename, file_conversion_type) in zip(files, resolved):
+                file_path, file_hash, unique_id = await file_manager.save_uploaded_file(
+                    file=file,
+                    conversion_type=file_conversion_type,
+                    user_id=user_id,
+                    original_filename=stored_filename
+                )
+                uploads.append((
+                    file_path,
+                    file_hash,
+                    unique_id,
+                    os.path.basename(file.filename),
+                    file_conversion_type
+                ))
+        
+        # Check every queue the batch goes to, now that the conversion types are known
+        for file_conversion_type in sorted({upload[4] for upload in uploads}):
+            await require_admission(file_conversion_type, user_id)
+        
+        # Submit all the conversion tasks to Celery as one group
+        task_ids = await run_in_threadpool(
+            submit_conversion_batch,
+            [
+                {
+                    "file_path": file_path,
+                    "target_format": target_format,
+                    "conversion_type": file_conversion_type,
+                    "output_filename": filename,
+                    "file_hash": file_hash,
+                    "unique_id": unique_id,
+                    "user_id": user_id,
+                }
+                for file_path, file_hash, unique_id, filename, file_conversion_type in uploads
+            ]
+        )
+        submitted = True
+        
+        batch_id = str(uuid.uuid4())
+        await run_in_threadpool(
+            batch_registry.create,
+            batch_id,
+            [
+                {"task_id": task_id, "filename": upload[3]}
+                for task_id, upload in zip(task_ids, uploads)
+            ],
+            target_format,
+            user_id
+        )
+        
+        return {
+            "success": True,
+            "message": "Batch conversion submitted",
+            "batch_id": batch_id,
+            "total": len(task_ids),
+            "status_url": f"/api/convert/batch/{batch_id}",
+            "download_url": f"/api/convert/batch/{batch_id}/download"
+        }
+    
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except HTTPException:
+        # Refused batches leave nothing behind either
+        if not submitted:
+            for file_path, file_hash, _, _, _ in uploads:
+                await run_in_threadpool(file_manager.discard_upload, file_path, file_hash)
+        raise
+    except Exception as e:
+        # Clean up the uploaded files if the batch was never submitted
+        if not submitted:
+            for file_path, file_hash, _, _, _ in uploads:
+                await run_in_threadpool(file_manager.discard_upload, file_path, file_hash)
+        
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to submit batch conversion: {str(e)}"
+        )
+
+def _get_batch(batch_id: str) -> Dict[str, Any]:
+    """Look up a batch, raising a 404 if it is unknown"""
+    batch = batch_registry.get(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail=f"Batch not found: {batch_id}")
+    return batch
+
+@router.get("/batch/{batch_id}")
+def get_batch_status(batch_id: str):
+    """
+    Get the aggregate progress of a batch conversion.
+    
+    Args:
+        batch_id: The ID of the batch to check
+    
+    Returns:
+        A JSON response with counts per status, the overall percentage and the status of each file
+    """
+    try:
+        return batch_registry.progress(_get_batch(batch_id))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to get batch status: {str(e)}"
+        )
+
+@router.get("/batch/{batch_id}/download")
+def download_batch(batch_id: str):
+    """
+    Download the converted files of a finished batch as a zip archive.
+    The archive is built while it is sent, so the download starts at once and
+    nothing extra is written to disk. Files that failed are listed in errors.txt.
+    
+    Args:
+        batch_id: The ID of the batch to download
+    
+    Returns:
+        The zip archive as a streaming response
+    """
+    batch = _get_batch(batch_id)
+    progress = batch_registry.progress(batch)
+    if not progress["complete"]:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Batch is still running: {progress['percent']}% done"
+        )
+    
+    entries, notes = batch_registry.outputs(batch, progress["files"])
+    return StreamingResponse(
+        iter_zip(entries, notes),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="batch_{batch_id[:8]}.zip"'}
+    )
+
+def describe_task_state(task_id: str, state: str, result: Any) -> Dict[str, Any]:
+    """
+    Describe a conversion task's state for API clients.
+    
+    Args:
+        task_id: The ID of the task
+        state: Celery state of the task
+        result: Celery result or state metadata of the task
+    
+    Returns:
+        A dictionary with the status, a message and any progress or download details
+    """
+    if state == 'PENDING':
+        return {
+            'status': 'pending',
+            'message': 'Task is pending'
+        }
+    elif state == 'STARTED':
+        return {
+            'status': 'started',
+            'message': 'Task has started'
+        }
+    elif state == 'PROGRESS':
+        return {
+            'status': 'progress',
+            'message': 'Task is running',
+            'progress': result
+        }
+    elif state == 'SUCCESS':
+        # The task ID is the result ID the output was cataloged under
+        entry = file_manager.output_catalog.get(task_id)
+        if entry is None:
+            return {
+                'status': 'expired',
+                'message': 'The converted file is no longer available'
+            }
+        return {
+            'status': 'success',
+            'message': 'Task completed successfully',
+            'result_id': task_id,
+            'file_path': entry['path'],
+            'size': entry['size'],
+            'expires_at': entry['expires_at'],
+            'download_url': f"/api/convert/download/{task_id}"
+        }
+    elif state == 'FAILURE':
+        return {
+            'status': 'failure',
+            'message': str(result)
+        }
+    elif state == 'REVOKED':
+        return {
+            'status': 'cancelled',
+            'message': 'Task was cancelled'
+        }
+    else:
+        return {
+            'status': state,
+            'message': 'Unknown state'
+        }
+
 @router.get("/status/{task_id}")
-async def get_task_status(request: Request, task_id: str):
+def get_task_status(request: Request, task_id: str):
     """
     Get the status of a conversion task.
     
@@ -209,39 +655,14 @@ async def get_task_status(request: Request, task_id: str):
         A JSON response with the task status
     """
     try:
-        # Get the task result from Celery
-        task = convert_file_task.AsyncResult(task_id)
-        
-        if task.state == 'PENDING':
-            response = {
-                'status': 'pending',
-                'message': 'Task is pending'
-            }
-        elif task.state == 'STARTED':
-            response = {
-                'status': 'started',
-                'message': 'Task has started'
-            }
-        elif task.state == 'SUCCESS':
-            output_path = task.result
-            response = {
-                'status': 'success',
-                'message': 'Task completed successfully',
-                'file_path': output_path,
-                'download_url': f"/outputs/{os.path.basename(output_path)}"
-            }
-        elif task.state == 'FAILURE':
-            response = {
-                'status': 'failure',
-                'message': str(task.result)
-            }
-        else:
-            response = {
-                'status': task.state,
-                'message': 'Unknown state'
-            }
+        # A coalesced conversion has the state of the task running it, unless it was cancelled
+        subscription = single_flight.get_subscription(task_id)
+        if subscription is not None and subscription["detached"]:
+            return describe_task_state(task_id, 'REVOKED', None)
         
-        return response
+        # Get the task result from Celery
+        task = convert_file_task.AsyncResult(subscription["leader"] if subscription else task_id)
+        return describe_task_state(task_id, task.state, task.info)
     
     except Exception as e:
         raise HTTPException(
@@ -249,26 +670,213 @@ async def get_task_status(request: Request, task_id: str):
             detail=f"Failed to get task status: {str(e)}"
         )
 
-@router.get("/download/{filename}")
-async def download_file(filename: str):
+@router.post("/cancel/{task_id}")
+def cancel_task(task_id: str, user_id: Optional[str] = Depends(get_user_id)):
+    """
+    Cancel a conversion task.
+    A queued task is dropped before it starts; a running task stops at its next
+    checkpoint, its external programs are terminated and its partial output is deleted.
+    A conversion coalesced with identical requests is only detached from the shared
+    task, which keeps running until none of its requests are left.
+    
+    Args:
+        task_id: The ID of the task to cancel
+        user_id: Optional ID of the user cancelling the task; only its owner may cancel it
+    
+    Returns:
+        A JSON response confirming the cancellation request
+    """
+    subscription = single_flight.get_subscription(task_id)
+    if subscription is None:
+        # Without a subscription the task is either finished, ran outside Celery, or is unknown
+        entry = file_manager.output_catalog.get(task_id)
+        if entry is None:
+            raise HTTPException(status_code=404, detail="Task not found")
+        owner = entry.get("owner")
+    else:
+        owner = subscription["owner"]
+    
+    if owner != user_id:
+        raise HTTPException(status_code=403, detail="Not allowed to cancel this task")
+    
+    if subscription is None or subscription["detached"]:
+        raise HTTPException(status_code=409, detail="Task has already finished")
+    
+    leader_id = subscription["leader"]
+    task = convert_file_task.AsyncResult(leader_id)
+    if task.state in ('SUCCESS', 'FAILURE', 'REVOKED'):
+        raise HTTPException(
+            status_code=409,
+            detail=f"Task has already finished with state {task.state}"
+        )
+    
+    # Stop receiving the shared output; the task itself only stops once nobody waits for it
+    remaining = single_flight.detach(task_id)
+    if remaining is None:
+        raise HTTPException(status_code=409, detail="Task has already finished")
+    
+    if remaining == 0:
+        try:
+            # Running conversions poll for the flag; queued ones are revoked outright
+            cancellation_registry.request_cancel(leader_id)
+            celery.control.revoke(leader_id)
+        except Exception as e:
+            raise HTTPException(
+                status_code=500,
+                detail=f"Failed to cancel task: {str(e)}"
+            )
+    
+    return {
+        "success": True,
+        "message": "Cancellation requested" if remaining == 0 else "Detached from the shared conversion",
+        "task_id": task_id
+    }
+
+async def _task_events(task_id: str) -> AsyncIterator[Optional[Dict[str, Any]]]:
+    """Follow a task and describe each state it reports, with None on idle heartbeats"""
+    # A coalesced conversion is followed through the task running it
+    subscription = await run_in_threadpool(single_flight.get_subscription, task_id)
+    if subscription is not None and subscription["detached"]:
+        yield describe_task_state(task_id, 'REVOKED', None)
+        return
+    
+    events = task_result_waiter.watch(subscription["leader"] if subscription else task_id, heartbeat=15)
+    try:
+        async for meta in events:
+            if meta is None:
+                yield None
+                continue
+            yield await run_in_threadpool(describe_task_state, task_id, meta["status"], meta["result"])
+    finally:
+        await events.aclose()
+
+@router.get("/progress/{task_id}")
+async def stream_task_progress(task_id: str):
+    """
+    Stream the progress of a conversion task as Server-Sent Events.
+    Each event carries the task status; while it runs, "progress" holds the stage,
+    percent and ETA. The stream ends once the task finishes.
+    
+    Args:
+        task_id: The ID of the task to follow
+    
+    Returns:
+        A text/event-stream response
+    """
+    async def event_stream():
+        async for event in _task_events(task_id):
+            if event is None:
+                # Keep proxies from closing an idle connection
+                yield ": keep-alive\n\n"
+            else:
+                yield f"event: {event['status']}\ndata: {json.dumps(event)}\n\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.websocket("/ws/progress/{task_id}")
+async def websocket_task_progress(websocket: WebSocket, task_id: str):
+    """
+    Push the progress of a conversion task over a WebSocket.
+    Sends the same JSON messages as the Server-Sent Events endpoint and closes
+    once the task finishes.
+    
+    Args:
+        task_id: The ID of the task to follow
+    """
+    await websocket.accept()
+    try:
+        async for event in _task_events(task_id):
+            if event is not None:
+                await websocket.send_json(event)
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+
+async def serve_file(
+    request: Request,
+    file_path: str,
+    filename: Optional[str] = None,
+    content_hash: Optional[str] = None
+) -> Response:
+    """
+    Serve a stored file with Range, ETag and conditional request support.
+    
+    Args:
+        request: The incoming request
+        file_path: Path to the file
+        filename: Optional download filename
+        content_hash: Hash of the file, computed if not given
+    
+    Returns:
+        The file as a response
+    """
+    if not os.path.exists(file_path) and file_manager.backend.remote:
+        # Stored by another node: send the client to the object store, or stream it from there
+        url = file_manager.backend.presigned_url(file_path, filename=filename)
+        if url:
+            return RedirectResponse(url, status_code=307)
+        return await run_in_threadpool(
+            backend_file_response,
+            request,
+            file_manager.backend,
+            file_path,
+            content_hash=content_hash,
+            filename=filename
+        )
+    
+    if not content_hash:
+        # Hashing can read the whole file the first time, so keep it off the event loop
+        content_hash = await run_in_threadpool(file_manager.get_content_hash, file_path)
+    
+    # Cached results are content-addressed, so their URLs never change meaning
+    cache_dir = os.path.realpath(result_cache.base_dir)
+    immutable = os.path.commonpath([cache_dir, os.path.realpath(file_path)]) == cache_dir
+    
+    return file_response(
+        request,
+        file_path,
+        content_hash=content_hash,
+        filename=filename,
+        immutable=immutable
+    )
+
+@router.api_route("/download/{filename}", methods=["GET", "HEAD"])
+async def download_file(request: Request, filename: str):
     """
     Download a converted file.
     
     Args:
-        filename: The name of the file to download
+        filename: The result ID or name of the file to download
     
     Returns:
         The file as a response
     """
-    # First check in outputs directory
-    output_path = os.path.join("outputs", filename)
-    if os.path.exists(output_path):
-        return FileResponse(output_path, filename=filename)
+    # Look the file up in the output catalog
+    entry = await run_in_threadpool(file_manager.find_output, filename)
+    if entry:
+        if request.method == "GET":
+            # A downloaded output may be evicted when space runs short
+            await run_in_threadpool(file_manager.storage.set_evictable, entry["path"], "outputs", True)
+        return await serve_file(
+            request,
+            entry["path"],
+            filename=entry["filename"],
+            content_hash=entry["hash"]
+        )
+    
+    # Then check in outputs directory
+    output_path = file_manager.resolve_path(file_manager.base_output_dir, filename)
+    if output_path:
+        return await serve_file(request, output_path, filename=os.path.basename(filename))
     
     # Then check in uploads directory
-    upload_path = os.path.join("uploads", filename)
-    if os.path.exists(upload_path):
-        return FileResponse(upload_path, filename=filename)
+    upload_path = file_manager.resolve_path(file_manager.base_upload_dir, filename)
+    if upload_path:
+        return await serve_file(request, upload_path, filename=os.path.basename(filename))
     
     # If file not found, raise 404
     raise HTTPException(
@@ -286,6 +894,38 @@ async def get_supported_formats():
     """
     return conversion_handler.get_supported_formats()
 
+@router.get("/cache/stats")
+def get_cache_stats():
+    """
+    Get hit-rate and size statistics for the conversion result cache.
+    
+    Returns:
+        A JSON response with the cache statistics
+    """
+    try:
+        return result_cache.stats()
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to get cache stats: {str(e)}"
+        )
+
+@router.get("/storage/usage")
+def get_storage_usage(user_id: Optional[str] = Depends(get_user_id)):
+    """
+    Get the disk usage and budget of the upload and output stores.
+    
+    Returns:
+        A JSON response with usage per store, and the caller's own usage if a user ID is given
+    """
+    try:
+        return file_manager.storage.usage(user_id)
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to get storage usage: {str(e)}"
+        )
+
 @router.post("/share")
 async def share_file_via_email(request: ShareFileRequest):
     """
@@ -301,28 +941,19 @@ async def share_file_via_email(request: ShareFileRequest):
         # Extract the filename from the path if it contains slashes
         filename = request.filename.split('/')[-1]
         
-        # First try to find the file directly in the outputs directory
-        file_path = os.path.join("outputs", filename)
+        # Look the file up by result ID or filename in the output catalog
+        entry = await run_in_threadpool(file_manager.find_output, filename)
+        if entry:
+            file_path = entry["path"]
+        else:
+            # Files converted before the catalog existed sit directly under outputs
+            file_path = file_manager.resolve_path(file_manager.base_output_dir, filename)
         
-        # If file doesn't exist, try to search for it in subdirectories
-        if not os.path.exists(file_path):
-            # Get current date for directory structure
-            today = datetime.now()
-            year_month_day = f"{today.year}/{today.month:02d}/{today.day:02d}"
-            
-            # Try date-based directory structure
-            date_based_path = os.path.join("outputs", year_month_day, filename)
-            if os.path.exists(date_based_path):
-                file_path = date_based_path
-            else:
-                # Try to find the file in any subdirectory of outputs
-                for root, dirs, files in os.walk("outputs"):
-                    if filename in files:
-                        file_path = os.path.join(root, filename)
-                        break
+        if not file_path:
+            raise HTTPException(status_code=404, detail=f"File not found: {filename}")
         
-        # Check if file exists after all attempts
-        if not os.path.exists(file_path):
+        # The attachment is read locally, so fetch outputs stored by another node
+        if not await run_in_threadpool(file_manager.backend.fetch, file_path):
             raise HTTPException(status_code=404, detail=f"File not found: {filename}")
         
         # Send email with file attachment
@@ -346,28 +977,3 @@ async def share_file_via_email(request: ShareFileRequest):
         raise e
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to share file: {str(e)}")
-
-async def cleanup_files(file_path: str, output_path: str, delay: int = 3600):
-    """
-    Clean up files after a delay.
-    
-    Args:
-        file_path: Path to the input file
-        output_path: Path to the output file
-        delay: Delay in seconds before cleaning up
-    """
-    await asyncio.sleep(delay)
-    
-    # Remove the input file if it exists
-    if os.path.exists(file_path):
-        try:
-            os.remove(file_path)
-        except Exception:
-            pass
-    
-    # Remove the output file if it exists
-    if os.path.exists(output_path):
-        try:
-            os.remove(output_path)
-        except Exception:
-            pass 
\ No newline at end of file
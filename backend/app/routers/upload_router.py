@@ -0,0 +1,253 @@
+from fastapi import APIRouter, HTTPException, Request, Depends, Response
+from starlette.requests import ClientDisconnect
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel
+from typing import Optional
+import os
+import re
+
+from app.routers.conversion_router import get_user_id, file_manager, require_admission, resolve_upload
+from app.utils.format_detection import SNIFF_BYTES
+from app.utils.upload_sessions import UploadSessionManager, UploadLengthMismatch, UploadOffsetMismatch, UploadSessionBusy
+from app.tasks import submit_conversion_task
+
+router = APIRouter(
+    prefix="/api/upload",
+    tags=["upload"],
+)
+
+# Initialize the upload session manager
+upload_sessions = UploadSessionManager(file_manager.blob_store, file_manager.expiry_index)
+
+# Content-Range: bytes <start>-<end>/<total or *>
+CONTENT_RANGE_PATTERN = re.compile(r"bytes (\d+)-(\d+)/(\d+|\*)")
+
+class CreateUploadRequest(BaseModel):
+    filename: str
+    conversion_type: Optional[str] = None
+    size: Optional[int] = None
+
+class CompleteUploadRequest(BaseModel):
+    target_format: str
+
+def _read_head(path: str) -> bytes:
+    """Read the first bytes of a staged upload, to detect its format"""
+    with open(path, "rb") as f:
+        return f.read(SNIFF_BYTES)
+
+def _session_response(session: dict) -> dict:
+    """Build the JSON description of an upload session"""
+    return {
+        "upload_id": session["upload_id"],
+        "filename": session["filename"],
+        "offset": session["offset"],
+        "size": session["size"],
+        "upload_url": f"/api/upload/sessions/{session['upload_id']}",
+    }
+
+@router.post("/sessions")
+async def create_upload_session(
+    request: CreateUploadRequest,
+    user_id: Optional[str] = Depends(get_user_id),
+):
+    """
+    Start a resumable upload.
+
+    Args:
+        request: CreateUploadRequest with the filename, optional conversion type and optional total size;
+            the conversion type is inferred from the file's content when omitted
+
+    Returns:
+        A JSON response with the upload ID and the URL to send chunks to
+    """
+    if request.size is not None and request.size < 0:
+        raise HTTPException(status_code=422, detail="Upload size must not be negative")
+
+    try:
+        session = await run_in_threadpool(
+            upload_sessions.create_session,
+            filename=request.filename,
+            conversion_type=request.conversion_type,
+            size=request.size,
+            user_id=user_id
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to create upload: {str(e)}")
+
+    return _session_response(session)
+
+@router.get("/sessions/{upload_id}")
+async def get_upload_session(upload_id: str):
+    """
+    Get the state of an upload, including the offset to resume from.
+
+    Args:
+        upload_id: The ID of the upload
+
+    Returns:
+        A JSON response with the upload state
+    """
+    session = await run_in_threadpool(upload_sessions.get_session, upload_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail=f"Upload not found: {upload_id}")
+
+    return _session_response(session)
+
+@router.put("/sessions/{upload_id}")
+async def upload_chunk(request: Request, upload_id: str):
+    """
+    Send the next chunk of an upload as the raw request body.
+    The chunk's position is given by a Content-Range header; without one the chunk
+    is appended at the current offset. A chunk whose body does not match its range
+    is rejected.
+
+    Args:
+        upload_id: The ID of the upload
+
+    Returns:
+        A JSON response with the new offset
+    """
+    session = await run_in_threadpool(upload_sessions.get_session, upload_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail=f"Upload not found: {upload_id}")
+
+    offset = session["offset"]
+    length = None
+    content_range = request.headers.get("Content-Range")
+    if content_range:
+        match = CONTENT_RANGE_PATTERN.fullmatch(content_range.strip())
+        if not match:
+            raise HTTPException(status_code=400, detail=f"Invalid Content-Range: {content_range}")
+        offset, end = int(match.group(1)), int(match.group(2))
+        if end < offset:
+            raise HTTPException(status_code=400, detail=f"Invalid Content-Range: {content_range}")
+        length = end - offset + 1
+
+        total = match.group(3)
+        if total != "*" and session["size"] is not None and int(total) != session["size"]:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Content-Range total {total} does not match the upload size {session['size']}"
+            )
+
+    try:
+        new_offset = await upload_sessions.write_chunk(upload_id, offset, request.stream(), length)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Upload not found: {upload_id}")
+    except UploadOffsetMismatch as e:
+        raise HTTPException(
+            status_code=409,
+            detail=str(e),
+            headers={"Upload-Offset": str(e.expected_offset)}
+        )
+    except UploadLengthMismatch as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except UploadSessionBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=416, detail=str(e))
+    except ClientDisconnect:
+        # The bytes received so far are kept; the client resumes from the stored offset
+        return Response(status_code=499)
+
+    return {
+        "upload_id": upload_id,
+        "offset": new_offset,
+        "size": session["size"],
+    }
+
+@router.delete("/sessions/{upload_id}")
+async def abort_upload(upload_id: str):
+    """
+    Cancel an upload and delete the data received so far.
+
+    Args:
+        upload_id: The ID of the upload
+
+    Returns:
+        A JSON response confirming the upload was removed
+    """
+    await run_in_threadpool(upload_sessions.abort, upload_id)
+    return {"success": True, "message": "Upload cancelled"}
+
+@router.post("/sessions/{upload_id}/complete")
+async def complete_upload(upload_id: str, request: CompleteUploadRequest):
+    """
+    Finish an upload and start converting it.
+
+    Args:
+        upload_id: The ID of the upload
+        request: CompleteUploadRequest with the target format
+
+    Returns:
+        A JSON response with the conversion task ID
+    """
+    session = await run_in_threadpool(upload_sessions.get_session, upload_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail=f"Upload not found: {upload_id}")
+
+    # Reject content that cannot be converted to the target format, like direct uploads
+    try:
+        head = await run_in_threadpool(_read_head, upload_sessions.blob_store.temp_path(upload_id))
+    except OSError:
+        raise HTTPException(status_code=404, detail=f"Upload not found: {upload_id}")
+    stored_filename, conversion_type = await run_in_threadpool(
+        resolve_upload, head, session["filename"], request.target_format, session["conversion_type"]
+    )
+
+    # Refuse before finishing the upload, so the client can complete it again later
+    await require_admission(conversion_type, session["user_id"], session["offset"])
+
+    try:
+        temp_path, file_hash, session = await upload_sessions.finalize(upload_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Upload not found: {upload_id}")
+    except UploadSessionBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    try:
+        # Move the finished upload into the blob store and give it a structured path
+        file_path = await run_in_threadpool(
+            file_manager.store_staged_file,
+            temp_path=temp_path,
+            file_hash=file_hash,
+            original_filename=stored_filename,
+            conversion_type=conversion_type,
+            unique_id=upload_id,
+            user_id=session["user_id"]
+        )
+
+        # Submit the conversion task to Celery
+        task = await run_in_threadpool(
+            submit_conversion_task,
+            file_path=file_path,
+            target_format=request.target_format,
+            conversion_type=conversion_type,
+            output_filename=session["filename"],
+            file_hash=file_hash,
+            unique_id=upload_id,
+            user_id=session["user_id"]
+        )
+
+        return {
+            "success": True,
+            "message": "Conversion task submitted",
+            "upload_id": upload_id,
+            "file_hash": file_hash,
+            "task_id": task.id,
+            "status_url": f"/api/convert/status/{task.id}"
+        }
+
+    except Exception as e:
+        # Clean up the uploaded file if task submission fails
+        if 'file_path' in locals():
+            await run_in_threadpool(file_manager.discard_upload, file_path, file_hash)
+        elif os.path.exists(temp_path):
+            await run_in_threadpool(os.remove, temp_path)
+
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to submit conversion task: {str(e)}"
+        )
@@ -1,36 +1,171 @@
 import os
+import glob
 import time
-import shutil
 import asyncio
+import shutil
+import functools
 from datetime import datetime, timedelta
+from celery import chord, group
+from celery.canvas import Signature
+from celery.exceptions import Ignore
+from celery.signals import task_revoked, worker_process_init, worker_process_shutdown
 from celery.utils.log import get_task_logger
-from typing import Optional
+from typing import Any, Dict, List, Optional, Tuple
 
-from app.celery_worker import celery
-from app.utils.conversion_handler import ConversionHandler
-from app.utils.file_manager import FileManager
+from app.celery_worker import celery, select_queue, worker_profile, QUEUE_BY_CONVERSION_TYPE
+from app.utils.conversion_handler import conversion_handler
+from app.utils.file_manager import FileManager, hash_file
+from app.utils.file_ops import copy_file
+from app.utils.result_cache import result_cache
+from app.utils.progress import ProgressReporter, progress_context
+from app.utils.single_flight import single_flight
+from app.utils.worker_runtime import worker_runtime
+from app.utils.executors import executor_service
+from app.utils.ffmpeg import probe_duration
+from app.utils.redis_client import get_redis
+from app.utils.storage_backend import storage_backend
+from app.utils.admission import admission_controller
+from app.utils.cancellation import ConversionCancelled, cancellation_registry
+
+# Long videos are split at keyframes and their segments transcoded in parallel
+VIDEO_SEGMENT_ENABLED = os.getenv("VIDEO_SEGMENT_PARALLEL", "1") == "1"
+VIDEO_SEGMENT_MIN_SECONDS = float(os.getenv("VIDEO_SEGMENT_MIN_SECONDS", "600"))  # Only split videos of 10 minutes or more
+VIDEO_SEGMENT_SECONDS = float(os.getenv("VIDEO_SEGMENT_SECONDS", "120"))  # Target length of each segment
 
 # Initialize logger
 logger = get_task_logger(__name__)
 
-# Initialize conversion handler
-conversion_handler = ConversionHandler()
-
 # Initialize file manager
 file_manager = FileManager()
 
-@celery.task(name="convert_file_task")
-def convert_file_task(
-    file_path: str, 
-    target_format: str, 
-    conversion_type: str, 
+@worker_process_init.connect
+def start_worker_runtime(**kwargs):
+    """Start the worker process's event loop and warm the converters it is likely to run"""
+    worker_runtime.start()
+    
+    # A worker on a profile's queue only needs that queue's converters
+    conversion_types = None
+    if worker_profile:
+        conversion_types = [
+            conversion_type
+            for conversion_type, queue in QUEUE_BY_CONVERSION_TYPE.items()
+            if queue == worker_profile
+        ]
+    conversion_handler.warm_up(conversion_types)
+
+@worker_process_shutdown.connect
+def stop_worker_runtime(**kwargs):
+    """Stop the worker process's event loop and thread pools"""
+    worker_runtime.stop()
+    executor_service.shutdown()
+
+async def _run_blocking(func, *args, **kwargs):
+    """Run a blocking call in the loop's default executor"""
+    return await asyncio.get_event_loop().run_in_executor(None, functools.partial(func, *args, **kwargs))
+
+async def _finish_conversion(
+    cache_key: str,
+    output_path: str,
+    unique_id: str,
+    user_id: Optional[str],
+    target_format: str,
+    file_hash: str
+) -> None:
+    """Cache a finished conversion's output and hand it to every request waiting for it"""
+    # Hash the output once so downloads can use it as an ETag
+    output_hash = await _run_blocking(hash_file, output_path)
+    
+    # Add the output to the shared result cache
+    await _run_blocking(result_cache.put, cache_key, output_path, content_hash=output_hash)
+    
+    await _deliver_output(cache_key, output_path, output_hash, unique_id, user_id, target_format, file_hash)
+
+def _share_output(cache_key: str, source_path: str, target_path: str) -> None:
+    """Expose a finished output at another request's path, sharing its data where possible"""
+    if result_cache.materialize(cache_key, target_path):
+        return
+    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+    try:
+        os.link(source_path, target_path)
+    except OSError:
+        copy_file(source_path, target_path)
+
+async def _deliver_output(
+    cache_key: str,
+    output_path: str,
+    output_hash: Optional[str],
+    unique_id: str,
+    user_id: Optional[str],
+    target_format: str,
+    file_hash: str
+) -> None:
+    """
+    Release a finished conversion's lock and register its output for every request
+    subscribed to it. Each coalesced request gets its own file in its owner's
+    directory and its own catalog entry, under its own result ID.
+    """
+    subscriptions = await _run_blocking(single_flight.release, cache_key, unique_id)
+    if subscriptions is None:
+        # The conversion was not coalesced, unless it was cancelled while it ran
+        subscription = await _run_blocking(single_flight.get_subscription, unique_id)
+        if subscription is not None and subscription["detached"]:
+            subscriptions = []
+        else:
+            subscriptions = [{"task_id": unique_id, "owner": user_id, "output_filename": None}]
+    
+    delivered = False
+    for subscription in subscriptions:
+        if subscription["task_id"] == unique_id:
+            target_path = output_path
+            delivered = True
+        else:
+            target_path = file_manager.get_output_path(
+                original_filename=subscription["output_filename"] or os.path.basename(output_path),
+                target_format=target_format,
+                file_hash=file_hash,
+                unique_id=subscription["task_id"],
+                user_id=subscription["owner"]
+            )
+            await _run_blocking(_share_output, cache_key, output_path, target_path)
+        
+        # Record the output under the request's result ID and register it for cleanup
+        await _run_blocking(
+            file_manager.register_output,
+            result_id=subscription["task_id"],
+            output_path=target_path,
+            content_hash=output_hash,
+            user_id=subscription["owner"]
+        )
+    
+    # Nobody is left to download the output of a cancelled request; the result cache keeps a copy
+    if not delivered and os.path.exists(output_path):
+        await _run_blocking(os.remove, output_path)
+
+def _discard_partial_outputs(output_path: str) -> None:
+    """Delete whatever a cancelled conversion wrote next to its output path"""
+    # Converters write to the output path, the path with the target extension
+    # appended, or temporary files derived from it
+    for path in glob.glob(f"{glob.escape(output_path)}*"):
+        try:
+            os.remove(path)
+        except OSError as e:
+            logger.warning(f"Failed to remove partial output {path}: {str(e)}")
+
+async def run_conversion_job(
+    file_path: str,
+    target_format: str,
+    conversion_type: str,
     output_filename: str,
     file_hash: str,
     unique_id: str,
-    user_id: Optional[str] = None
-):
+    user_id: Optional[str] = None,
+    reporter: Optional[ProgressReporter] = None,
+    cache_key: Optional[str] = None,
+    queued: bool = False
+) -> str:
     """
-    Celery task to convert a file to the specified format.
+    Convert an uploaded file, serve it from the result cache if possible, and
+    register the output under the conversion's result ID.
     
     Args:
         file_path: Path to the file to convert
@@ -38,18 +173,24 @@ def convert_file_task(
         conversion_type: Type of conversion
         output_filename: Custom filename for the output file
         file_hash: Hash of the input file for deduplication
-        unique_id: Unique ID for the conversion
+        unique_id: Unique ID for the conversion, used as the result ID
         user_id: Optional user ID for user-based directories
+        reporter: Optional reporter receiving the conversion's progress
+        cache_key: Result cache key the conversion was coalesced under, if it was queued
+        queued: Whether the conversion runs on a Celery queue, as opposed to the fast path
         
     Returns:
         Path to the converted file
+    
+    Raises:
+        ConversionCancelled: If the conversion was cancelled
     """
     logger.info(f"Starting conversion of {os.path.basename(file_path)} to {target_format}")
     start_time = time.time()
-    
-    # Run the conversion in an event loop
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
+    try:
+        input_size = os.path.getsize(file_path)
+    except OSError:
+        input_size = None
     
     try:
         # Get the output path
@@ -64,77 +205,661 @@ def convert_file_task(
         # Create the output directory if it doesn't exist
         os.makedirs(os.path.dirname(output_path), exist_ok=True)
         
+        # Serve the conversion from the result cache if another request already did it
+        if cache_key is None:
+            cache_key = conversion_handler.get_cache_key(file_path, file_hash, target_format)
+        if await _run_blocking(result_cache.materialize, cache_key, output_path):
+            logger.info(f"Cache hit for {os.path.basename(file_path)} -> {target_format}")
+            output_hash = (
+                await _run_blocking(result_cache.get_content_hash, cache_key)
+                or await _run_blocking(hash_file, output_path)
+            )
+            await _deliver_output(cache_key, output_path, output_hash, unique_id, user_id, target_format, file_hash)
+            return output_path
+        
+        # Fetch the upload if it was received by another node
+        fetched_input = await _run_blocking(file_manager.ensure_local_upload, file_path, file_hash)
+        
         # Perform the conversion
         try:
             # Use the full output path as the output_filename to ensure correct path
-            result_path = loop.run_until_complete(
-                conversion_handler.convert_file(
-                    file_path=file_path,
-                    target_format=target_format,
-                    conversion_type=conversion_type,
-                    output_filename=output_path
-                )
-            )
+            # Keep the single-flight lock alive however long the conversion takes
+            async with single_flight.keep_alive(cache_key, unique_id), cancellation_registry.cancellable(unique_id):
+                with progress_context(reporter or ProgressReporter(lambda meta: None)):
+                    result_path = await conversion_handler.convert_file(
+                        file_path=file_path,
+                        target_format=target_format,
+                        conversion_type=conversion_type,
+                        output_filename=output_path
+                    )
             
             # If the result path is different from the expected output path,
             # move the file to the correct location
             if result_path != output_path and os.path.exists(result_path):
-                # Ensure the target directory exists
-                os.makedirs(os.path.dirname(output_path), exist_ok=True)
-                
-                # Move the file
-                shutil.move(result_path, output_path)
+                # Move the file (a rename on the same filesystem)
+                await _run_blocking(file_manager.move_file, result_path, output_path)
                 logger.info(f"Moved file from {result_path} to {output_path}")
                 
                 # Use the correct output path
                 result_path = output_path
+        except ConversionCancelled:
+            logger.info(f"Conversion {unique_id} cancelled")
+            await _run_blocking(_discard_partial_outputs, output_path)
+            raise
         except Exception as e:
             logger.error(f"Conversion error: {str(e)}")
             raise
+        finally:
+            # The upload stays in the storage backend; drop this node's copy
+            if fetched_input and os.path.exists(file_path):
+                os.remove(file_path)
+        
+        await _finish_conversion(cache_key, output_path, unique_id, user_id, target_format, file_hash)
         
         end_time = time.time()
         logger.info(f"Conversion completed in {end_time - start_time:.2f} seconds")
         
+        # Feed the queue's wait estimate used by admission control; conversions run
+        # on the fast path never waited on a queue, so they would skew it
+        if queued:
+            admission_controller.record_duration(select_queue(conversion_type, input_size), end_time - start_time)
+        
         return output_path
+    except ConversionCancelled:
+        raise
     except Exception as e:
         logger.error(f"Conversion failed: {str(e)}")
         raise
     finally:
-        loop.close()
+        # Let the next identical request start its own conversion (or hit the cache)
+        if cache_key is not None:
+            single_flight.release(cache_key, unique_id)
+        admission_controller.release(user_id, unique_id)
+
+@celery.task(name="convert_file_task", bind=True)
+def convert_file_task(
+    self,
+    file_path: str, 
+    target_format: str, 
+    conversion_type: str, 
+    output_filename: str,
+    file_hash: str,
+    unique_id: str,
+    user_id: Optional[str] = None,
+    cache_key: Optional[str] = None
+):
+    """
+    Celery task to convert a file to the specified format.
+    The conversion runs on the worker process's persistent event loop.
+    
+    Args:
+        file_path: Path to the file to convert
+        target_format: Format to convert to
+        conversion_type: Type of conversion
+        output_filename: Custom filename for the output file
+        file_hash: Hash of the input file for deduplication
+        unique_id: Unique ID for the conversion
+        user_id: Optional user ID for user-based directories
+        cache_key: Result cache key the conversion was coalesced under
+        
+    Returns:
+        Path to the converted file
+    
+    Raises:
+        Ignore: If the conversion was cancelled; the task is recorded as revoked
+    """
+    # Converters report progress through the task state, which the result
+    # backend also publishes to anyone following the task. They report from the
+    # runtime loop and executor threads, where the task's request is not set
+    task_id = self.request.id
+    reporter = ProgressReporter(lambda meta: self.update_state(task_id=task_id, state="PROGRESS", meta=meta))
+    
+    # Spread long videos over the media workers, under this task's ID
+    plan = worker_runtime.run(
+        plan_segmented_conversion(
+            file_path=file_path,
+            target_format=target_format,
+            conversion_type=conversion_type,
+            output_filename=output_filename,
+            file_hash=file_hash,
+            unique_id=unique_id,
+            user_id=user_id,
+            reporter=reporter,
+            cache_key=cache_key
+        )
+    )
+    if plan is not None:
+        logger.info(f"Transcoding {os.path.basename(file_path)} in {len(plan['segments'])} segments")
+        raise self.replace(segmented_conversion_signature(plan))
+    
+    try:
+        return worker_runtime.run(
+            run_conversion_job(
+                file_path=file_path,
+                target_format=target_format,
+                conversion_type=conversion_type,
+                output_filename=output_filename,
+                file_hash=file_hash,
+                unique_id=unique_id,
+                user_id=user_id,
+                reporter=reporter,
+                cache_key=cache_key,
+                queued=True
+            )
+        )
+    except ConversionCancelled:
+        # Record the cancellation as the task's final state
+        self.backend.mark_as_revoked(self.request.id, reason="cancelled", request=self.request)
+        raise Ignore()
+
+@task_revoked.connect(sender=convert_file_task)
+def release_revoked_conversion(request=None, **kwargs):
+    """Release the single-flight lock and admission slot of a conversion revoked before it ran"""
+    if request is None:
+        return
+    conversion = request.kwargs or {}
+    cache_key = conversion.get("cache_key")
+    if cache_key is None:
+        return
+    single_flight.release(cache_key, request.id)
+    admission_controller.release(conversion.get("user_id"), request.id)
+
+async def plan_segmented_conversion(
+    file_path: str,
+    target_format: str,
+    conversion_type: str,
+    output_filename: str,
+    file_hash: str,
+    unique_id: str,
+    user_id: Optional[str] = None,
+    reporter: Optional[ProgressReporter] = None,
+    cache_key: Optional[str] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    Split a long video into keyframe-aligned segments that workers can transcode in parallel.
+    
+    Args:
+        file_path: Path to the video to convert
+        target_format: Format to convert to
+        conversion_type: Type of conversion
+        output_filename: Custom filename for the output file
+        file_hash: Hash of the input file
+        unique_id: Unique ID for the conversion, used as the result ID
+        user_id: Optional user ID for user-based directories
+        reporter: Optional reporter receiving the splitting progress
+        cache_key: Result cache key the conversion was coalesced under
+        
+    Returns:
+        The plan for the segmented conversion, or None if the video should be converted in one piece
+    """
+    if not VIDEO_SEGMENT_ENABLED or conversion_type != "video":
+        return None
+    
+    converter = conversion_handler.get_converter(conversion_type, target_format)
+    if not converter.supports_segments(target_format):
+        return None
+    
+    # A cached result beats any split
+    if cache_key is None:
+        cache_key = conversion_handler.get_cache_key(file_path, file_hash, target_format)
+    if await _run_blocking(result_cache.get, cache_key) is not None:
+        return None
+    
+    work_dir = os.path.join(file_manager.base_output_dir, "segments", unique_id)
+    fetched_input = await _run_blocking(file_manager.ensure_local_upload, file_path, file_hash)
+    try:
+        duration = await probe_duration(file_path)
+        if not duration or duration < VIDEO_SEGMENT_MIN_SECONDS:
+            return None
+        
+        with progress_context(reporter or ProgressReporter(lambda meta: None)):
+            segments = await converter.split_segments(file_path, work_dir, VIDEO_SEGMENT_SECONDS)
+        if len(segments) < 2:
+            shutil.rmtree(work_dir, ignore_errors=True)
+            return None
+        
+        # Other workers read the segments through the storage backend
+        for segment in segments:
+            await _run_blocking(storage_backend.publish, segment)
+    except Exception as e:
+        # Fall back to converting the video in one piece
+        logger.warning(f"Could not split {os.path.basename(file_path)} into segments: {str(e)}")
+        shutil.rmtree(work_dir, ignore_errors=True)
+        return None
+    finally:
+        if fetched_input and os.path.exists(file_path):
+            os.remove(file_path)
+    
+    return {
+        "file_path": file_path,
+        "file_hash": file_hash,
+        "target_format": target_format,
+        "output_path": file_manager.get_output_path(
+            original_filename=output_filename,
+            target_format=target_format,
+            file_hash=file_hash,
+            unique_id=unique_id,
+            user_id=user_id
+        ),
+        "cache_key": cache_key,
+        "unique_id": unique_id,
+        "user_id": user_id,
+        "work_dir": work_dir,
+        "segments": segments,
+        "encoded": [f"{os.path.splitext(segment)[0]}.encoded.mkv" for segment in segments],
+        "audio_path": os.path.join(work_dir, "audio.mka"),
+        "started_at": time.time(),
+    }
+
+def segmented_conversion_signature(plan: Dict[str, Any]):
+    """
+    Build the chord running a segmented conversion: every segment and the audio
+    are encoded in parallel, then joined into the output.
+    
+    Args:
+        plan: Plan from plan_segmented_conversion
+        
+    Returns:
+        The chord signature
+    """
+    header = [transcode_video_segment.s(plan, index) for index in range(len(plan["segments"]))]
+    header.append(encode_video_audio.s(plan))
+    return chord(header, join_video_segments.s(plan)).on_error(abort_segmented_conversion.s(plan=plan))
+
+def _discard_segments(plan: Dict[str, Any]) -> None:
+    """Delete the intermediate files of a segmented conversion"""
+    for path in [*plan["segments"], *plan["encoded"], plan["audio_path"]]:
+        storage_backend.delete(path)
+    shutil.rmtree(plan["work_dir"], ignore_errors=True)
+
+@celery.task(name="transcode_video_segment", bind=True)
+def transcode_video_segment(self, plan: Dict[str, Any], index: int) -> str:
+    """
+    Celery task to encode one segment of a segmented video conversion.
+    
+    Args:
+        plan: Plan from plan_segmented_conversion
+        index: Index of the segment
+        
+    Returns:
+        Path to the encoded segment
+    """
+    segment_path = plan["segments"][index]
+    encoded_path = plan["encoded"][index]
+    
+    async def transcode() -> str:
+        # Segments split on another node are fetched for the time they are encoded
+        fetched = not os.path.exists(segment_path) and await _run_blocking(storage_backend.fetch, segment_path)
+        try:
+            converter = conversion_handler.converters["video"]
+            async with single_flight.keep_alive(plan["cache_key"], plan["unique_id"]), \
+                    cancellation_registry.cancellable(plan["unique_id"]):
+                await converter.transcode_segment(segment_path, encoded_path, plan["target_format"])
+            await _run_blocking(storage_backend.publish, encoded_path)
+        finally:
+            if fetched:
+                os.remove(segment_path)
+                if os.path.exists(encoded_path):
+                    os.remove(encoded_path)
+        return encoded_path
+    
+    worker_runtime.run(transcode())
+    
+    # Report the share of segments done as the progress of the original task
+    done = get_redis().incr(f"segments:done:{plan['unique_id']}")
+    get_redis().expire(f"segments:done:{plan['unique_id']}", 24 * 3600)
+    total = len(plan["segments"])
+    elapsed = time.time() - plan["started_at"]
+    self.update_state(
+        task_id=plan["unique_id"],
+        state="PROGRESS",
+        meta={
+            "stage": "encoding segments",
+            "percent": round(min(100.0, done * 100.0 / total), 1),
+            "done": done,
+            "total": total,
+            "unit": "segments",
+            "eta_seconds": round(elapsed * (total - done) / done, 1),
+            "elapsed_seconds": round(elapsed, 1),
+        }
+    )
+    
+    return encoded_path
+
+@celery.task(name="encode_video_audio")
+def encode_video_audio(plan: Dict[str, Any]) -> Optional[str]:
+    """
+    Celery task to encode the audio of a segmented video conversion.
+    
+    Args:
+        plan: Plan from plan_segmented_conversion
+        
+    Returns:
+        Path to the encoded audio, or None if the video has no audio
+    """
+    async def encode() -> Optional[str]:
+        fetched_input = await _run_blocking(file_manager.ensure_local_upload, plan["file_path"], plan["file_hash"])
+        try:
+            converter = conversion_handler.converters["video"]
+            async with single_flight.keep_alive(plan["cache_key"], plan["unique_id"]), \
+                    cancellation_registry.cancellable(plan["unique_id"]):
+                audio_path = await converter.encode_audio(plan["file_path"], plan["audio_path"], plan["target_format"])
+            if audio_path:
+                await _run_blocking(storage_backend.publish, audio_path)
+            return audio_path
+        finally:
+            if fetched_input and os.path.exists(plan["file_path"]):
+                os.remove(plan["file_path"])
+    
+    return worker_runtime.run(encode())
+
+@celery.task(name="join_video_segments")
+def join_video_segments(results: List[Optional[str]], plan: Dict[str, Any]) -> str:
+    """
+    Celery task joining the encoded segments and audio of a segmented video conversion.
+    It runs under the original conversion task's ID, so its result is the conversion's result.
+    
+    Args:
+        results: Paths of the encoded segments in order, followed by the encoded audio path or None
+        plan: Plan from plan_segmented_conversion
+        
+    Returns:
+        Path to the converted file
+    """
+    *encoded_paths, audio_path = results
+    output_path = plan["output_path"]
+    
+    async def join() -> str:
+        for path in [*encoded_paths, audio_path]:
+            if path and not os.path.exists(path):
+                await _run_blocking(storage_backend.fetch, path)
+        
+        converter = conversion_handler.converters["video"]
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        async with single_flight.keep_alive(plan["cache_key"], plan["unique_id"]):
+            await converter.join_segments(encoded_paths, audio_path, output_path, plan["target_format"])
+        await _finish_conversion(
+            plan["cache_key"],
+            output_path,
+            plan["unique_id"],
+            plan["user_id"],
+            plan["target_format"],
+            plan["file_hash"]
+        )
+        return output_path
+    
+    try:
+        worker_runtime.run(join())
+        duration = time.time() - plan["started_at"]
+        logger.info(f"Segmented conversion completed in {duration:.2f} seconds")
+        admission_controller.record_duration("media", duration)
+        return output_path
+    finally:
+        _discard_segments(plan)
+        single_flight.release(plan["cache_key"], plan["unique_id"])
+        admission_controller.release(plan["user_id"], plan["unique_id"])
+
+@celery.task(name="abort_segmented_conversion")
+def abort_segmented_conversion(request, exc, traceback, plan: Dict[str, Any]) -> None:
+    """
+    Celery error callback cleaning up after a segmented conversion whose segments failed.
+    
+    Args:
+        request: Request of the failed task
+        exc: The exception raised
+        traceback: Traceback of the exception
+        plan: Plan from plan_segmented_conversion
+    """
+    logger.error(f"Segmented conversion {plan['unique_id']} failed: {str(exc)}")
+    _discard_segments(plan)
+    single_flight.release(plan["cache_key"], plan["unique_id"])
+    admission_controller.release(plan["user_id"], plan["unique_id"])
+
+def run_conversion_inline(
+    file_path: str,
+    target_format: str,
+    conversion_type: str,
+    output_filename: str,
+    file_hash: str,
+    unique_id: str,
+    user_id: Optional[str] = None
+) -> str:
+    """
+    Run a conversion outside Celery, e.g. in the API's process pool.
+    The conversion runs on this process's persistent event loop, like in a worker.
+    
+    Args:
+        file_path: Path to the file to convert
+        target_format: Format to convert to
+        conversion_type: Type of conversion
+        output_filename: Custom filename for the output file
+        file_hash: Hash of the input file for deduplication
+        unique_id: Unique ID for the conversion
+        user_id: Optional user ID for user-based directories
+        
+    Returns:
+        Path to the converted file
+    """
+    return worker_runtime.run(
+        run_conversion_job(
+            file_path=file_path,
+            target_format=target_format,
+            conversion_type=conversion_type,
+            output_filename=output_filename,
+            file_hash=file_hash,
+            unique_id=unique_id,
+            user_id=user_id
+        )
+    )
+
+def conversion_signature(
+    file_path: str,
+    target_format: str,
+    conversion_type: str,
+    output_filename: str,
+    file_hash: str,
+    unique_id: str,
+    user_id: Optional[str] = None
+) -> Tuple[Optional[Signature], str]:
+    """
+    Prepare a conversion task with the task ID set to the conversion's unique ID,
+    so the task ID doubles as the result ID in the output catalog.
+    The conversion is routed to a queue by its type and input size.
+    
+    If the same conversion is already in flight, no signature is returned and
+    the request subscribes to the running task instead. It is still followed
+    under its own ID (see single_flight.leader_of) and gets its own copy of the
+    output under that ID once the task finishes.
+    
+    Args:
+        file_path: Path to the file to convert
+        target_format: Format to convert to
+        conversion_type: Type of conversion
+        output_filename: Custom filename for the output file
+        file_hash: Hash of the input file for deduplication
+        unique_id: Unique ID for the conversion
+        user_id: Optional user ID for user-based directories
+        
+    Returns:
+        Tuple of (signature to queue or None, task ID to follow)
+    """
+    # Subscribe to an identical conversion that is already running
+    cache_key = conversion_handler.get_cache_key(file_path, file_hash, target_format)
+    leader_id = single_flight.acquire(cache_key, unique_id, owner=user_id, output_filename=output_filename)
+    if leader_id is not None:
+        logger.info(f"Coalescing conversion {unique_id} into running task {leader_id}")
+        return None, unique_id
+    
+    try:
+        file_size = os.path.getsize(file_path)
+    except OSError:
+        file_size = None
+    
+    signature = convert_file_task.signature(
+        kwargs={
+            "file_path": file_path,
+            "target_format": target_format,
+            "conversion_type": conversion_type,
+            "output_filename": output_filename,
+            "file_hash": file_hash,
+            "unique_id": unique_id,
+            "user_id": user_id,
+            # The route, and so the key, may change before the task runs
+            "cache_key": cache_key,
+        }
+    ).set(task_id=unique_id, queue=select_queue(conversion_type, file_size))
+    
+    # Count the conversion against its user until it finishes
+    admission_controller.track(user_id, unique_id)
+    
+    return signature, unique_id
+
+def submit_conversion_task(
+    file_path: str,
+    target_format: str,
+    conversion_type: str,
+    output_filename: str,
+    file_hash: str,
+    unique_id: str,
+    user_id: Optional[str] = None
+):
+    """
+    Queue a conversion, or attach to an identical one already in flight.
+    See conversion_signature for how the task is set up.
+    
+    Args:
+        file_path: Path to the file to convert
+        target_format: Format to convert to
+        conversion_type: Type of conversion
+        output_filename: Custom filename for the output file
+        file_hash: Hash of the input file for deduplication
+        unique_id: Unique ID for the conversion
+        user_id: Optional user ID for user-based directories
+        
+    Returns:
+        The Celery AsyncResult of unique_id; when coalesced, the task's state is
+        that of single_flight.leader_of(unique_id)
+    """
+    signature, task_id = conversion_signature(
+        file_path=file_path,
+        target_format=target_format,
+        conversion_type=conversion_type,
+        output_filename=output_filename,
+        file_hash=file_hash,
+        unique_id=unique_id,
+        user_id=user_id
+    )
+    if signature is None:
+        return convert_file_task.AsyncResult(task_id)
+    return signature.apply_async()
+
+def submit_conversion_batch(conversions: List[Dict[str, Any]]) -> List[str]:
+    """
+    Queue many conversions at once as a Celery group, so they fan out across
+    every worker on their queues.
+    
+    Args:
+        conversions: Keyword arguments of conversion_signature for each conversion
+        
+    Returns:
+        The task ID to follow for each conversion, in order
+    """
+    signatures = []
+    task_ids = []
+    for conversion in conversions:
+        signature, task_id = conversion_signature(**conversion)
+        if signature is not None:
+            signatures.append(signature)
+        task_ids.append(task_id)
+    
+    if signatures:
+        group(signatures).apply_async()
+    
+    return task_ids
 
 @celery.task(name="cleanup_old_files")
-def cleanup_old_files(max_age_hours=24):
+def cleanup_old_files(batch_size=500):
     """
-    Celery task to clean up old files from uploads and outputs directories.
+    Celery task to delete files whose expiry time has passed.
+    Only entries due in the expiry index are visited, so the cost depends on the
+    number of expiring files rather than on everything stored.
+    
+    Args:
+        batch_size: Number of index entries claimed at a time
+    """
+    deleted = 0
+    
+    while True:
+        expired = file_manager.expiry_index.pop_expired(limit=batch_size)
+        for path, kind in expired:
+            try:
+                file_manager.expire(path, kind)
+                deleted += 1
+            except Exception as e:
+                logger.error(f"Failed to delete expired file {path}: {str(e)}")
+        
+        if len(expired) < batch_size:
+            break
+    
+    if deleted:
+        logger.info(f"Deleted {deleted} expired files")
+    
+    # Catch stores that went over budget without a write to trigger eviction
+    for store in file_manager.storage.budgets:
+        file_manager.storage.enforce(store)
+
+@celery.task(name="sweep_old_files")
+def sweep_old_files(max_age_hours=72):
+    """
+    Celery task to remove files that never made it into the expiry index,
+    such as leftovers from crashed conversions. Runs rarely as a safety net.
     
     Args:
         max_age_hours: Maximum age of files in hours before they are deleted
     """
-    logger.info(f"Starting cleanup of files older than {max_age_hours} hours")
+    logger.info(f"Starting sweep of files older than {max_age_hours} hours")
     
     # Calculate cutoff time
     cutoff_time = datetime.now() - timedelta(hours=max_age_hours)
     
-    # Clean up uploads directory
-    cleanup_directory("uploads", cutoff_time)
-    
-    # Clean up outputs directory
-    cleanup_directory("outputs", cutoff_time)
+    # Blobs and cached results are managed by their own indexes
+    cleanup_directory("uploads", cutoff_time, exclude=[file_manager.blob_store.base_dir], remove=_sweep_upload)
+    cleanup_directory(file_manager.blob_store.temp_dir, cutoff_time)
+    cleanup_directory("outputs", cutoff_time, exclude=[result_cache.base_dir])
     
-    logger.info("Cleanup completed")
+    logger.info("Sweep completed")
+
+def _sweep_upload(file_path):
+    """Remove an old upload along with the blob reference it holds"""
+    # An upload has the same content, and so the same hash, as its blob
+    file_manager.discard_upload(file_path, hash_file(file_path))
+
+def _sweep_file(file_path):
+    """Remove an old file and stop counting it towards its store"""
+    os.remove(file_path)
+    file_manager.storage.untrack(file_path)
 
-def cleanup_directory(directory, cutoff_time):
+def cleanup_directory(directory, cutoff_time, exclude=None, remove=None):
     """
     Clean up files in a directory that are older than the cutoff time.
     
     Args:
         directory: Directory to clean up
         cutoff_time: Cutoff time for file deletion
+        exclude: Optional list of subdirectories to leave untouched
+        remove: Optional function deleting a file, instead of removing and untracking it
     """
+    remove = remove or _sweep_file
+
     if not os.path.exists(directory):
         return
     
+    excluded = {os.path.normpath(path) for path in (exclude or [])}
+    
     for root, dirs, files in os.walk(directory):
+        # Don't descend into excluded directories
+        dirs[:] = [d for d in dirs if os.path.normpath(os.path.join(root, d)) not in excluded]
+        
         for file in files:
             file_path = os.path.join(root, file)
             
@@ -144,7 +869,7 @@ def cleanup_directory(directory, cutoff_time):
             # Delete file if it's older than the cutoff time
             if file_mtime < cutoff_time:
                 try:
-                    os.remove(file_path)
+                    remove(file_path)
                     logger.info(f"Deleted old file: {file_path}")
                 except Exception as e:
                     logger.error(f"Failed to delete file {file_path}: {str(e)}")
@@ -0,0 +1,238 @@
+import os
+import math
+import time
+import logging
+from typing import Any, Dict, Optional, Tuple
+
+import redis
+
+from app.celery_worker import celery, select_queue, QUEUE_BY_CONVERSION_TYPE, WORKER_PROFILES
+from app.utils.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Hash of queue -> moving average of conversion durations in seconds
+ADMISSION_DURATION_KEY = "admission:duration"
+
+# Sorted set of a user's in-flight conversion IDs -> submission timestamp
+ADMISSION_INFLIGHT_KEY_PREFIX = "admission:inflight:"
+
+# Limits past which new conversions are turned away
+ADMISSION_MAX_QUEUE_DEPTH = int(os.getenv("ADMISSION_MAX_QUEUE_DEPTH", "500"))
+ADMISSION_MAX_WAIT_SECONDS = float(os.getenv("ADMISSION_MAX_WAIT_SECONDS", "1800"))
+ADMISSION_MAX_INFLIGHT_PER_USER = int(os.getenv("ADMISSION_MAX_INFLIGHT_PER_USER", "20"))
+
+# Conversions running on each queue at once across all workers
+ADMISSION_QUEUE_CAPACITY = {
+    queue: int(os.getenv(f"ADMISSION_CAPACITY_{queue.upper()}", str(profile["worker_concurrency"])))
+    for queue, profile in WORKER_PROFILES.items()
+}
+
+# Starting duration estimates per queue, until conversions have been measured
+DEFAULT_DURATIONS = {"light": 2.0, "document": 30.0, "media": 120.0}
+
+# Weight of the newest duration in the moving average
+DURATION_EWMA_ALPHA = 0.2
+
+# In-flight entries older than this are treated as lost and ignored
+INFLIGHT_STALE_SECONDS = 2 * 3600
+
+class AdmissionController:
+    """
+    Decides whether the system can take on another conversion.
+    A conversion is turned away when its queue is too deep, when the estimated
+    wait (queue depth times the moving average conversion time, divided by the
+    queue's capacity) is too long, or when its user already has too many
+    conversions in flight. The checks only need request headers, so overloaded
+    requests can be refused before their upload is read.
+    """
+
+    def __init__(
+        self,
+        max_queue_depth: int = ADMISSION_MAX_QUEUE_DEPTH,
+        max_wait_seconds: float = ADMISSION_MAX_WAIT_SECONDS,
+        max_inflight_per_user: int = ADMISSION_MAX_INFLIGHT_PER_USER,
+        redis_client: Optional[redis.Redis] = None,
+        broker_client: Optional[redis.Redis] = None
+    ):
+        """Initialize the controller with its limits"""
+        self.max_queue_depth = max_queue_depth
+        self.max_wait_seconds = max_wait_seconds
+        self.max_inflight_per_user = max_inflight_per_user
+        self._redis = redis_client
+        self._broker = broker_client
+
+    @property
+    def redis(self) -> redis.Redis:
+        """Redis client holding the duration averages and in-flight counts"""
+        if self._redis is None:
+            self._redis = get_redis()
+        return self._redis
+
+    @property
+    def broker(self) -> redis.Redis:
+        """Redis client of the Celery broker, whose lists are the queues"""
+        if self._broker is None:
+            self._broker = redis.from_url(celery.conf.broker_url)
+        return self._broker
+
+    def estimate_wait(self, queue: str) -> Tuple[int, float]:
+        """
+        Estimate how long a new conversion would wait on a queue.
+
+        Args:
+            queue: Name of the queue
+
+        Returns:
+            Tuple of (number of queued tasks, estimated wait in seconds)
+        """
+        depth = self.broker.llen(queue)
+        capacity = max(1, ADMISSION_QUEUE_CAPACITY.get(queue, 1))
+        return depth, depth * self.average_duration(queue) / capacity
+
+    def average_duration(self, queue: str) -> float:
+        """Get the moving average conversion time of a queue in seconds"""
+        raw = self.redis.hget(ADMISSION_DURATION_KEY, queue)
+        return float(raw) if raw else DEFAULT_DURATIONS.get(queue, 30.0)
+
+    def check(
+        self,
+        conversion_type: Optional[str] = None,
+        user_id: Optional[str] = None,
+        file_size: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        Decide whether to accept a conversion.
+        Without a conversion type, the least loaded queue is checked, so only a
+        system that is overloaded everywhere turns the request away.
+
+        Args:
+            conversion_type: Type of conversion, if known
+            user_id: Optional ID of the requesting user
+            file_size: Size of the input in bytes, if known
+
+        Returns:
+            A dictionary with "admitted", "reason", "retry_after", "queue",
+            "queue_depth" and "estimated_wait"
+        """
+        try:
+            if conversion_type in QUEUE_BY_CONVERSION_TYPE:
+                queue = select_queue(conversion_type, file_size)
+                depth, wait = self.estimate_wait(queue)
+            else:
+                queue, depth, wait = min(
+                    ((queue, *self.estimate_wait(queue)) for queue in ADMISSION_QUEUE_CAPACITY),
+                    key=lambda item: item[2]
+                )
+
+            decision = {
+                "admitted": True,
+                "reason": None,
+                "retry_after": None,
+                "queue": queue,
+                "queue_depth": depth,
+                "estimated_wait": round(wait, 1),
+            }
+
+            if depth >= self.max_queue_depth:
+                excess = depth - self.max_queue_depth + 1
+                retry_after = excess * self.average_duration(queue) / max(1, ADMISSION_QUEUE_CAPACITY.get(queue, 1))
+                return self._refuse(decision, f"The {queue} queue is full", retry_after)
+
+            if wait > self.max_wait_seconds:
+                return self._refuse(decision, f"The {queue} queue is too busy", wait - self.max_wait_seconds)
+
+            if user_id and self.inflight(user_id) >= self.max_inflight_per_user:
+                return self._refuse(
+                    decision,
+                    f"Too many conversions in progress (limit {self.max_inflight_per_user})",
+                    self.average_duration(queue)
+                )
+
+            return decision
+        except redis.RedisError as e:
+            # Without the numbers, let the request through rather than refuse everything
+            logger.warning(f"Failed to check admission: {str(e)}")
+            return {
+                "admitted": True,
+                "reason": None,
+                "retry_after": None,
+                "queue": None,
+                "queue_depth": None,
+                "estimated_wait": None,
+            }
+
+    def inflight(self, user_id: str) -> int:
+        """
+        Count a user's conversions that have been queued but not finished.
+
+        Args:
+            user_id: ID of the user
+
+        Returns:
+            Number of conversions in flight
+        """
+        key = f"{ADMISSION_INFLIGHT_KEY_PREFIX}{user_id}"
+        pipe = self.redis.pipeline()
+        pipe.zremrangebyscore(key, 0, time.time() - INFLIGHT_STALE_SECONDS)
+        pipe.zcard(key)
+        return pipe.execute()[1]
+
+    def track(self, user_id: Optional[str], conversion_id: str) -> None:
+        """
+        Count a queued conversion against its user.
+
+        Args:
+            user_id: ID of the user, if any
+            conversion_id: Unique ID of the conversion
+        """
+        if not user_id:
+            return
+        key = f"{ADMISSION_INFLIGHT_KEY_PREFIX}{user_id}"
+        try:
+            pipe = self.redis.pipeline()
+            pipe.zadd(key, {conversion_id: time.time()})
+            pipe.expire(key, INFLIGHT_STALE_SECONDS)
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Failed to track conversion {conversion_id}: {str(e)}")
+
+    def release(self, user_id: Optional[str], conversion_id: str) -> None:
+        """
+        Stop counting a finished conversion against its user.
+
+        Args:
+            user_id: ID of the user, if any
+            conversion_id: Unique ID of the conversion
+        """
+        if not user_id:
+            return
+        try:
+            self.redis.zrem(f"{ADMISSION_INFLIGHT_KEY_PREFIX}{user_id}", conversion_id)
+        except redis.RedisError as e:
+            logger.warning(f"Failed to release conversion {conversion_id}: {str(e)}")
+
+    def record_duration(self, queue: str, seconds: float) -> None:
+        """
+        Fold a finished conversion's duration into its queue's moving average.
+        Concurrent updates may overwrite each other, which only costs one sample.
+
+        Args:
+            queue: Name of the queue the conversion ran on
+            seconds: How long the conversion took
+        """
+        try:
+            average = self.average_duration(queue)
+            average += DURATION_EWMA_ALPHA * (seconds - average)
+            self.redis.hset(ADMISSION_DURATION_KEY, queue, round(average, 3))
+        except redis.RedisError as e:
+            logger.warning(f"Failed to record conversion duration: {str(e)}")
+
+    @staticmethod
+    def _refuse(decision: Dict[str, Any], reason: str, retry_after: float) -> Dict[str, Any]:
+        """Turn a decision into a refusal"""
+        decision.update(admitted=False, reason=reason, retry_after=max(1, math.ceil(retry_after)))
+        return decision
+
+# Create a singleton instance
+admission_controller = AdmissionController()
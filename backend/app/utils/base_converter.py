@@ -1,6 +1,18 @@
 import os
+import asyncio
+import logging
+import functools
+import importlib
+import subprocess
+import contextvars
 from abc import ABC, abstractmethod
-from typing import List, Optional
+from typing import Any, BinaryIO, Callable, List, Optional, Tuple
+
+from app.utils.cancellation import check_cancelled, tracked_process
+from app.utils.executors import ExecutorService, executor_service
+from app.utils.progress import report_progress
+
+logger = logging.getLogger(__name__)
 
 class BaseConverter(ABC):
     """
@@ -8,8 +20,31 @@ class BaseConverter(ABC):
     Defines the common interface that all converters must implement.
     """
     
-    def __init__(self):
-        """Initialize the converter"""
+    # Version stamp included in result cache keys.
+    # Bump it in a converter whenever its output for the same input changes.
+    version = "1"
+    
+    # Modules the converter imports lazily, loaded ahead of time by warm_up()
+    warm_modules: Tuple[str, ...] = ()
+    
+    # Expected cost of the converter's conversions in seconds per MB of input,
+    # used by the route planner until real conversions have been measured
+    edge_cost = 1.0
+    
+    # Formats the converter reads and writes. Formats and conversion edges are
+    # declared on the class, so the format graph is built without creating converters
+    input_formats: Tuple[str, ...] = ()
+    output_formats: Tuple[str, ...] = ()
+    
+    def __init__(self, executors: Optional[ExecutorService] = None):
+        """
+        Initialize the converter.
+        
+        Args:
+            executors: Thread pools for blocking work (the process's shared ones by default)
+        """
+        self.executors = executors or executor_service
+        
         # Create output directory if it doesn't exist
         os.makedirs("outputs", exist_ok=True)
     
@@ -37,25 +72,197 @@ class BaseConverter(ABC):
         """
         pass
     
-    @abstractmethod
-    def get_supported_input_formats(self) -> List[str]:
+    def supports_stream(self, input_format: str, target_format: str) -> bool:
+        """
+        Check whether a conversion can run on streams with convert_stream().
+        
+        Args:
+            input_format: Input file format
+            target_format: Target file format
+            
+        Returns:
+            True if the converter implements the conversion on streams
+        """
+        return False
+    
+    async def convert_stream(
+        self,
+        src: BinaryIO,
+        dst: BinaryIO,
+        input_format: str,
+        target_format: str
+    ) -> None:
+        """
+        Convert the content of one binary stream into another.
+        Chained conversions pass in-memory buffers between steps, so intermediate
+        results never touch the disk. Only conversions for which supports_stream()
+        is true are implemented.
+        
+        Args:
+            src: Readable stream positioned at the start of the input
+            dst: Writable stream receiving the output
+            input_format: Format of the input
+            target_format: Format to convert to
+            
+        Raises:
+            NotImplementedError: If the conversion is not implemented on streams
+            Exception: If the conversion fails
+        """
+        raise NotImplementedError(
+            f"{type(self).__name__} cannot convert {input_format} to {target_format} on streams"
+        )
+    
+    @classmethod
+    def get_supported_input_formats(cls) -> List[str]:
         """
         Get a list of supported input formats.
         
         Returns:
             List of supported input format extensions (without the dot)
         """
-        pass
+        return list(cls.input_formats)
     
-    @abstractmethod
-    def get_supported_output_formats(self) -> List[str]:
+    @classmethod
+    def get_supported_output_formats(cls) -> List[str]:
         """
         Get a list of supported output formats.
         
         Returns:
             List of supported output format extensions (without the dot)
         """
-        pass
+        return list(cls.output_formats)
+    
+    @classmethod
+    def get_conversion_edges(cls) -> List[Tuple[str, str]]:
+        """
+        Get the conversions the converter performs directly, as edges of the format graph.
+        By default every supported input converts to every other supported output;
+        converters that only handle some pairs override this.
+        
+        Returns:
+            List of (input format, output format) pairs
+        """
+        return [
+            (input_format, output_format)
+            for input_format in cls.input_formats
+            for output_format in cls.output_formats
+            if input_format != output_format
+        ]
+    
+    def warm_up(self) -> None:
+        """
+        Import the converter's heavy dependencies ahead of its first conversion.
+        Missing optional dependencies are skipped; the conversion reports them when used.
+        """
+        for module in self.warm_modules:
+            try:
+                importlib.import_module(module)
+            except Exception as e:
+                logger.debug(f"Could not preload {module} for {type(self).__name__}: {str(e)}")
+    
+    def report_progress(
+        self,
+        stage: str,
+        done: Optional[float] = None,
+        total: Optional[float] = None,
+        unit: Optional[str] = None
+    ) -> None:
+        """
+        Report how far the current conversion has got.
+        Does nothing when the conversion is not running inside a task.
+        
+        Args:
+            stage: Name of the current step (e.g. "encoding", "extracting")
+            done: Amount of work finished in this stage
+            total: Total amount of work in this stage, if known
+            unit: Unit of done and total (e.g. "seconds", "pages", "bytes")
+        """
+        report_progress(stage, done, total, unit)
+    
+    def check_cancelled(self) -> None:
+        """
+        Stop the current conversion here if it has been cancelled.
+        Long loops that do not report progress should call this now and then.
+        
+        Raises:
+            ConversionCancelled: If the conversion has been cancelled
+        """
+        check_cancelled()
+    
+    async def _run_process(self, args: List[str]) -> None:
+        """
+        Run an external program to completion without blocking the event loop.
+        The program runs in its own session, so cancelling the conversion stops
+        it along with any processes it starts.
+        
+        Args:
+            args: Program and its arguments
+            
+        Raises:
+            FileNotFoundError: If the program is not installed
+            subprocess.CalledProcessError: If the program fails
+            ConversionCancelled: If the conversion is cancelled
+        """
+        process = await asyncio.create_subprocess_exec(
+            *args,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE,
+            start_new_session=True
+        )
+        with tracked_process(process.pid):
+            _, stderr = await process.communicate()
+        
+        if process.returncode != 0:
+            # A cancelled program exits on SIGTERM
+            check_cancelled()
+            raise subprocess.CalledProcessError(process.returncode, args, stderr=stderr)
+    
+    def _in_context(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Callable[[], Any]:
+        """
+        Wrap a call for an executor so it runs in a copy of the current context.
+        Executor threads do not inherit context variables, so without this their
+        progress reports would not reach the running task.
+        
+        Args:
+            func: Function to call
+            *args: Positional arguments for the function
+            **kwargs: Keyword arguments for the function
+            
+        Returns:
+            A callable taking no arguments
+        """
+        return functools.partial(contextvars.copy_context().run, func, *args, **kwargs)
+    
+    async def _convert_file_with_stream(
+        self,
+        file_path: str,
+        output_path: str,
+        input_format: str,
+        target_format: str
+    ) -> str:
+        """
+        Run a stream conversion between two files, for the path-based convert().
+        
+        Args:
+            file_path: Path to the file to convert
+            output_path: Path to write the output to
+            input_format: Format of the input
+            target_format: Format to convert to
+            
+        Returns:
+            Path to the converted file
+        """
+        with open(file_path, "rb") as src, open(output_path, "wb") as dst:
+            await self.convert_stream(src, dst, input_format, target_format)
+        return output_path
+    
+    async def _run_io(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Run blocking I/O-bound work of a conversion in the shared io pool, in the current context"""
+        return await self.executors.run_io(self._in_context(func, *args, **kwargs))
+    
+    async def _run_cpu(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Run CPU-bound work of a conversion in the shared cpu pool, in the current context"""
+        return await self.executors.run_cpu(self._in_context(func, *args, **kwargs))
     
     def _get_file_extension(self, file_path: str) -> str:
         """
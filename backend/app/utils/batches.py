@@ -0,0 +1,334 @@
+import io
+import os
+import json
+import time
+import logging
+import tarfile
+import zipfile
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple
+
+import redis
+
+from app.celery_worker import celery
+from app.utils.format_detection import SNIFF_BYTES
+from app.utils.output_catalog import OutputCatalog
+from app.utils.redis_client import get_redis
+from app.utils.single_flight import single_flight
+from app.utils.storage_backend import storage_backend
+
+logger = logging.getLogger(__name__)
+
+# Redis key prefix of batch manifests
+BATCH_KEY_PREFIX = "batch:"
+
+# How long a batch can be followed and downloaded; matches the default file lifetime
+BATCH_TTL_SECONDS = int(os.getenv("FILE_TTL_SECONDS", str(24 * 3600)))
+
+# Maximum number of files in one batch, uploaded or inside an archive
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "1000"))
+
+# Uploads with these extensions are expanded into one conversion per member
+ARCHIVE_EXTENSIONS = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+
+# Size of the chunks copied into the zip stream
+ZIP_CHUNK_SIZE = 1024 * 1024  # 1MB
+
+def is_archive(filename: str) -> bool:
+    """Check whether an uploaded file is an archive of files to convert"""
+    return filename.lower().endswith(ARCHIVE_EXTENSIONS)
+
+def iter_archive_members(archive_path: str) -> Iterator[Tuple[str, BinaryIO]]:
+    """
+    Iterate over the regular files in a zip or tar archive.
+    Directories, links and hidden files (including macOS resource forks) are skipped.
+
+    Args:
+        archive_path: Path to the archive
+
+    Yields:
+        Tuples of (member filename, readable file object)
+    """
+    if zipfile.is_zipfile(archive_path):
+        with zipfile.ZipFile(archive_path) as archive:
+            for info in archive.infolist():
+                name = os.path.basename(info.filename)
+                if info.is_dir() or not name or name.startswith(".") or "__MACOSX/" in info.filename:
+                    continue
+                with archive.open(info) as member:
+                    yield name, member
+    else:
+        with tarfile.open(archive_path) as archive:
+            for info in archive:
+                name = os.path.basename(info.name)
+                if not info.isfile() or not name or name.startswith("."):
+                    continue
+                member = archive.extractfile(info)
+                if member is not None:
+                    yield name, member
+
+def expand_archive(
+    file_manager,
+    archive_path: str,
+    resolve: Callable[[bytes, str], Tuple[str, str]],
+    user_id: Optional[str] = None
+) -> List[Tuple[str, str, str, str, str]]:
+    """
+    Store every file in an archive as its own upload.
+
+    Args:
+        file_manager: FileManager storing the uploads
+        archive_path: Path to the archive
+        resolve: Takes a member's first bytes and filename and returns the name to
+            store it under and its conversion type; raises to reject the member
+        user_id: Optional user ID for user-based directories
+
+    Returns:
+        List of (file_path, file_hash, unique_id, filename, conversion_type) for each member
+
+    Raises:
+        ValueError: If the archive holds no files or more than BATCH_MAX_FILES
+    """
+    uploads = []
+    try:
+        for name, member in iter_archive_members(archive_path):
+            if len(uploads) >= BATCH_MAX_FILES:
+                raise ValueError(f"The archive holds more than {BATCH_MAX_FILES} files")
+
+            # Check each member before storing it; zip and tar members can seek back
+            head = member.read(SNIFF_BYTES)
+            member.seek(0)
+            stored_name, conversion_type = resolve(head, name)
+
+            file_path, file_hash, unique_id = file_manager.save_file_object(
+                member,
+                original_filename=stored_name,
+                conversion_type=conversion_type,
+                user_id=user_id
+            )
+            uploads.append((file_path, file_hash, unique_id, name, conversion_type))
+    except BaseException:
+        for file_path, file_hash, _, _, _ in uploads:
+            file_manager.discard_upload(file_path, file_hash)
+        raise
+
+    if not uploads:
+        raise ValueError("The archive holds no files to convert")
+
+    return uploads
+
+class _ZipBuffer(io.RawIOBase):
+    """Write-only, unseekable sink that hands out what zipfile wrote since the last take()"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+def iter_zip(files: List[Tuple[str, str]], notes: Optional[str] = None) -> Iterator[bytes]:
+    """
+    Build a zip archive on the fly, without writing it anywhere first.
+    Files are stored uncompressed, since most converted formats already are compressed.
+
+    Args:
+        files: List of (name in the archive, path) to include
+        notes: Optional text added to the archive as errors.txt
+
+    Yields:
+        Consecutive chunks of the zip archive
+    """
+    buffer = _ZipBuffer()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED) as archive:
+        for arcname, path in files:
+            # Outputs stored by another node are fetched for the time they are streamed
+            fetched = not os.path.exists(path) and storage_backend.fetch(path)
+            try:
+                info = zipfile.ZipInfo(arcname, date_time=time.localtime(max(os.path.getmtime(path), 315532800))[:6])
+                info.file_size = os.path.getsize(path)
+                with open(path, "rb") as src, archive.open(info, "w") as dst:
+                    for chunk in iter(lambda: src.read(ZIP_CHUNK_SIZE), b""):
+                        dst.write(chunk)
+                        yield buffer.take()
+            except OSError as e:
+                logger.warning(f"Skipping {path} in batch zip: {str(e)}")
+            finally:
+                if fetched:
+                    os.remove(path)
+            yield buffer.take()
+
+        if notes:
+            archive.writestr("errors.txt", notes)
+    yield buffer.take()
+
+class BatchRegistry:
+    """
+    Keeps the manifest of each batch conversion: the task followed for every
+    file, so the batch's aggregate progress and outputs can be looked up by batch ID.
+    """
+
+    def __init__(self, ttl_seconds: int = BATCH_TTL_SECONDS, redis_client: Optional[redis.Redis] = None):
+        """Initialize the registry with the lifetime of its manifests"""
+        self.ttl_seconds = ttl_seconds
+        self._redis = redis_client
+        self.output_catalog = OutputCatalog(redis_client)
+
+    @property
+    def redis(self) -> redis.Redis:
+        """Redis client holding the manifests"""
+        if self._redis is None:
+            self._redis = get_redis()
+        return self._redis
+
+    def create(
+        self,
+        batch_id: str,
+        items: List[Dict[str, str]],
+        target_format: str,
+        user_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Record a new batch.
+
+        Args:
+            batch_id: ID of the batch
+            items: "task_id" and input "filename" of each conversion
+            target_format: Format the files are converted to
+            user_id: Optional ID of the user who submitted the batch
+
+        Returns:
+            The batch manifest
+        """
+        batch = {
+            "batch_id": batch_id,
+            "target_format": target_format,
+            "user_id": user_id,
+            "created_at": int(time.time()),
+            "items": items,
+        }
+        self.redis.set(f"{BATCH_KEY_PREFIX}{batch_id}", json.dumps(batch), ex=self.ttl_seconds)
+        return batch
+
+    def get(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up a batch.
+
+        Args:
+            batch_id: ID of the batch
+
+        Returns:
+            The batch manifest, or None if it is unknown or has expired
+        """
+        raw = self.redis.get(f"{BATCH_KEY_PREFIX}{batch_id}")
+        return json.loads(raw) if raw else None
+
+    def progress(self, batch: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Get the aggregate progress of a batch.
+        The states of all its tasks are read from the result backend in one round trip.
+
+        Args:
+            batch: The batch manifest
+
+        Returns:
+            Counts per status, the overall percentage and the status of each file
+        """
+        items = batch["items"]
+        # Coalesced conversions have the state of the task running them
+        subscriptions = single_flight.get_subscriptions([item["task_id"] for item in items])
+        keys = [
+            celery.backend.get_key_for_task(subscription["leader"] if subscription else item["task_id"])
+            for item, subscription in zip(items, subscriptions)
+        ]
+        raws = celery.backend.mget(keys) if keys else []
+
+        counts = {"pending": 0, "running": 0, "succeeded": 0, "failed": 0}
+        total_percent = 0.0
+        files = []
+        for item, subscription, raw in zip(items, subscriptions, raws):
+            meta = celery.backend.decode_result(raw) if raw else {"status": "PENDING", "result": None}
+            if subscription is not None and subscription["detached"]:
+                meta = {"status": "REVOKED", "result": "cancelled"}
+            status = meta["status"]
+            result = meta["result"]
+
+            file_status = {"task_id": item["task_id"], "filename": item["filename"]}
+            if status == "SUCCESS":
+                counts["succeeded"] += 1
+                total_percent += 100
+                file_status.update(status="success", download_url=f"/api/convert/download/{item['task_id']}")
+            elif status in ("FAILURE", "REVOKED"):
+                counts["failed"] += 1
+                total_percent += 100
+                file_status.update(status="failure", message=str(result))
+            elif status == "PROGRESS":
+                counts["running"] += 1
+                total_percent += (result or {}).get("percent") or 0
+                file_status.update(status="progress", progress=result)
+            elif status == "STARTED":
+                counts["running"] += 1
+                file_status.update(status="started")
+            else:
+                counts["pending"] += 1
+                file_status.update(status="pending")
+            files.append(file_status)
+
+        total = len(items)
+        complete = counts["succeeded"] + counts["failed"] == total
+        return {
+            "batch_id": batch["batch_id"],
+            "target_format": batch["target_format"],
+            "total": total,
+            **counts,
+            "percent": round(total_percent / total, 1) if total else 100.0,
+            "complete": complete,
+            "files": files,
+        }
+
+    def outputs(self, batch: Dict[str, Any], files: List[Dict[str, Any]]) -> Tuple[List[Tuple[str, str]], str]:
+        """
+        Collect the converted files of a batch for its zip archive.
+
+        Args:
+            batch: The batch manifest
+            files: Per-file statuses from progress()
+
+        Returns:
+            Tuple of (list of (name in the archive, path), text describing files left out)
+        """
+        entries = []
+        notes = []
+        used_names = set()
+        for file_status in files:
+            if file_status["status"] != "success":
+                notes.append(f"{file_status['filename']}: {file_status.get('message', file_status['status'])}")
+                continue
+
+            entry = self.output_catalog.get(file_status["task_id"])
+            if entry is None:
+                notes.append(f"{file_status['filename']}: the converted file has expired")
+                continue
+
+            # Name each output after its input, numbering duplicates
+            base = os.path.splitext(file_status["filename"])[0]
+            arcname = f"{base}.{batch['target_format']}"
+            counter = 2
+            while arcname in used_names:
+                arcname = f"{base} ({counter}).{batch['target_format']}"
+                counter += 1
+            used_names.add(arcname)
+
+            entries.append((arcname, entry["path"]))
+
+        return entries, "\n".join(notes)
+
+# Create a singleton instance
+batch_registry = BatchRegistry()
@@ -0,0 +1,241 @@
+import os
+import time
+import uuid
+import logging
+from contextlib import contextmanager
+from typing import Iterator, Optional, Tuple
+
+import redis
+
+from app.utils.file_ops import copy_file
+from app.utils.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Redis key prefix for the blob index
+BLOB_KEY_PREFIX = "blob:"
+
+# How long a blob's lock is held at most, and how long to wait for it
+BLOB_LOCK_TIMEOUT_SECONDS = 30
+
+class BlobStore:
+    """
+    Content-addressed store for uploaded files.
+    Blobs are stored once on disk under their content hash, and a Redis index shared
+    by every API and worker process tracks their size and reference count.
+    Taking the first reference on a blob and deleting an unreferenced one hold the
+    blob's lock, so a blob is never deleted between being found and being referenced.
+    """
+
+    def __init__(self, base_dir: str = os.path.join("uploads", "blobs"), redis_client: Optional[redis.Redis] = None):
+        """Initialize the blob store with its base directory"""
+        self.base_dir = base_dir
+        self.temp_dir = os.path.join(base_dir, "tmp")
+        self._redis = redis_client
+
+        os.makedirs(self.temp_dir, exist_ok=True)
+
+    @property
+    def redis(self) -> redis.Redis:
+        """Redis client holding the blob index"""
+        if self._redis is None:
+            self._redis = get_redis()
+        return self._redis
+
+    def blob_path(self, file_hash: str) -> str:
+        """Get the on-disk path of a blob"""
+        return os.path.join(self.base_dir, file_hash[:2], file_hash)
+
+    def temp_path(self, name: str) -> str:
+        """Get a staging path on the same filesystem as the blobs"""
+        return os.path.join(self.temp_dir, f"{name}.part")
+
+    def exists(self, file_hash: str) -> bool:
+        """
+        Check whether a blob is stored and indexed.
+
+        Args:
+            file_hash: Content hash of the blob
+
+        Returns:
+            True if the blob can be linked without writing it again
+        """
+        try:
+            indexed = self.redis.exists(f"{BLOB_KEY_PREFIX}{file_hash}")
+        except redis.RedisError as e:
+            logger.warning(f"Blob index unavailable: {str(e)}")
+            indexed = False
+
+        if not indexed:
+            return False
+
+        if not os.path.exists(self.blob_path(file_hash)):
+            # The blob was removed from disk behind the index's back
+            self._forget(file_hash)
+            return False
+
+        return True
+
+    @contextmanager
+    def _locked(self, file_hash: str) -> Iterator[None]:
+        """Hold a blob's lock, shared by every process, for the duration of the block"""
+        lock_key = f"{BLOB_KEY_PREFIX}{file_hash}:lock"
+        token = uuid.uuid4().hex
+        acquired = False
+        try:
+            deadline = time.monotonic() + BLOB_LOCK_TIMEOUT_SECONDS
+            while not self.redis.set(lock_key, token, nx=True, ex=BLOB_LOCK_TIMEOUT_SECONDS):
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"Timed out waiting for blob {file_hash}")
+                time.sleep(0.01)
+            acquired = True
+        except redis.RedisError as e:
+            # Without Redis there is no index to keep consistent with the disk
+            logger.warning(f"Failed to lock blob {file_hash}: {str(e)}")
+
+        try:
+            yield
+        finally:
+            if acquired:
+                def release_if_held(pipe: redis.client.Pipeline) -> None:
+                    held = pipe.get(lock_key)
+                    if held is not None and (held.decode() if isinstance(held, bytes) else held) == token:
+                        pipe.multi()
+                        pipe.delete(lock_key)
+
+                try:
+                    self.redis.transaction(release_if_held, lock_key)
+                except redis.RedisError as e:
+                    logger.warning(f"Failed to unlock blob {file_hash}: {str(e)}")
+
+    def commit(self, temp_path: str, file_hash: str) -> Tuple[str, bool]:
+        """
+        Move a fully written staging file into the store and take a reference on it.
+        If the content is already stored, the staging file is dropped instead.
+        The reference is taken before the blob is looked for on disk, under the
+        blob's lock, so it cannot be deleted in between; a blob that vanished from
+        disk is created again from the staging file.
+
+        Args:
+            temp_path: Path of the staging file
+            file_hash: Content hash of the staging file
+
+        Returns:
+            Tuple of (blob_path, created)
+        """
+        blob_path = self.blob_path(file_hash)
+        key = f"{BLOB_KEY_PREFIX}{file_hash}"
+
+        with self._locked(file_hash):
+            try:
+                self.redis.hincrby(key, "refs", 1)
+            except redis.RedisError as e:
+                logger.warning(f"Failed to reference blob {file_hash}: {str(e)}")
+
+            if os.path.exists(blob_path):
+                os.remove(temp_path)
+                return blob_path, False
+
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            os.replace(temp_path, blob_path)
+
+            try:
+                pipe = self.redis.pipeline()
+                pipe.hset(key, "size", os.path.getsize(blob_path))
+                pipe.hsetnx(key, "created_at", int(time.time()))
+                pipe.execute()
+            except redis.RedisError as e:
+                logger.warning(f"Failed to index blob {file_hash}: {str(e)}")
+
+        return blob_path, True
+
+    def link(self, file_hash: str, target_path: str) -> str:
+        """
+        Expose a blob at another path, under the reference taken by commit().
+        A hard link is used so no data is copied; a copy is only made when the
+        target is on another filesystem.
+
+        Args:
+            file_hash: Content hash of the blob
+            target_path: Path where the blob should appear
+
+        Returns:
+            Target path
+        """
+        blob_path = self.blob_path(file_hash)
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+
+        try:
+            os.link(blob_path, target_path)
+        except OSError:
+            copy_file(blob_path, target_path)
+
+        return target_path
+
+    def release(self, file_hash: str) -> int:
+        """
+        Drop a reference taken by commit().
+
+        Args:
+            file_hash: Content hash of the blob
+
+        Returns:
+            Number of references left
+        """
+        key = f"{BLOB_KEY_PREFIX}{file_hash}"
+        try:
+            with self._locked(file_hash):
+                refs = self.redis.hincrby(key, "refs", -1)
+                if refs < 0:
+                    # A reference was released twice; keep the count from drifting below zero
+                    self.redis.hset(key, "refs", 0)
+                    refs = 0
+                return refs
+        except (redis.RedisError, TimeoutError) as e:
+            logger.warning(f"Failed to release blob {file_hash}: {str(e)}")
+            return 0
+
+    def refs(self, file_hash: str) -> int:
+        """
+        Get the number of references held on a blob.
+
+        Args:
+            file_hash: Content hash of the blob
+
+        Returns:
+            Number of references
+        """
+        refs = self.redis.hget(f"{BLOB_KEY_PREFIX}{file_hash}", "refs")
+        return int(refs) if refs else 0
+
+    def delete(self, file_hash: str) -> bool:
+        """
+        Delete a blob that nothing references any more.
+
+        Args:
+            file_hash: Content hash of the blob
+
+        Returns:
+            True if the blob was deleted
+        """
+        try:
+            with self._locked(file_hash):
+                # Checked under the lock, so no reference can be taken before the file is gone
+                if self.refs(file_hash) > 0:
+                    return False
+
+                self._forget(file_hash)
+                blob_path = self.blob_path(file_hash)
+                if os.path.exists(blob_path):
+                    os.remove(blob_path)
+                return True
+        except (redis.RedisError, TimeoutError) as e:
+            logger.warning(f"Failed to delete blob {file_hash}: {str(e)}")
+            return False
+
+    def _forget(self, file_hash: str) -> None:
+        """Remove a blob from the index"""
+        try:
+            self.redis.delete(f"{BLOB_KEY_PREFIX}{file_hash}")
+        except redis.RedisError:
+            pass
@@ -0,0 +1,259 @@
+import os
+import signal
+import asyncio
+import logging
+import threading
+import contextvars
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Iterator, Optional, Set
+
+import redis
+
+from app.utils.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Redis key prefix of cancellation requests
+CANCEL_KEY_PREFIX = "cancel:"
+
+# How long a cancellation request is kept
+CANCEL_TTL_SECONDS = 24 * 3600
+
+# How often running conversions check for a cancellation request
+CANCEL_POLL_SECONDS = float(os.getenv("CANCEL_POLL_SECONDS", "1.0"))
+
+# Seconds between SIGTERM and SIGKILL for the processes of a cancelled conversion
+KILL_GRACE_SECONDS = 5.0
+
+# Token of the conversion running in the current context
+_current_token: contextvars.ContextVar[Optional["CancellationToken"]] = contextvars.ContextVar(
+    "cancellation_token", default=None
+)
+
+class ConversionCancelled(Exception):
+    """Raised inside a conversion that was cancelled"""
+
+def _terminate_group(pid: int) -> None:
+    """Send SIGTERM to a process group, then SIGKILL if it is still there after a grace period"""
+    try:
+        os.killpg(pid, signal.SIGTERM)
+    except (ProcessLookupError, PermissionError):
+        return
+
+    def kill() -> None:
+        try:
+            os.killpg(pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+    timer = threading.Timer(KILL_GRACE_SECONDS, kill)
+    timer.daemon = True
+    timer.start()
+
+class CancellationToken:
+    """
+    Cancellation state of one running conversion.
+    Subprocesses started by the conversion are registered with the token and
+    run in their own process group, so cancelling stops them and everything
+    they spawned. Code running in threads stops at its next checkpoint.
+    """
+
+    def __init__(self, conversion_id: str):
+        """Initialize the token for a conversion"""
+        self.conversion_id = conversion_id
+        self._cancelled = threading.Event()
+        self._process_groups: Set[int] = set()
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        """Whether the conversion has been cancelled"""
+        return self._cancelled.is_set()
+
+    def cancel(self) -> None:
+        """Cancel the conversion and terminate its subprocesses"""
+        with self._lock:
+            self._cancelled.set()
+            process_groups = list(self._process_groups)
+        for pid in process_groups:
+            _terminate_group(pid)
+
+    def check(self) -> None:
+        """
+        Stop here if the conversion has been cancelled.
+
+        Raises:
+            ConversionCancelled: If the conversion has been cancelled
+        """
+        if self.cancelled:
+            raise ConversionCancelled(f"Conversion {self.conversion_id} was cancelled")
+
+    def add_process(self, pid: int) -> None:
+        """
+        Register a subprocess started with start_new_session=True.
+
+        Args:
+            pid: Process ID, which is also its process group ID
+        """
+        with self._lock:
+            if not self.cancelled:
+                self._process_groups.add(pid)
+                return
+        # Started after the cancellation
+        _terminate_group(pid)
+
+    def remove_process(self, pid: int) -> None:
+        """
+        Forget a subprocess that has exited.
+
+        Args:
+            pid: Process ID
+        """
+        with self._lock:
+            self._process_groups.discard(pid)
+
+@contextmanager
+def cancellation_scope(token: CancellationToken) -> Iterator[CancellationToken]:
+    """
+    Make a token apply to everything run inside the block.
+
+    Args:
+        token: The token to use
+
+    Yields:
+        The token
+    """
+    reset = _current_token.set(token)
+    try:
+        yield token
+    finally:
+        _current_token.reset(reset)
+
+def get_cancellation_token() -> Optional[CancellationToken]:
+    """Get the token of the current context, if any"""
+    return _current_token.get()
+
+def check_cancelled() -> None:
+    """
+    Stop here if the current context's conversion has been cancelled.
+
+    Raises:
+        ConversionCancelled: If the conversion has been cancelled
+    """
+    token = _current_token.get()
+    if token is not None:
+        token.check()
+
+@contextmanager
+def tracked_process(pid: int) -> Iterator[None]:
+    """
+    Register a subprocess with the current context's token while it runs.
+
+    Args:
+        pid: Process ID of a subprocess started with start_new_session=True
+    """
+    token = _current_token.get()
+    if token is None:
+        yield
+        return
+
+    token.add_process(pid)
+    try:
+        yield
+    finally:
+        token.remove_process(pid)
+
+class CancellationRegistry:
+    """
+    Cancellation requests shared by the API and the workers.
+    The API records a request in Redis; the worker running the conversion polls
+    for it and cancels its token.
+    """
+
+    def __init__(self, redis_client: Optional[redis.Redis] = None):
+        """Initialize the registry"""
+        self._redis = redis_client
+
+    @property
+    def redis(self) -> redis.Redis:
+        """Redis client holding the cancellation requests"""
+        if self._redis is None:
+            self._redis = get_redis()
+        return self._redis
+
+    def request_cancel(self, conversion_id: str) -> None:
+        """
+        Ask for a conversion to be cancelled.
+
+        Args:
+            conversion_id: Unique ID (task ID) of the conversion
+        """
+        self.redis.set(f"{CANCEL_KEY_PREFIX}{conversion_id}", 1, ex=CANCEL_TTL_SECONDS)
+
+    def is_cancelled(self, conversion_id: str) -> bool:
+        """
+        Check whether a conversion has been asked to stop.
+
+        Args:
+            conversion_id: Unique ID (task ID) of the conversion
+
+        Returns:
+            True if a cancellation was requested
+        """
+        try:
+            return bool(self.redis.exists(f"{CANCEL_KEY_PREFIX}{conversion_id}"))
+        except redis.RedisError:
+            return False
+
+    async def watch(self, token: CancellationToken, task: asyncio.Task) -> None:
+        """
+        Poll for a cancellation request and cancel the token and task when one arrives.
+
+        Args:
+            token: Token of the running conversion
+            task: Asyncio task running the conversion
+        """
+        loop = asyncio.get_event_loop()
+        while not task.done():
+            await asyncio.sleep(CANCEL_POLL_SECONDS)
+            if await loop.run_in_executor(None, self.is_cancelled, token.conversion_id):
+                logger.info(f"Cancelling conversion {token.conversion_id}")
+                token.cancel()
+                task.cancel()
+                return
+
+    @asynccontextmanager
+    async def cancellable(self, conversion_id: str) -> AsyncIterator[CancellationToken]:
+        """
+        Run the block as a conversion that can be cancelled through the registry.
+        Cancellation interrupts the block at its next await, terminates its
+        subprocesses and stops its threads at their next checkpoint.
+
+        Args:
+            conversion_id: Unique ID (task ID) of the conversion
+
+        Yields:
+            The conversion's token
+
+        Raises:
+            ConversionCancelled: If the conversion was cancelled
+        """
+        # A conversion cancelled while it was queued does not start at all
+        loop = asyncio.get_event_loop()
+        if await loop.run_in_executor(None, self.is_cancelled, conversion_id):
+            raise ConversionCancelled(f"Conversion {conversion_id} was cancelled")
+
+        token = CancellationToken(conversion_id)
+        watcher = asyncio.ensure_future(self.watch(token, asyncio.current_task()))
+        try:
+            with cancellation_scope(token):
+                yield token
+        except asyncio.CancelledError:
+            if token.cancelled:
+                raise ConversionCancelled(f"Conversion {conversion_id} was cancelled") from None
+            raise
+        finally:
+            watcher.cancel()
+
+# Create a singleton instance
+cancellation_registry = CancellationRegistry()
@@ -0,0 +1,209 @@
+import os
+import time
+import heapq
+import logging
+import threading
+from typing import Dict, List, Mapping, NamedTuple, Optional, Set, Tuple, Type
+
+import redis
+
+from app.utils.base_converter import BaseConverter
+from app.utils.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Hash of edge -> moving average cost in seconds per MB of input
+EDGE_COST_KEY = "graph:edge_cost"
+
+# Weight of the newest measurement in the moving average
+EDGE_COST_EWMA_ALPHA = 0.2
+
+# Inputs smaller than this are measured as if they were this size, so fixed
+# start-up costs do not make small files look expensive per MB
+EDGE_COST_MIN_MB = 1.0
+
+# Added to every hop for the intermediate file it writes and reads back
+HOP_COST_SECONDS = float(os.getenv("CONVERSION_HOP_COST_SECONDS", "0.25"))
+
+# Longest route the planner considers
+MAX_ROUTE_HOPS = int(os.getenv("CONVERSION_MAX_ROUTE_HOPS", "3"))
+
+# How long measured costs are reused before they are read from Redis again
+EDGE_COST_REFRESH_SECONDS = 30.0
+
+class ConversionStep(NamedTuple):
+    """One hop of a conversion route"""
+    converter_type: str
+    input_format: str
+    output_format: str
+
+def _edge_field(step: ConversionStep) -> str:
+    """Redis hash field of an edge's cost"""
+    return f"{step.converter_type}:{step.input_format}>{step.output_format}"
+
+class ConversionGraph:
+    """
+    Graph of formats connected by the direct conversions each converter declares.
+    Every edge carries a cost, starting from its converter's prior and replaced by
+    a moving average of measured conversion times. Routes between any two formats
+    are planned over the whole graph, so they may cross converters (video to mp3
+    through wav and the audio converter) and pick up any new, faster edge.
+    """
+
+    def __init__(self, converters: Mapping[str, Type[BaseConverter]], redis_client: Optional[redis.Redis] = None):
+        """
+        Build the graph from the edges the converter classes declare.
+
+        Args:
+            converters: Converter classes by conversion type
+            redis_client: Optional Redis client holding the measured costs
+        """
+        self.converters = converters
+        self._redis = redis_client
+
+        self.edges: Dict[str, List[ConversionStep]] = {}
+        for converter_type, converter_class in converters.items():
+            for input_format, output_format in converter_class.get_conversion_edges():
+                self.edges.setdefault(input_format, []).append(
+                    ConversionStep(converter_type, input_format, output_format)
+                )
+
+        self._costs: Dict[str, float] = {}
+        self._costs_loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def redis(self) -> redis.Redis:
+        """Redis client holding the measured costs"""
+        if self._redis is None:
+            self._redis = get_redis()
+        return self._redis
+
+    def edge_cost(self, step: ConversionStep) -> float:
+        """
+        Get the cost of an edge in seconds per MB of input.
+
+        Args:
+            step: The edge
+
+        Returns:
+            The measured cost, or the converter's prior if the edge has not been measured
+        """
+        self._refresh_costs()
+        cost = self._costs.get(_edge_field(step))
+        return cost if cost is not None else self.converters[step.converter_type].edge_cost
+
+    def plan(self, input_format: str, target_format: str, input_size: Optional[int] = None) -> List[ConversionStep]:
+        """
+        Find the cheapest route from one format to another with Dijkstra's algorithm.
+        Edge costs are per MB, so they are scaled by the input's size before the
+        fixed cost of each hop is added; intermediates are assumed to be about as
+        large as the input.
+
+        Args:
+            input_format: Format of the input file
+            target_format: Format to convert to
+            input_size: Optional size of the input in bytes
+
+        Returns:
+            The steps of the route, in order
+
+        Raises:
+            ValueError: If no route of at most MAX_ROUTE_HOPS hops exists
+        """
+        input_format = input_format.lower()
+        target_format = target_format.lower()
+        if input_format == target_format:
+            raise ValueError(f"Input and output formats are the same: {input_format}")
+
+        input_mb = max(EDGE_COST_MIN_MB, (input_size or 0) / (1024 * 1024))
+
+        # Entries are (cost, tie breaker, format, route so far). A format is settled
+        # per number of hops taken to reach it, since a dearer route with fewer hops
+        # may still be the only one with hops left to reach the target
+        counter = 0
+        queue = [(0.0, counter, input_format, [])]
+        settled: Set[Tuple[str, int]] = set()
+        while queue:
+            cost, _, current, route = heapq.heappop(queue)
+            if current == target_format:
+                return route
+            if (current, len(route)) in settled or len(route) >= MAX_ROUTE_HOPS:
+                continue
+            settled.add((current, len(route)))
+
+            visited = {input_format, *(step.output_format for step in route)}
+            for step in self.edges.get(current, []):
+                if step.output_format in visited:
+                    continue
+                counter += 1
+                heapq.heappush(queue, (
+                    cost + self.edge_cost(step) * input_mb + HOP_COST_SECONDS,
+                    counter,
+                    step.output_format,
+                    route + [step]
+                ))
+
+        raise ValueError(f"Conversion from {input_format} to {target_format} is not supported")
+
+    def reachable(self, input_format: str) -> List[str]:
+        """
+        List the formats an input format can be converted to, directly or through other formats.
+
+        Args:
+            input_format: Format of the input file
+
+        Returns:
+            Sorted list of reachable formats
+        """
+        input_format = input_format.lower()
+        found = {input_format}
+        frontier = [input_format]
+        for _ in range(MAX_ROUTE_HOPS):
+            frontier = [
+                step.output_format
+                for current in frontier
+                for step in self.edges.get(current, [])
+                if step.output_format not in found
+            ]
+            found.update(frontier)
+        found.discard(input_format)
+        return sorted(found)
+
+    def record(self, step: ConversionStep, seconds: float, input_size: int) -> None:
+        """
+        Fold a measured conversion time into an edge's moving average.
+        Concurrent updates may overwrite each other, which only costs one sample.
+
+        Args:
+            step: The edge that was run
+            seconds: How long it took
+            input_size: Size of its input in bytes
+        """
+        sample = seconds / max(EDGE_COST_MIN_MB, input_size / (1024 * 1024))
+        field = _edge_field(step)
+        try:
+            raw = self.redis.hget(EDGE_COST_KEY, field)
+            cost = float(raw) if raw else sample
+            cost += EDGE_COST_EWMA_ALPHA * (sample - cost)
+            self.redis.hset(EDGE_COST_KEY, field, round(cost, 4))
+            self._costs[field] = cost
+        except redis.RedisError as e:
+            logger.warning(f"Failed to record conversion cost: {str(e)}")
+
+    def _refresh_costs(self) -> None:
+        """Reload the measured costs when the local copy is stale"""
+        now = time.monotonic()
+        if now - self._costs_loaded_at < EDGE_COST_REFRESH_SECONDS:
+            return
+        with self._lock:
+            if now - self._costs_loaded_at < EDGE_COST_REFRESH_SECONDS:
+                return
+            self._costs_loaded_at = now
+            try:
+                raw = self.redis.hgetall(EDGE_COST_KEY)
+            except redis.RedisError as e:
+                # Plan with the last known costs and the priors
+                logger.warning(f"Failed to load conversion costs: {str(e)}")
+                return
+            self._costs = {field.decode(): float(value) for field, value in raw.items()}
@@ -1,46 +1,69 @@
+import io
 import os
-import hashlib
-import aiofiles
-import asyncio
 import time
-from typing import Dict, List, Optional, Tuple, Any
-from functools import lru_cache
-from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import asyncio
+import logging
+import shutil
+import tempfile
+from contextlib import ExitStack
+from typing import Dict, List, Optional, Tuple, Any, Union
+
+from app.utils.base_converter import BaseConverter
+from app.utils.result_cache import ResultCache
+from app.utils.conversion_graph import ConversionGraph, ConversionStep
+from app.utils.converter_registry import ConverterRegistry
+from app.utils.executors import executor_service
+from app.utils.format_detection import UnrecognizedFormatError, detect_format, with_format
+from app.utils.progress import report_progress
 
-# Import all converters
-from app.convertors.text.text_converter import TextConverter
-from app.convertors.document.document_converter import DocumentConverter
-from app.convertors.image.image_converter import ImageConverter
-from app.convertors.audio.audio_converter import AudioConverter
-from app.convertors.video.video_converter import VideoConverter
-from app.convertors.compressed.compressed_converter import CompressedConverter
+logger = logging.getLogger(__name__)
 
 class ConversionHandler:
     """
     Handler for managing all file conversion operations.
-    Acts as a facade for the different converter implementations.
+    Acts as a facade for the different converter implementations, routing each
+    conversion over the cheapest chain of converters in the format graph.
     """
     
     def __init__(self):
-        """Initialize all converters"""
-        self.converters = {
-            "text": TextConverter(),
-            "document": DocumentConverter(),
-            "image": ImageConverter(),
-            "audio": AudioConverter(),
-            "video": VideoConverter(),
-            "compressed": CompressedConverter()
-        }
+        """Initialize the handler; converters are loaded when first needed"""
+        # Thread pools shared by the converters for their blocking work
+        self.executors = executor_service
+        
+        self.converters = ConverterRegistry(executors=self.executors)
+        
+        # Graph of the direct conversions of all converters, built on first use
+        self._graph: Optional[ConversionGraph] = None
         
         # Create output directory if it doesn't exist
         os.makedirs("outputs", exist_ok=True)
         
-        # Initialize cache
-        self._cache = {}
-        self._max_cache_size = 100  # Maximum number of cached conversions
+        # Semaphore limiting concurrent conversions, created on the loop that first uses it
+        self._semaphore: Optional[asyncio.Semaphore] = None
+    
+    @property
+    def graph(self) -> ConversionGraph:
+        """
+        Graph of the direct conversions of all converters, for route planning.
+        It is built from the converter classes, so no converter is created for it.
+        """
+        if self._graph is None:
+            self._graph = ConversionGraph(self.converters.classes())
+        return self._graph
+    
+    def warm_up(self, conversion_types: Optional[List[str]] = None) -> None:
+        """
+        Load converters and their dependencies ahead of their first conversion.
+        Converters of other conversion types stay unloaded until they are needed.
         
-        # Create a semaphore to limit concurrent conversions
-        self._semaphore = asyncio.Semaphore(10)  # Allow up to 10 concurrent conversions
+        Args:
+            conversion_types: Conversion types to warm up, or None for all of them
+        """
+        if conversion_types is None:
+            conversion_types = list(self.converters)
+        for conversion_type in conversion_types:
+            if conversion_type in self.converters:
+                self.converters[conversion_type].warm_up()
     
     async def convert_file(
         self, 
@@ -66,89 +89,249 @@ class ConversionHandler:
             Exception: If the conversion fails
         """
         # Use a semaphore to limit concurrent conversions
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(10)  # Allow up to 10 concurrent conversions
         async with self._semaphore:
             start_time = time.time()
             
             if conversion_type not in self.converters:
                 raise ValueError(f"Unsupported conversion type: {conversion_type}")
+            route = self.plan(file_path, target_format)
             
-            # Generate cache key
-            cache_key = await self._generate_cache_key(file_path, target_format, conversion_type)
+            logger.info(f"Converting {os.path.basename(file_path)} to {target_format} ({conversion_type}) via {self._describe_route(route)}")
+            report_progress("converting")
             
-            # Check if result is in cache
-            cached_result = self._get_cached_result(cache_key)
-            if cached_result:
-                print(f"Cache hit for {os.path.basename(file_path)} -> {target_format}")
-                return cached_result
+            # Intermediate results stay in memory between steps that work on streams;
+            # the others pass files through a scratch directory
+            work_dir = None
+            try:
+                current: Union[str, io.BytesIO] = file_path
+                for index, step in enumerate(route):
+                    converter = self.converters[step.converter_type]
+                    last_step = index == len(route) - 1
+                    in_memory = isinstance(current, io.BytesIO)
+                    
+                    if converter.supports_stream(step.input_format, step.output_format) and (in_memory or not last_step):
+                        output_path = None
+                        if last_step:
+                            output_path = converter._generate_output_path(file_path, step.output_format, output_filename)
+                        current = await self._run_stream_step(step, current, output_path)
+                        continue
+                    
+                    if work_dir is None and (in_memory or not last_step):
+                        work_dir = tempfile.mkdtemp(prefix="route_", dir="outputs")
+                    if in_memory:
+                        current = self._spill(current, os.path.join(work_dir, f"step{index}.{step.input_format}"))
+                    current = await self._run_step(
+                        step,
+                        current,
+                        output_filename if last_step else os.path.join(work_dir, f"step{index}")
+                    )
+            finally:
+                if work_dir is not None:
+                    shutil.rmtree(work_dir, ignore_errors=True)
             
-            print(f"Converting {os.path.basename(file_path)} to {target_format} ({conversion_type})")
+            end_time = time.time()
+            logger.info(f"Conversion of {os.path.basename(file_path)} completed in {end_time - start_time:.2f} seconds")
             
-            # Special case handling for text to PDF conversion
-            # This can be handled by either the text converter or document converter
-            input_format = os.path.splitext(file_path)[1][1:].lower()
-            if conversion_type == "text" and target_format == "pdf":
-                # Use document converter for PDF output
-                converter = self.converters["document"]
-            else:
-                converter = self.converters[conversion_type]
+            return current
+    
+    def plan(self, file_path: str, target_format: str) -> List[ConversionStep]:
+        """
+        Plan the cheapest chain of converters taking a file to a format.
+        
+        Args:
+            file_path: Path to the file to convert
+            target_format: Format to convert to
+            
+        Returns:
+            The steps of the route, in order
+        
+        Raises:
+            ValueError: If the file cannot be converted to the format
+        """
+        input_format = os.path.splitext(file_path)[1][1:].lower()
+        try:
+            input_size = os.path.getsize(file_path)
+        except OSError:
+            # Uploads received by another node are planned as small files
+            input_size = None
+        return self.graph.plan(input_format, target_format, input_size)
+    
+    def resolve_upload(
+        self,
+        head: bytes,
+        filename: str,
+        target_format: str,
+        conversion_type: Optional[str] = None
+    ) -> Tuple[str, str]:
+        """
+        Check an upload before it is queued and work out how it will be converted.
+        The input format is detected from the upload's first bytes, and the
+        conversion type, when not given, is that of the converter the route starts with.
+        
+        Args:
+            head: The first bytes of the upload
+            filename: Original filename of the upload
+            target_format: Format to convert to
+            conversion_type: Optional type of conversion chosen by the client
+            
+        Returns:
+            Tuple of (filename with the detected format's extension, conversion type)
+        
+        Raises:
+            UnrecognizedFormatError: If the content is not in a recognized format
+            ValueError: If the format cannot be converted to the target format
+        """
+        input_format = detect_format(head, filename)
+        if input_format is None:
+            raise UnrecognizedFormatError(f"Could not recognize the format of {filename}")
+        
+        if conversion_type is not None and conversion_type not in self.converters:
+            raise ValueError(f"Unsupported conversion type: {conversion_type}")
+        
+        route = self.graph.plan(input_format, target_format)
+        return with_format(filename, input_format), conversion_type or route[0].converter_type
+    
+    async def _run_step(self, step: ConversionStep, input_path: str, output_filename: Optional[str]) -> str:
+        """Run one step of a route and record how long it took"""
+        input_size = os.path.getsize(input_path)
+        step_start = time.time()
+        
+        output_path = await self.converters[step.converter_type].convert(
+            file_path=input_path,
+            target_format=step.output_format,
+            output_filename=output_filename
+        )
+        
+        # Measured costs steer later routes
+        await self.executors.run_io(self.graph.record, step, time.time() - step_start, input_size)
+        return output_path
+    
+    async def _run_stream_step(
+        self,
+        step: ConversionStep,
+        source: Union[str, io.BytesIO],
+        output_path: Optional[str]
+    ) -> Union[str, io.BytesIO]:
+        """
+        Run one step of a route on streams and record how long it took.
+        
+        Args:
+            step: The step to run
+            source: Path to the input file, or a buffer holding the input
+            output_path: Path to write the output to, or None to keep it in memory
             
-            # Perform the conversion
-            output_path = await converter.convert(
-                file_path=file_path,
-                target_format=target_format,
-                output_filename=output_filename
-            )
+        Returns:
+            The output path, or the buffer holding the output
+        """
+        with ExitStack() as stack:
+            if isinstance(source, io.BytesIO):
+                input_size = source.getbuffer().nbytes
+                source.seek(0)
+                src = source
+            else:
+                input_size = os.path.getsize(source)
+                src = stack.enter_context(open(source, "rb"))
+            dst = stack.enter_context(open(output_path, "wb")) if output_path else io.BytesIO()
             
-            # Cache the result
-            self._cache_result(cache_key, output_path)
+            step_start = time.time()
+            await self.converters[step.converter_type].convert_stream(src, dst, step.input_format, step.output_format)
+        
+        # Measured costs steer later routes
+        await self.executors.run_io(self.graph.record, step, time.time() - step_start, input_size)
+        return output_path or dst
+    
+    @staticmethod
+    def _spill(buffer: io.BytesIO, path: str) -> str:
+        """Write an in-memory intermediate to a file for a step that only works on files"""
+        with open(path, "wb") as file:
+            file.write(buffer.getbuffer())
+        return path
+    
+    @staticmethod
+    def _describe_route(route: List[ConversionStep]) -> str:
+        """Describe a route for logging, e.g. mp4 -video-> wav -audio-> mp3"""
+        parts = [route[0].input_format]
+        for step in route:
+            parts.append(f"-{step.converter_type}-> {step.output_format}")
+        return " ".join(parts)
+    
+    def get_converter(self, conversion_type: str, target_format: str) -> BaseConverter:
+        """
+        Get the converter of a conversion type.
+        Conversions themselves are routed over the format graph; this converter's
+        version identifies the conversion in the result cache.
+        
+        Args:
+            conversion_type: Type of conversion (text, document, image, etc.)
+            target_format: Format to convert to
             
-            end_time = time.time()
-            print(f"Conversion of {os.path.basename(file_path)} completed in {end_time - start_time:.2f} seconds")
+        Returns:
+            The converter instance
+        
+        Raises:
+            ValueError: If the conversion type is not supported
+        """
+        if conversion_type not in self.converters:
+            raise ValueError(f"Unsupported conversion type: {conversion_type}")
+        
+        return self.converters[conversion_type]
+    
+    def get_cache_key(
+        self,
+        file_path: str,
+        file_hash: str,
+        target_format: str,
+        options: Optional[Dict[str, Any]] = None
+    ) -> str:
+        """
+        Get the result cache key for a conversion.
+        The key includes the version of every converter on the route that would
+        run it, so bumping any of their versions invalidates the cached outputs.
+        
+        Args:
+            file_path: Path to the file to convert
+            file_hash: Full-content hash of the input file
+            target_format: Format to convert to
+            options: Optional conversion options
             
-            return output_path
+        Returns:
+            Cache key for the result cache
+        
+        Raises:
+            ValueError: If the file cannot be converted to the format
+        """
+        route = self.plan(file_path, target_format)
+        converter_classes = [self.converters.get_class(step.converter_type) for step in route]
+        return ResultCache.make_key(
+            file_hash,
+            target_format,
+            [(converter_class.__name__, converter_class.version) for converter_class in converter_classes],
+            options
+        )
     
     def get_supported_formats(self) -> Dict[str, Dict[str, List[str]]]:
         """
         Get a dictionary of supported input and output formats for each conversion type.
+        Output formats include those reached through other converters.
         
         Returns:
             Dictionary with conversion types as keys and dictionaries of input/output formats as values
         """
         supported_formats = {}
         
-        for conversion_type, converter in self.converters.items():
+        for conversion_type, converter_class in self.converters.classes().items():
+            input_formats = converter_class.get_supported_input_formats()
+            output_formats = set()
+            for input_format in input_formats:
+                output_formats.update(self.graph.reachable(input_format))
             supported_formats[conversion_type] = {
-                "input_formats": converter.get_supported_input_formats(),
-                "output_formats": converter.get_supported_output_formats()
+                "input_formats": input_formats,
+                "output_formats": sorted(output_formats)
             }
         
         return supported_formats
-        
-    async def _generate_cache_key(self, file_path: str, target_format: str, conversion_type: str) -> str:
-        """Generate a unique cache key based on file content and conversion parameters"""
-        # Read file content for hashing
-        async with aiofiles.open(file_path, "rb") as f:
-            # Read first 1MB of file for hash to avoid reading large files entirely
-            content = await f.read(1024 * 1024)
-            
-        # Create hash from file content and conversion parameters
-        hash_obj = hashlib.md5()
-        hash_obj.update(content)
-        hash_obj.update(target_format.encode())
-        hash_obj.update(conversion_type.encode())
-        
-        return hash_obj.hexdigest()
-        
-    def _get_cached_result(self, cache_key: str) -> Optional[str]:
-        """Get cached conversion result if available"""
-        return self._cache.get(cache_key)
-        
-    def _cache_result(self, cache_key: str, output_path: str) -> None:
-        """Cache conversion result"""
-        # Implement LRU cache behavior manually
-        if len(self._cache) >= self._max_cache_size:
-            # Remove oldest item (first key)
-            oldest_key = next(iter(self._cache))
-            del self._cache[oldest_key]
-            
-        self._cache[cache_key] = output_path 
\ No newline at end of file
+
+# Shared by the API and the workers of a process, so converters load once per process
+conversion_handler = ConversionHandler()
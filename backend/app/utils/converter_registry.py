@@ -0,0 +1,110 @@
+import time
+import logging
+import importlib
+import threading
+from collections.abc import Mapping
+from typing import Dict, Iterator, List, Optional, Type
+
+from app.utils.base_converter import BaseConverter
+from app.utils.executors import ExecutorService
+
+logger = logging.getLogger(__name__)
+
+# Converter classes by conversion type, as "module:class". A module is imported
+# the first time its conversion type is needed, and its heavy dependencies
+# (moviepy, pydub, reportlab, ...) only when a conversion or warm_up() uses them
+CONVERTER_CLASSES = {
+    "text": "app.convertors.text.text_converter:TextConverter",
+    "document": "app.convertors.document.document_converter:DocumentConverter",
+    "image": "app.convertors.image.image_converter:ImageConverter",
+    "audio": "app.convertors.audio.audio_converter:AudioConverter",
+    "video": "app.convertors.video.video_converter:VideoConverter",
+    "compressed": "app.convertors.compressed.compressed_converter:CompressedConverter",
+}
+
+class ConverterRegistry(Mapping):
+    """
+    Converters by conversion type, each loaded the first time it is looked up.
+    Iterating over the registry or checking a type with `in` does not load anything,
+    so processes that never run a conversion type never import its converter.
+    Converter classes can be looked up without creating the converter, for what
+    they declare on the class (formats, conversion edges, costs and versions).
+    """
+
+    def __init__(
+        self,
+        converter_classes: Optional[Dict[str, str]] = None,
+        executors: Optional[ExecutorService] = None
+    ):
+        """
+        Initialize the registry.
+
+        Args:
+            converter_classes: Converter classes by conversion type, as "module:class"
+                (CONVERTER_CLASSES by default)
+            executors: Thread pools handed to every converter (the shared ones by default)
+        """
+        self.converter_classes = dict(converter_classes or CONVERTER_CLASSES)
+        self.executors = executors
+        self._classes: Dict[str, Type[BaseConverter]] = {}
+        self._converters: Dict[str, BaseConverter] = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, conversion_type: str) -> BaseConverter:
+        converter = self._converters.get(conversion_type)
+        if converter is None:
+            converter = self._load(conversion_type)
+        return converter
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.converter_classes)
+
+    def __len__(self) -> int:
+        return len(self.converter_classes)
+
+    def __contains__(self, conversion_type: object) -> bool:
+        return conversion_type in self.converter_classes
+
+    def loaded(self) -> List[str]:
+        """Get the conversion types whose converters have been loaded"""
+        return list(self._converters)
+
+    def get_class(self, conversion_type: str) -> Type[BaseConverter]:
+        """
+        Get the converter class of a conversion type without creating the converter.
+        Only the converter's module is imported, not its heavy dependencies.
+
+        Args:
+            conversion_type: Type of conversion (text, document, image, etc.)
+
+        Returns:
+            The converter class
+
+        Raises:
+            KeyError: If the conversion type is unknown
+        """
+        converter_class = self._classes.get(conversion_type)
+        if converter_class is None:
+            module_name, class_name = self.converter_classes[conversion_type].split(":")
+            converter_class = getattr(importlib.import_module(module_name), class_name)
+            self._classes[conversion_type] = converter_class
+        return converter_class
+
+    def classes(self) -> Dict[str, Type[BaseConverter]]:
+        """Get the converter classes of all conversion types, by conversion type"""
+        return {conversion_type: self.get_class(conversion_type) for conversion_type in self.converter_classes}
+
+    def _load(self, conversion_type: str) -> BaseConverter:
+        """Import and create the converter of a conversion type"""
+        # Threadpool requests and the fast path can ask for the same converter at once
+        with self._lock:
+            converter = self._converters.get(conversion_type)
+            if converter is not None:
+                return converter
+
+            start_time = time.time()
+            converter = self.get_class(conversion_type)(executors=self.executors)
+            logger.info(f"Loaded the {conversion_type} converter in {time.time() - start_time:.3f} seconds")
+
+            self._converters[conversion_type] = converter
+            return converter
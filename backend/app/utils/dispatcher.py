@@ -0,0 +1,117 @@
+import os
+import asyncio
+import logging
+import functools
+from concurrent.futures import Executor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional, Tuple
+
+from app.tasks import conversion_handler, file_manager, run_conversion_inline, submit_conversion_task
+from app.utils.single_flight import single_flight
+from app.utils.task_results import task_result_waiter
+
+logger = logging.getLogger(__name__)
+
+# Set to 0 to send every conversion through Celery
+FAST_PATH_ENABLED = os.getenv("FAST_PATH_ENABLED", "1") == "1"
+
+# Largest inputs converted in the API process, per conversion type; other types always go to Celery
+FAST_PATH_MAX_BYTES = {
+    "text": int(os.getenv("FAST_PATH_TEXT_MAX_BYTES", str(1024 * 1024))),  # 1MB
+    "image": int(os.getenv("FAST_PATH_IMAGE_MAX_BYTES", str(2 * 1024 * 1024))),  # 2MB
+}
+
+# Targets that are slow to produce even from small inputs
+FAST_PATH_EXCLUDED_TARGETS = {"pdf"}
+
+def init_fast_path_process() -> None:
+    """Warm the converters of the fast path in a new process pool process"""
+    conversion_handler.warm_up(list(FAST_PATH_MAX_BYTES))
+
+def is_fast_path(conversion_type: str, target_format: str, file_size: int) -> bool:
+    """
+    Predict whether a conversion is cheap enough to run in the API process.
+
+    Args:
+        conversion_type: Type of conversion
+        target_format: Format to convert to
+        file_size: Size of the input file in bytes
+
+    Returns:
+        True if the conversion should skip the Celery round trip
+    """
+    if not FAST_PATH_ENABLED or target_format.lower() in FAST_PATH_EXCLUDED_TARGETS:
+        return False
+    max_bytes = FAST_PATH_MAX_BYTES.get(conversion_type)
+    return max_bytes is not None and file_size <= max_bytes
+
+async def convert_and_wait(
+    executor: Optional[Executor],
+    file_path: str,
+    target_format: str,
+    conversion_type: str,
+    output_filename: str,
+    file_hash: str,
+    unique_id: str,
+    user_id: Optional[str] = None,
+    timeout: float = 300
+) -> Tuple[str, str]:
+    """
+    Convert a file and wait for the result, choosing where the conversion runs.
+    Cheap conversions run directly in the API's process pool; everything else,
+    or anything the pool cannot take, is queued on Celery.
+
+    Args:
+        executor: The API's process pool, or None to always use Celery
+        file_path: Path to the file to convert
+        target_format: Format to convert to
+        conversion_type: Type of conversion
+        output_filename: Custom filename for the output file
+        file_hash: Hash of the input file for deduplication
+        unique_id: Unique ID for the conversion
+        user_id: Optional user ID for user-based directories
+        timeout: Seconds to wait for the result
+
+    Returns:
+        Tuple of (output path, result ID)
+
+    Raises:
+        TimeoutError: If the conversion does not finish in time
+        Exception: If the conversion fails
+    """
+    conversion = {
+        "file_path": file_path,
+        "target_format": target_format,
+        "conversion_type": conversion_type,
+        "output_filename": output_filename,
+        "file_hash": file_hash,
+        "unique_id": unique_id,
+        "user_id": user_id,
+    }
+    loop = asyncio.get_event_loop()
+
+    if executor is not None and is_fast_path(conversion_type, target_format, os.path.getsize(file_path)):
+        try:
+            output_path = await asyncio.wait_for(
+                loop.run_in_executor(executor, functools.partial(run_conversion_inline, **conversion)),
+                timeout
+            )
+            return output_path, unique_id
+        except BrokenProcessPool as e:
+            # A crashed pool process takes the pool down; the workers can still do the job
+            logger.warning(f"Process pool unavailable, queueing conversion {unique_id}: {str(e)}")
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"Conversion {unique_id} did not finish within {timeout} seconds")
+
+    task = await loop.run_in_executor(None, functools.partial(submit_conversion_task, **conversion))
+
+    # A coalesced conversion finishes with the task it subscribed to, which
+    # registers this request's own copy of the output before it completes
+    leader_id = await loop.run_in_executor(None, single_flight.leader_of, task.id)
+    output_path = await task_result_waiter.wait(leader_id, timeout=timeout)
+    if leader_id != task.id:
+        entry = await loop.run_in_executor(None, file_manager.output_catalog.get, task.id)
+        if entry is None:
+            raise Exception(f"Conversion {task.id} was cancelled")
+        output_path = entry["path"]
+    return output_path, task.id
@@ -0,0 +1,148 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+CPU_COUNT = os.cpu_count() or 1
+
+# Threads for blocking work that mostly waits on disks, sockets or subprocesses
+IO_EXECUTOR_THREADS = int(os.getenv("IO_EXECUTOR_THREADS", str(min(32, CPU_COUNT * 4))))
+
+# Threads for work that keeps a core busy (image codecs, compression, encoding);
+# more threads than cores only makes concurrent conversions fight over them
+CPU_EXECUTOR_THREADS = int(os.getenv("CPU_EXECUTOR_THREADS", str(CPU_COUNT)))
+
+# Jobs that wait longer than this for a thread are logged, as a sign the pool is saturated
+EXECUTOR_WAIT_WARN_SECONDS = float(os.getenv("EXECUTOR_WAIT_WARN_SECONDS", "5"))
+
+def _empty_stats() -> Dict[str, float]:
+    """Create the counters of one pool"""
+    return {"submitted": 0, "started": 0, "completed": 0, "wait_total": 0.0, "wait_max": 0.0}
+
+class ExecutorService:
+    """
+    Shared, bounded thread pools for the blocking parts of conversions.
+    Converters hand work to the "io" or "cpu" pool instead of creating a pool per
+    call, so threads are reused and the conversions running in a process never
+    have more CPU-bound threads between them than the cpu pool holds. Work beyond
+    that waits in the pool's queue, and the time it waits is measured.
+    """
+
+    def __init__(self, io_threads: int = IO_EXECUTOR_THREADS, cpu_threads: int = CPU_EXECUTOR_THREADS):
+        """Initialize the service; each pool is created on first use"""
+        self.sizes = {"io": io_threads, "cpu": cpu_threads}
+        self._pools: Dict[str, ThreadPoolExecutor] = {}
+        self._stats = {kind: _empty_stats() for kind in self.sizes}
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def get_executor(self, kind: str) -> ThreadPoolExecutor:
+        """
+        Get one of the pools, creating it on first use.
+        Pools belong to a process: a forked worker does not inherit the threads of
+        its parent, so pools created before the fork are replaced.
+
+        Args:
+            kind: "io" or "cpu"
+
+        Returns:
+            The pool
+
+        Raises:
+            ValueError: If the kind of pool is unknown
+        """
+        if kind not in self.sizes:
+            raise ValueError(f"Unknown executor: {kind}")
+
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pools = {}
+                self._stats = {name: _empty_stats() for name in self.sizes}
+                self._pid = os.getpid()
+
+            pool = self._pools.get(kind)
+            if pool is None:
+                pool = ThreadPoolExecutor(max_workers=self.sizes[kind], thread_name_prefix=f"{kind}-executor")
+                self._pools[kind] = pool
+            return pool
+
+    async def run(self, kind: str, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """
+        Run a blocking function in one of the pools without blocking the event loop.
+
+        Args:
+            kind: "io" or "cpu"
+            func: Function to call
+            *args: Positional arguments for the function
+            **kwargs: Keyword arguments for the function
+
+        Returns:
+            The function's result
+        """
+        executor = self.get_executor(kind)
+        stats = self._stats[kind]
+        submitted_at = time.monotonic()
+        with self._lock:
+            stats["submitted"] += 1
+
+        def timed() -> Any:
+            wait = time.monotonic() - submitted_at
+            with self._lock:
+                stats["started"] += 1
+                stats["wait_total"] += wait
+                stats["wait_max"] = max(stats["wait_max"], wait)
+            if wait > EXECUTOR_WAIT_WARN_SECONDS:
+                logger.warning(f"A job waited {wait:.1f} seconds for a {kind} thread")
+
+            try:
+                return func(*args, **kwargs)
+            finally:
+                with self._lock:
+                    stats["completed"] += 1
+
+        return await asyncio.get_event_loop().run_in_executor(executor, timed)
+
+    async def run_io(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Run blocking I/O-bound work in the io pool"""
+        return await self.run("io", func, *args, **kwargs)
+
+    async def run_cpu(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Run CPU-bound work in the cpu pool"""
+        return await self.run("cpu", func, *args, **kwargs)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Get the size, load and queue wait times of each pool in this process.
+
+        Returns:
+            Dictionary with the pool kinds as keys
+        """
+        with self._lock:
+            result = {}
+            for kind, stats in self._stats.items():
+                started = stats["started"]
+                result[kind] = {
+                    "threads": self.sizes[kind],
+                    "queued": stats["submitted"] - started,
+                    "running": started - stats["completed"],
+                    "completed": stats["completed"],
+                    "average_wait_seconds": round(stats["wait_total"] / started, 4) if started else 0.0,
+                    "max_wait_seconds": round(stats["wait_max"], 4)
+                }
+            return result
+
+    def shutdown(self) -> None:
+        """Shut the pools down, e.g. when the process stops; they are recreated if used again"""
+        with self._lock:
+            pools = list(self._pools.values())
+            self._pools = {}
+        for pool in pools:
+            pool.shutdown(wait=False)
+
+# Create a singleton instance
+executor_service = ExecutorService()
@@ -0,0 +1,98 @@
+import time
+import logging
+from typing import List, Optional, Tuple
+
+import redis
+
+from app.utils.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Sorted set of path -> expiry timestamp
+EXPIRY_INDEX_KEY = "expiry:index"
+
+# Hash of path -> what the path is ("file", "upload:<hash>" or "blob:<hash>")
+EXPIRY_META_KEY = "expiry:meta"
+
+class ExpiryIndex:
+    """
+    Index of stored files and when they expire.
+    Files are registered when they are created, so cleanup only has to look at the
+    entries that are due instead of walking every stored file.
+    """
+
+    def __init__(self, redis_client: Optional[redis.Redis] = None):
+        """Initialize the expiry index"""
+        self._redis = redis_client
+
+    @property
+    def redis(self) -> redis.Redis:
+        """Redis client holding the index"""
+        if self._redis is None:
+            self._redis = get_redis()
+        return self._redis
+
+    def schedule(self, path: str, ttl_seconds: int, kind: str = "file") -> None:
+        """
+        Register a file for deletion, or move its deletion time if it is already registered.
+
+        Args:
+            path: Path to the file
+            ttl_seconds: Seconds from now until the file expires
+            kind: "file", "upload:<blob hash>" or "blob:<blob hash>"
+        """
+        try:
+            pipe = self.redis.pipeline()
+            pipe.zadd(EXPIRY_INDEX_KEY, {path: time.time() + ttl_seconds})
+            pipe.hset(EXPIRY_META_KEY, path, kind)
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Failed to schedule expiry of {path}: {str(e)}")
+
+    def cancel(self, path: str) -> None:
+        """
+        Remove a file from the index.
+
+        Args:
+            path: Path to the file
+        """
+        try:
+            pipe = self.redis.pipeline()
+            pipe.zrem(EXPIRY_INDEX_KEY, path)
+            pipe.hdel(EXPIRY_META_KEY, path)
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Failed to cancel expiry of {path}: {str(e)}")
+
+    def pop_expired(self, now: Optional[float] = None, limit: int = 500) -> List[Tuple[str, str]]:
+        """
+        Claim entries whose expiry time has passed.
+        Each entry is handed to exactly one caller, even with several cleanup
+        workers running at once.
+
+        Args:
+            now: Current timestamp, defaults to time.time()
+            limit: Maximum number of entries to claim
+
+        Returns:
+            List of (path, kind) tuples
+        """
+        now = time.time() if now is None else now
+        candidates = self.redis.zrangebyscore(EXPIRY_INDEX_KEY, "-inf", now, start=0, num=limit)
+
+        claimed = []
+        for member in candidates:
+            # Only the caller whose ZREM succeeds owns the entry
+            if not self.redis.zrem(EXPIRY_INDEX_KEY, member):
+                continue
+            pipe = self.redis.pipeline()
+            pipe.hget(EXPIRY_META_KEY, member)
+            pipe.hdel(EXPIRY_META_KEY, member)
+            kind, _ = pipe.execute()
+            claimed.append((member.decode("utf-8"), kind.decode("utf-8") if kind else "file"))
+
+        return claimed
+
+    def size(self) -> int:
+        """Get the number of files waiting to expire"""
+        return self.redis.zcard(EXPIRY_INDEX_KEY)
@@ -0,0 +1,165 @@
+import os
+import signal
+import asyncio
+from typing import List, Optional
+
+from app.utils.cancellation import check_cancelled, tracked_process
+from app.utils.progress import report_progress
+
+async def probe_duration(file_path: str) -> Optional[float]:
+    """
+    Get the duration of a media file with ffprobe.
+
+    Args:
+        file_path: Path to the media file
+
+    Returns:
+        Duration in seconds, or None if it cannot be determined
+    """
+    try:
+        process = await asyncio.create_subprocess_exec(
+            "ffprobe",
+            "-v", "error",
+            "-show_entries", "format=duration",
+            "-of", "default=noprint_wrappers=1:nokey=1",
+            file_path,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL
+        )
+    except FileNotFoundError:
+        return None
+
+    stdout, _ = await process.communicate()
+    try:
+        return float(stdout.strip())
+    except ValueError:
+        return None
+
+async def run_ffmpeg(args: List[str], duration: Optional[float] = None, stage: str = "encoding") -> None:
+    """
+    Run ffmpeg and report its progress from the -progress output.
+    ffmpeg runs in its own session, so cancelling the conversion stops it.
+
+    Args:
+        args: ffmpeg arguments (inputs, options and output)
+        duration: Duration of the input in seconds, used to compute the percentage
+        stage: Stage name reported with the progress
+
+    Raises:
+        ConversionCancelled: If the conversion is cancelled
+        Exception: If ffmpeg fails
+    """
+    command = ["ffmpeg", "-hide_banner", "-nostats", "-progress", "pipe:1", *args]
+
+    process = await asyncio.create_subprocess_exec(
+        *command,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        start_new_session=True
+    )
+
+    with tracked_process(process.pid):
+        # Drain stderr alongside stdout so a full pipe never stalls ffmpeg
+        stderr_task = asyncio.ensure_future(process.stderr.read())
+
+        try:
+            report_progress(stage, 0, duration, "seconds")
+            async for raw_line in process.stdout:
+                key, _, value = raw_line.decode("utf-8", errors="replace").strip().partition("=")
+                if key == "out_time_us" or key == "out_time_ms":
+                    # Both keys are in microseconds
+                    try:
+                        position = int(value) / 1_000_000
+                    except ValueError:
+                        continue
+                    report_progress(stage, min(position, duration) if duration else position, duration, "seconds")
+                elif key == "progress" and value == "end":
+                    report_progress(stage, duration, duration, "seconds")
+
+            returncode = await process.wait()
+            stderr = await stderr_task
+        finally:
+            # If progress reporting or the task itself was interrupted, ffmpeg is
+            # still running: stop it and reap it rather than leaving it behind
+            if process.returncode is None:
+                try:
+                    os.killpg(process.pid, signal.SIGKILL)
+                except (ProcessLookupError, PermissionError):
+                    pass
+                await process.wait()
+            if not stderr_task.done():
+                stderr_task.cancel()
+                try:
+                    await stderr_task
+                except asyncio.CancelledError:
+                    pass
+
+    if returncode != 0:
+        # A cancelled ffmpeg exits on SIGTERM
+        check_cancelled()
+        message = stderr.decode("utf-8", errors="replace").strip()[-500:]
+        raise Exception(f"ffmpeg exited with code {returncode}: {message}")
+
+async def _probe(file_path: str, *args: str) -> List[str]:
+    """Run ffprobe on a file and return the non-empty lines it prints"""
+    try:
+        process = await asyncio.create_subprocess_exec(
+            "ffprobe",
+            "-v", "error",
+            *args,
+            file_path,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL
+        )
+    except FileNotFoundError:
+        return []
+
+    stdout, _ = await process.communicate()
+    return [line.strip() for line in stdout.decode("utf-8", errors="replace").splitlines() if line.strip()]
+
+async def probe_keyframes(file_path: str) -> List[float]:
+    """
+    Get the timestamps of the keyframes in a file's first video stream.
+    Only packet headers are read, so nothing is decoded.
+
+    Args:
+        file_path: Path to the video file
+
+    Returns:
+        Sorted keyframe timestamps in seconds
+    """
+    lines = await _probe(
+        file_path,
+        "-select_streams", "v:0",
+        "-show_entries", "packet=pts_time,flags",
+        "-of", "csv=p=0"
+    )
+
+    keyframes = []
+    for line in lines:
+        pts_time, _, flags = line.partition(",")
+        if "K" not in flags:
+            continue
+        try:
+            keyframes.append(float(pts_time))
+        except ValueError:
+            continue
+    return sorted(keyframes)
+
+async def has_audio_stream(file_path: str) -> bool:
+    """
+    Check whether a media file has an audio stream.
+
+    Args:
+        file_path: Path to the media file
+
+    Returns:
+        True if the file has at least one audio stream
+    """
+    lines = await _probe(
+        file_path,
+        "-select_streams", "a",
+        "-show_entries", "stream=index",
+        "-of", "csv=p=0"
+    )
+    return bool(lines)
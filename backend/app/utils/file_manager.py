@@ -1,12 +1,56 @@
 import os
 import uuid
+import asyncio
 import hashlib
+import functools
 from datetime import datetime
-from typing import Optional, Tuple, Dict, Any
-import shutil
-import aiofiles
+from typing import AsyncIterator, BinaryIO, Optional, Tuple, Dict, Any
 from fastapi import UploadFile
 
+from app.utils.blob_store import BlobStore
+from app.utils.expiry_index import ExpiryIndex
+from app.utils.output_catalog import OutputCatalog
+from app.utils.redis_client import get_redis
+from app.utils.result_cache import result_cache
+from app.utils.storage_backend import storage_backend
+from app.utils.storage_governor import storage_governor
+from app.utils import file_ops
+
+# How long uploaded and converted files are kept
+FILE_TTL_SECONDS = int(os.getenv("FILE_TTL_SECONDS", str(24 * 3600)))
+
+# How long a blob is kept for deduplication after its last upload expires
+BLOB_TTL_SECONDS = int(os.getenv("BLOB_TTL_SECONDS", str(24 * 3600)))
+
+# Redis key prefix for memoized content hashes of stored files
+CONTENT_HASH_KEY_PREFIX = "content_hash:"
+
+# Size of the chunks used when streaming files to and from disk
+CHUNK_SIZE = 1024 * 1024  # 1MB
+
+# BLAKE2b with a 16 byte digest keeps hex hashes the same length as MD5 ones
+HASH_DIGEST_SIZE = 16
+
+def new_content_hasher():
+    """Create a hash object for identifying file content"""
+    return hashlib.blake2b(digest_size=HASH_DIGEST_SIZE)
+
+def hash_file(file_path: str) -> str:
+    """
+    Hash the full content of a file on disk.
+    
+    Args:
+        file_path: Path to the file
+        
+    Returns:
+        Hex digest of the file content
+    """
+    hash_obj = new_content_hasher()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            hash_obj.update(chunk)
+    return hash_obj.hexdigest()
+
 class FileManager:
     """
     Manages file storage with a structured directory system and unique identifiers.
@@ -22,14 +66,29 @@ class FileManager:
         os.makedirs(self.base_upload_dir, exist_ok=True)
         os.makedirs(self.base_output_dir, exist_ok=True)
         
-        # Cache for file hashes to enable deduplication
-        self.file_hash_cache: Dict[str, str] = {}
+        # Content-addressed store shared by every process for deduplication
+        self.blob_store = BlobStore(os.path.join(self.base_upload_dir, "blobs"))
+        
+        # Index of when stored files expire, used by the cleanup task
+        self.expiry_index = ExpiryIndex()
+        
+        # Catalog of converted files by result ID
+        self.output_catalog = OutputCatalog()
+        
+        # Where files are shared with other nodes (no-op for a shared local volume)
+        self.backend = storage_backend
+        
+        # Disk usage accounting and eviction when a store is over budget
+        self.storage = storage_governor
+        self.storage.register_evictor("uploads", self._evict_blob)
+        self.storage.register_evictor("outputs", self._evict_output)
     
     async def save_uploaded_file(
         self, 
         file: UploadFile, 
         conversion_type: str,
-        user_id: Optional[str] = None
+        user_id: Optional[str] = None,
+        original_filename: Optional[str] = None
     ) -> Tuple[str, str, str]:
         """
         Save an uploaded file using a structured directory system.
@@ -38,6 +97,36 @@ class FileManager:
             file: The uploaded file
             conversion_type: Type of conversion (used for categorization)
             user_id: Optional user ID for user-based directories
+            original_filename: Name to store the file under instead of the uploaded
+                filename, e.g. with the extension of its detected format
+            
+        Returns:
+            Tuple of (file_path, file_hash, unique_id)
+        """
+        return await self.save_stream(
+            chunks=self._iter_upload(file),
+            original_filename=original_filename or file.filename,
+            conversion_type=conversion_type,
+            user_id=user_id
+        )
+    
+    async def save_stream(
+        self,
+        chunks: AsyncIterator[bytes],
+        original_filename: str,
+        conversion_type: str,
+        user_id: Optional[str] = None
+    ) -> Tuple[str, str, str]:
+        """
+        Save a stream of bytes, such as a raw request body, as an uploaded file.
+        The data is written straight to its staging file descriptor and hashed on
+        the way, without being spooled anywhere first.
+        
+        Args:
+            chunks: Async iterator over the file content
+            original_filename: Original filename
+            conversion_type: Type of conversion (used for categorization)
+            user_id: Optional user ID for user-based directories
             
         Returns:
             Tuple of (file_path, file_hash, unique_id)
@@ -45,6 +134,118 @@ class FileManager:
         # Generate a unique ID
         unique_id = str(uuid.uuid4())
         
+        # Stream into the blob store, hashing the full content as it is written
+        temp_path = self.blob_store.temp_path(unique_id)
+        hash_obj = new_content_hasher()
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            await file_ops.StreamWriter(fd, hash_obj).write_from(chunks)
+        except BaseException:
+            os.close(fd)
+            os.remove(temp_path)
+            raise
+        os.close(fd)
+        
+        file_hash = hash_obj.hexdigest()
+        
+        # Committing talks to Redis and the storage backend, so keep it off the event loop
+        try:
+            file_path = await asyncio.get_event_loop().run_in_executor(
+                None,
+                functools.partial(
+                    self.store_staged_file,
+                    temp_path=temp_path,
+                    file_hash=file_hash,
+                    original_filename=os.path.basename(original_filename),
+                    conversion_type=conversion_type,
+                    unique_id=unique_id,
+                    user_id=user_id
+                )
+            )
+        except BaseException:
+            # A staging file that was not committed would otherwise stay behind
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        
+        return file_path, file_hash, unique_id
+    
+    def save_file_object(
+        self,
+        fileobj: BinaryIO,
+        original_filename: str,
+        conversion_type: str,
+        user_id: Optional[str] = None
+    ) -> Tuple[str, str, str]:
+        """
+        Save the content of a readable binary file, such as an archive member, as an uploaded file.
+        
+        Args:
+            fileobj: File object to read from
+            original_filename: Original filename
+            conversion_type: Type of conversion (used for categorization)
+            user_id: Optional user ID for user-based directories
+            
+        Returns:
+            Tuple of (file_path, file_hash, unique_id)
+        """
+        # Generate a unique ID
+        unique_id = str(uuid.uuid4())
+        
+        # Copy into the blob store, hashing the full content as it is written
+        temp_path = self.blob_store.temp_path(unique_id)
+        hash_obj = new_content_hasher()
+        try:
+            with open(temp_path, "wb") as f:
+                for chunk in iter(lambda: fileobj.read(CHUNK_SIZE), b""):
+                    hash_obj.update(chunk)
+                    f.write(chunk)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        
+        file_hash = hash_obj.hexdigest()
+        try:
+            file_path = self.store_staged_file(
+                temp_path=temp_path,
+                file_hash=file_hash,
+                original_filename=os.path.basename(original_filename),
+                conversion_type=conversion_type,
+                unique_id=unique_id,
+                user_id=user_id
+            )
+        except BaseException:
+            # A staging file that was not committed would otherwise stay behind
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        
+        return file_path, file_hash, unique_id
+    
+    def store_staged_file(
+        self,
+        temp_path: str,
+        file_hash: str,
+        original_filename: str,
+        conversion_type: str,
+        unique_id: str,
+        user_id: Optional[str] = None
+    ) -> str:
+        """
+        Commit a fully written staging file and give it a structured upload path.
+        
+        Args:
+            temp_path: Staging path from the blob store
+            file_hash: Full-content hash of the staged file
+            original_filename: Original filename
+            conversion_type: Type of conversion (used for categorization)
+            unique_id: Unique ID for the upload
+            user_id: Optional user ID for user-based directories
+            
+        Returns:
+            Path to the uploaded file
+        """
         # Create date-based directory structure
         today = datetime.now()
         year_month_day = f"{today.year}/{today.month:02d}/{today.day:02d}"
@@ -69,41 +270,248 @@ class FileManager:
         # Create the directory if it doesn't exist
         os.makedirs(dir_path, exist_ok=True)
         
-        # Get original filename and extension
-        original_filename = file.filename
+        # Get filename without extension
         filename_without_ext, file_ext = os.path.splitext(original_filename)
         
-        # Calculate file hash for deduplication
-        file_content = await file.read(1024 * 1024)  # Read first MB for hash
-        await file.seek(0)  # Reset file position
-        
-        hash_obj = hashlib.md5()
-        hash_obj.update(file_content)
-        file_hash = hash_obj.hexdigest()
-        
-        # Check if we already have this file
-        if file_hash in self.file_hash_cache:
-            # Return the existing file path
-            return self.file_hash_cache[file_hash], file_hash, unique_id
+        # Keep the blob, or drop the copy if any process already stored the same content;
+        # either way the upload now holds a reference on the blob
+        blob_path, created = self.blob_store.commit(temp_path, file_hash)
+        if created:
+            self.backend.publish(blob_path)
+            self.storage.track(blob_path, "uploads", evictable=False)
+        else:
+            # The blob may have been waiting for eviction with no references
+            self.storage.set_evictable(blob_path, "uploads", False)
         
-        # Create a new filename with hash and UUID
+        # Create a new filename with hash and UUID, linked to the stored blob
         new_filename = f"{filename_without_ext}_{file_hash[:8]}_{unique_id[:8]}{file_ext}"
         file_path = os.path.join(dir_path, new_filename)
+        try:
+            self.blob_store.link(file_hash, file_path)
+            # A hard link keeps the blob's modification time; the sweep of old files
+            # goes by it, so mark the upload as new
+            os.utime(file_path)
+        except Exception:
+            self.blob_store.release(file_hash)
+            raise
         
-        # Save the file
-        async with aiofiles.open(file_path, "wb") as buffer:
-            # Use chunks to handle large files efficiently
-            chunk_size = 1024 * 1024  # 1MB chunks
-            while True:
-                chunk = await file.read(chunk_size)
-                if not chunk:
-                    break
-                await buffer.write(chunk)
+        # The link shares the blob's data, so it only counts towards the user's usage
+        self.storage.track(file_path, "uploads", user_id=user_id, counted=False, evictable=False)
         
-        # Cache the file hash
-        self.file_hash_cache[file_hash] = file_path
+        # Register the upload for cleanup
+        self.schedule_upload_expiry(file_path, file_hash)
         
-        return file_path, file_hash, unique_id
+        # Make room if the upload pushed the store over its budget
+        self.storage.enforce("uploads")
+        
+        return file_path
+    
+    def discard_upload(self, file_path: str, file_hash: str) -> None:
+        """
+        Remove an uploaded file and release its blob reference.
+        
+        Args:
+            file_path: Path returned by save_uploaded_file
+            file_hash: Hash returned by save_uploaded_file
+        """
+        self.expiry_index.cancel(file_path)
+        self._remove_upload_link(file_path, file_hash)
+    
+    def schedule_upload_expiry(self, file_path: str, file_hash: str, ttl_seconds: int = FILE_TTL_SECONDS) -> None:
+        """
+        Set when an uploaded file is deleted.
+        
+        Args:
+            file_path: Path returned by save_uploaded_file
+            file_hash: Hash returned by save_uploaded_file
+            ttl_seconds: Seconds from now until the file expires
+        """
+        self.expiry_index.schedule(file_path, ttl_seconds, kind=f"upload:{file_hash}")
+    
+    def schedule_output_expiry(
+        self,
+        output_path: str,
+        ttl_seconds: int = FILE_TTL_SECONDS,
+        result_id: Optional[str] = None
+    ) -> None:
+        """
+        Set when a converted file is deleted.
+        
+        Args:
+            output_path: Path to the converted file
+            ttl_seconds: Seconds from now until the file expires
+            result_id: Optional result ID whose catalog entry expires with the file
+        """
+        self.expiry_index.schedule(output_path, ttl_seconds)
+        if result_id:
+            self.output_catalog.expire(result_id, ttl_seconds)
+    
+    def register_output(
+        self,
+        result_id: str,
+        output_path: str,
+        content_hash: Optional[str] = None,
+        user_id: Optional[str] = None,
+        ttl_seconds: int = FILE_TTL_SECONDS
+    ) -> Dict[str, Any]:
+        """
+        Record a converted file in the output catalog and schedule its cleanup.
+        
+        Args:
+            result_id: Stable ID of the conversion result
+            output_path: Path to the converted file
+            content_hash: Optional full-content hash of the file
+            user_id: Optional ID of the user who owns the file
+            ttl_seconds: Seconds from now until the file expires
+            
+        Returns:
+            The catalog entry
+        """
+        self.backend.publish(output_path)
+        self.expiry_index.schedule(output_path, ttl_seconds)
+        entry = self.output_catalog.register(
+            result_id,
+            output_path,
+            ttl_seconds=ttl_seconds,
+            content_hash=content_hash,
+            owner=user_id
+        )
+        
+        # Count the output and make room if it pushed the store over its budget. The
+        # output is kept until it expires or has been downloaded; the result cache's
+        # copy of the same data is evicted instead
+        self.storage.track(output_path, "outputs", user_id=user_id, evictable=False)
+        self.storage.enforce("outputs")
+        
+        return entry
+    
+    def ensure_local_upload(self, file_path: str, file_hash: str) -> bool:
+        """
+        Make an upload readable on this node, fetching its blob from the storage
+        backend when it was received by another node.
+        
+        Args:
+            file_path: Path returned by save_uploaded_file
+            file_hash: Hash returned by save_uploaded_file
+            
+        Returns:
+            True if a local copy was made, which the caller should remove when done
+            
+        Raises:
+            FileNotFoundError: If the upload is not stored anywhere
+        """
+        if os.path.exists(file_path):
+            return False
+        
+        blob_path = self.blob_store.blob_path(file_hash)
+        if not self.backend.fetch(blob_path):
+            raise FileNotFoundError(file_path)
+        
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        try:
+            os.link(blob_path, file_path)
+        except FileExistsError:
+            pass
+        except OSError:
+            file_ops.copy_file(blob_path, file_path)
+        
+        return True
+    
+    def find_output(self, name: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up a converted file by result ID or stored filename.
+        
+        Args:
+            name: Result ID or filename of the converted file
+            
+        Returns:
+            The catalog entry, or None if it is unknown
+        """
+        return self.output_catalog.get(name) or self.output_catalog.find_by_filename(name)
+    
+    def expire(self, path: str, kind: str) -> None:
+        """
+        Delete a file whose expiry time has passed.
+        
+        Args:
+            path: Path claimed from the expiry index
+            kind: Kind recorded with the path
+        """
+        kind_name, _, file_hash = kind.partition(":")
+        
+        if kind_name == "upload":
+            self._remove_upload_link(path, file_hash)
+        elif kind_name == "blob":
+            # The blob may have been uploaded again since it was scheduled
+            if self.blob_store.delete(file_hash):
+                self.backend.delete(path)
+                self.storage.untrack(path)
+        else:
+            if os.path.exists(path):
+                os.remove(path)
+            self.backend.delete(path)
+            self.storage.untrack(path)
+        
+        self._prune_empty_dirs(os.path.dirname(path))
+    
+    def _remove_upload_link(self, file_path: str, file_hash: str) -> None:
+        """Remove an upload's link and schedule its blob once nothing references it"""
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        self.storage.untrack(file_path)
+        
+        if self.blob_store.release(file_hash) == 0:
+            blob_path = self.blob_store.blob_path(file_hash)
+            self.expiry_index.schedule(blob_path, BLOB_TTL_SECONDS, kind=f"blob:{file_hash}")
+            
+            # Unreferenced blobs may be evicted early when the store is full
+            self.storage.set_evictable(blob_path, "uploads", True)
+    
+    def _evict_blob(self, blob_path: str) -> bool:
+        """Delete an unreferenced blob to free space in the uploads store"""
+        if not self.blob_store.delete(os.path.basename(blob_path)):
+            # Uploaded again since it was released
+            return False
+        
+        self.expiry_index.cancel(blob_path)
+        self.backend.delete(blob_path)
+        self.storage.untrack(blob_path)
+        self._prune_empty_dirs(os.path.dirname(blob_path))
+        return True
+    
+    def _evict_output(self, output_path: str) -> bool:
+        """Delete a converted file to free space in the outputs store"""
+        cache_dir = os.path.realpath(result_cache.base_dir)
+        if os.path.commonpath([cache_dir, os.path.realpath(output_path)]) == cache_dir:
+            # Cached copies are dropped through the cache so its index stays consistent
+            cache_key = os.path.splitext(os.path.basename(output_path))[0]
+            result_cache.evict(cache_key)
+            self.storage.untrack(output_path)
+            return True
+        
+        self.expiry_index.cancel(output_path)
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        self.backend.delete(output_path)
+        self.storage.untrack(output_path)
+        self._prune_empty_dirs(os.path.dirname(output_path))
+        return True
+    
+    def _prune_empty_dirs(self, dir_path: str) -> None:
+        """Remove empty directories left behind by a deleted file, up to the base directories"""
+        stop_dirs = {
+            os.path.realpath(self.base_upload_dir),
+            os.path.realpath(self.base_output_dir),
+            os.path.realpath(self.blob_store.base_dir),
+            os.path.realpath(self.blob_store.temp_dir),
+        }
+        while dir_path and os.path.realpath(dir_path) not in stop_dirs:
+            try:
+                os.rmdir(dir_path)
+            except OSError:
+                # Not empty or already gone
+                break
+            dir_path = os.path.dirname(dir_path)
     
     def get_output_path(
         self,
@@ -167,13 +575,62 @@ class FileManager:
         Returns:
             Target file path
         """
-        # Create target directory if it doesn't exist
-        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        # Rename when possible, otherwise copy inside the kernel
+        return file_ops.move_file(source_path, target_path)
+    
+    def get_content_hash(self, file_path: str) -> str:
+        """
+        Get the full-content hash of a stored file.
+        Hashes are memoized in Redis against the file's size and modification time,
+        so each file is read at most once.
+        
+        Args:
+            file_path: Path to the file
+            
+        Returns:
+            Hex digest of the file content
+        """
+        stat_result = os.stat(file_path)
+        fingerprint = f"{stat_result.st_size}:{stat_result.st_mtime_ns}"
+        key = f"{CONTENT_HASH_KEY_PREFIX}{os.path.realpath(file_path)}"
+        
+        redis_client = get_redis()
+        cached = redis_client.get(key)
+        if cached:
+            cached_fingerprint, _, file_hash = cached.decode("utf-8").rpartition(":")
+            if cached_fingerprint == fingerprint:
+                return file_hash
+        
+        file_hash = hash_file(file_path)
+        redis_client.setex(key, 7 * 24 * 3600, f"{fingerprint}:{file_hash}")
         
-        # Move the file
-        shutil.move(source_path, target_path)
+        return file_hash
+    
+    def resolve_path(self, base_dir: str, relative_path: str) -> Optional[str]:
+        """
+        Resolve a path relative to a storage directory without escaping it.
         
-        return target_path
+        Args:
+            base_dir: Storage directory (uploads or outputs)
+            relative_path: Path relative to that directory
+            
+        Returns:
+            The file path, or None if it is outside the directory or not a file
+        """
+        base = os.path.realpath(base_dir)
+        file_path = os.path.realpath(os.path.join(base, relative_path))
+        if os.path.commonpath([base, file_path]) != base or not os.path.isfile(file_path):
+            return None
+        return os.path.join(base_dir, os.path.relpath(file_path, base))
+    
+    @staticmethod
+    async def _iter_upload(file: UploadFile) -> AsyncIterator[bytes]:
+        """Iterate over the content of an uploaded file in chunks"""
+        while True:
+            chunk = await file.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
     
     def get_file_url(self, file_path: str) -> str:
         """
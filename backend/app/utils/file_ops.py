@@ -0,0 +1,128 @@
+import os
+import shutil
+import asyncio
+from typing import AsyncIterator, List, Optional
+
+# Amount of data gathered before it is handed to a worker thread for writing
+WRITE_BATCH_SIZE = 1024 * 1024  # 1MB
+
+class StreamWriter:
+    """
+    Writes an async stream of chunks to an open file descriptor.
+    Chunks are batched so that each hop to a worker thread writes (and hashes) about
+    1MB, instead of paying a thread hop per network-sized chunk.
+    """
+
+    def __init__(self, fd: int, hash_obj=None, max_bytes: Optional[int] = None):
+        """
+        Args:
+            fd: File descriptor positioned where writing should start
+            hash_obj: Optional hash object updated with every byte written
+            max_bytes: Optional limit on the number of bytes accepted
+        """
+        self.fd = fd
+        self.hash_obj = hash_obj
+        self.max_bytes = max_bytes
+
+        # Number of bytes written to the file so far
+        self.written = 0
+
+    async def write_from(self, chunks: AsyncIterator[bytes]) -> int:
+        """
+        Write every chunk from an async iterator.
+        Data received before an error is still written, so `written` always matches
+        what is on disk and in the hash.
+
+        Args:
+            chunks: Async iterator over the data
+
+        Returns:
+            Total number of bytes written
+
+        Raises:
+            ValueError: If the stream goes past max_bytes
+        """
+        loop = asyncio.get_event_loop()
+        pending: List[bytes] = []
+        pending_size = 0
+
+        try:
+            async for chunk in chunks:
+                if not chunk:
+                    continue
+                if self.max_bytes is not None and self.written + pending_size + len(chunk) > self.max_bytes:
+                    raise ValueError("Stream goes past the allowed size")
+                pending.append(chunk)
+                pending_size += len(chunk)
+                if pending_size >= WRITE_BATCH_SIZE:
+                    batch, pending, pending_size = pending, [], 0
+                    await loop.run_in_executor(None, self._write_batch, batch)
+        finally:
+            if pending:
+                await loop.run_in_executor(None, self._write_batch, pending)
+
+        return self.written
+
+    def _write_batch(self, batch: List[bytes]) -> None:
+        """Write and hash a batch of chunks"""
+        for chunk in batch:
+            view = memoryview(chunk)
+            while view:
+                count = os.write(self.fd, view)
+                view = view[count:]
+            if self.hash_obj is not None:
+                self.hash_obj.update(chunk)
+            self.written += len(chunk)
+
+def copy_file(source_path: str, target_path: str) -> None:
+    """
+    Copy a file, letting the kernel move the data where it can.
+    copy_file_range avoids copying through user space and can share extents on
+    copy-on-write filesystems; other systems fall back to a buffered copy.
+
+    Args:
+        source_path: Source file path
+        target_path: Target file path
+    """
+    with open(source_path, "rb") as src, open(target_path, "wb") as dst:
+        if hasattr(os, "copy_file_range"):
+            try:
+                remaining = os.fstat(src.fileno()).st_size
+                while remaining > 0:
+                    copied = os.copy_file_range(src.fileno(), dst.fileno(), remaining)
+                    if copied == 0:
+                        break
+                    remaining -= copied
+                if remaining == 0:
+                    return
+            except OSError:
+                pass
+
+            # Start over with a plain copy
+            src.seek(0)
+            dst.seek(0)
+            dst.truncate()
+
+        shutil.copyfileobj(src, dst, WRITE_BATCH_SIZE)
+
+def move_file(source_path: str, target_path: str) -> str:
+    """
+    Move a file with a rename, copying only when crossing filesystems.
+
+    Args:
+        source_path: Source file path
+        target_path: Target file path
+
+    Returns:
+        Target file path
+    """
+    os.makedirs(os.path.dirname(target_path) or ".", exist_ok=True)
+
+    try:
+        os.replace(source_path, target_path)
+    except OSError:
+        # Different filesystem, so the data has to be copied
+        copy_file(source_path, target_path)
+        os.remove(source_path)
+
+    return target_path
@@ -0,0 +1,268 @@
+import os
+import stat
+import mimetypes
+from email.utils import formatdate
+from typing import Optional, Tuple, Union
+from urllib.parse import quote
+
+import anyio
+from starlette.requests import Request
+from starlette.responses import Response, StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+# Cache headers for files whose URL always refers to the same bytes
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Cache headers for everything else: cache, but revalidate with the ETag
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+class RangeNotSatisfiable(ValueError):
+    """Raised when a Range header does not overlap the file"""
+
+def parse_range_header(range_header: str, file_size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single byte range from a Range header.
+
+    Args:
+        range_header: Value of the Range header
+        file_size: Size of the file in bytes
+
+    Returns:
+        Tuple of (start, end) with an inclusive end, or None to serve the whole file
+
+    Raises:
+        RangeNotSatisfiable: If the range lies outside the file
+    """
+    unit, _, ranges = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in ranges:
+        # Unknown units and multipart ranges are answered with the full file
+        return None
+
+    start_text, _, end_text = ranges.strip().partition("-")
+    try:
+        start = int(start_text) if start_text else None
+        end = int(end_text) if end_text else None
+    except ValueError:
+        return None
+
+    if start is None:
+        # Suffix range: the last N bytes
+        if not end:
+            raise RangeNotSatisfiable(range_header)
+        return max(0, file_size - end), file_size - 1
+
+    if end is None:
+        end = file_size - 1
+
+    if start >= file_size or start > end:
+        raise RangeNotSatisfiable(range_header)
+
+    return start, min(end, file_size - 1)
+
+def _etag_matches(header: str, etag: str) -> bool:
+    """Check an If-None-Match or If-Range header against an ETag"""
+    candidates = [tag.strip() for tag in header.split(",")]
+    bare_etag = etag[2:] if etag.startswith("W/") else etag
+    for candidate in candidates:
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == bare_etag:
+            return True
+    return False
+
+class _FileRangeResponse(Response):
+    """Sends a byte range of a file without blocking the event loop"""
+
+    chunk_size = 256 * 1024
+
+    def __init__(self, path: str, start: int, end: int, status_code: int, headers: dict, send_body: bool):
+        super().__init__(content=None, status_code=status_code, headers=headers)
+        self.path = path
+        self.start = start
+        self.count = end - start + 1
+        self.send_body = send_body
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({
+            "type": "http.response.start",
+            "status": self.status_code,
+            "headers": self.raw_headers,
+        })
+
+        if not self.send_body or self.count <= 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        extensions = scope.get("extensions") or {}
+
+        if "http.response.zerocopy" in extensions:
+            # The server hands the descriptor to sendfile(2)
+            with open(self.path, "rb") as f:
+                await send({
+                    "type": "http.response.zerocopy",
+                    "file": f,
+                    "offset": self.start,
+                    "count": self.count,
+                    "more_body": False,
+                })
+            return
+
+        if "http.response.pathsend" in extensions and self.start == 0 and self.status_code == 200:
+            await send({"type": "http.response.pathsend", "path": os.path.abspath(self.path)})
+            return
+
+        # Fall back to reading in a worker thread, one chunk at a time
+        async with await anyio.open_file(self.path, "rb") as f:
+            await f.seek(self.start)
+            remaining = self.count
+            while remaining > 0:
+                chunk = await f.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining > 0:
+                # The file shrank while sending; end the body anyway
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+def file_response(
+    request: Request,
+    path: str,
+    content_hash: str,
+    filename: Optional[str] = None,
+    immutable: bool = False
+) -> Response:
+    """
+    Build a response for a file with Range, ETag and conditional request support.
+
+    Args:
+        request: The incoming request
+        path: Path to the file
+        content_hash: Hash of the file content, used as a strong ETag
+        filename: Optional download filename for Content-Disposition
+        immutable: Whether the URL always refers to the same content
+
+    Returns:
+        A 200, 206, 304 or 416 response
+    """
+    stat_result = os.stat(path)
+    if not stat.S_ISREG(stat_result.st_mode):
+        raise FileNotFoundError(path)
+
+    file_size = stat_result.st_size
+    etag = f'"{content_hash}"'
+
+    headers = {
+        "accept-ranges": "bytes",
+        "etag": etag,
+        "last-modified": formatdate(stat_result.st_mtime, usegmt=True),
+        "cache-control": IMMUTABLE_CACHE_CONTROL if immutable else REVALIDATE_CACHE_CONTROL,
+    }
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    selected = _select_range(request, headers, file_size, path, filename, etag)
+    if isinstance(selected, Response):
+        return selected
+    start, end, status_code = selected
+
+    return _FileRangeResponse(
+        path=path,
+        start=start,
+        end=end,
+        status_code=status_code,
+        headers=headers,
+        send_body=request.method != "HEAD"
+    )
+
+def backend_file_response(
+    request: Request,
+    backend,
+    path: str,
+    content_hash: Optional[str] = None,
+    filename: Optional[str] = None
+) -> Response:
+    """
+    Build a response streaming a file from a storage backend, with Range support.
+    Makes blocking calls to the backend, so call it from a worker thread.
+
+    Args:
+        request: The incoming request
+        backend: StorageBackend holding the file
+        path: Path of the file in the backend
+        content_hash: Optional hash of the file content, used as a strong ETag
+        filename: Optional download filename for Content-Disposition
+
+    Returns:
+        A 200, 206, 304, 404 or 416 response
+    """
+    file_size = backend.size(path)
+    if file_size is None:
+        return Response(status_code=404)
+
+    etag = f'"{content_hash}"' if content_hash else None
+    headers = {
+        "accept-ranges": "bytes",
+        "cache-control": REVALIDATE_CACHE_CONTROL,
+    }
+    if etag:
+        headers["etag"] = etag
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and _etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=headers)
+
+    selected = _select_range(request, headers, file_size, path, filename, etag)
+    if isinstance(selected, Response):
+        return selected
+    start, end, status_code = selected
+
+    if request.method == "HEAD" or end < start:
+        return Response(status_code=status_code, headers=headers)
+
+    return StreamingResponse(
+        backend.read_range(path, start, end),
+        status_code=status_code,
+        headers=headers
+    )
+
+def _select_range(
+    request: Request,
+    headers: dict,
+    file_size: int,
+    path: str,
+    filename: Optional[str],
+    etag: Optional[str]
+) -> Union[Tuple[int, int, int], Response]:
+    """
+    Work out which bytes to send and fill in the content headers.
+
+    Returns:
+        Tuple of (start, end, status_code), or a 416 response
+    """
+    media_type = mimetypes.guess_type(filename or path)[0] or "application/octet-stream"
+    headers["content-type"] = media_type
+    if filename:
+        headers["content-disposition"] = f"attachment; filename*=utf-8''{quote(filename)}"
+
+    start, end, status_code = 0, file_size - 1, 200
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (not if_range or (etag and _etag_matches(if_range, etag))):
+        try:
+            byte_range = parse_range_header(range_header, file_size)
+        except RangeNotSatisfiable:
+            headers["content-range"] = f"bytes */{file_size}"
+            return Response(status_code=416, headers=headers)
+
+        if byte_range:
+            start, end = byte_range
+            status_code = 206
+            headers["content-range"] = f"bytes {start}-{end}/{file_size}"
+
+    headers["content-length"] = str(max(0, end - start + 1))
+    return start, end, status_code
@@ -0,0 +1,239 @@
+import os
+import logging
+from typing import AsyncIterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Bytes read from the start of an upload to detect its format (tar headers end at 262)
+SNIFF_BYTES = 4096
+
+# Magic numbers: all (offset, bytes) pairs must match; the first listed format is
+# the one assumed when the file's extension is none of them
+SIGNATURES: List[Tuple[Tuple[Tuple[int, bytes], ...], Tuple[str, ...]]] = [
+    (((0, b"%PDF-"),), ("pdf",)),
+    (((0, b"\x89PNG\r\n\x1a\n"),), ("png",)),
+    (((0, b"\xff\xd8\xff"),), ("jpg", "jpeg")),
+    (((0, b"GIF87a"),), ("gif",)),
+    (((0, b"GIF89a"),), ("gif",)),
+    (((0, b"BM"), (6, b"\x00\x00\x00\x00")), ("bmp",)),
+    (((0, b"II*\x00"),), ("tiff",)),
+    (((0, b"MM\x00*"),), ("tiff",)),
+    (((0, b"\x00\x00\x01\x00"),), ("ico",)),
+    (((0, b"RIFF"), (8, b"WEBP")), ("webp",)),
+    (((0, b"RIFF"), (8, b"WAVE")), ("wav",)),
+    (((0, b"RIFF"), (8, b"AVI ")), ("avi",)),
+    (((0, b"FORM"), (8, b"AIFF")), ("aiff",)),
+    (((0, b"OggS"),), ("ogg",)),
+    (((0, b"fLaC"),), ("flac",)),
+    (((0, b"ID3"),), ("mp3",)),
+    (((0, b"FLV\x01"),), ("flv",)),
+    (((0, b"0&\xb2u\x8ef\xcf\x11"),), ("wmv", "wma")),
+    (((0, b"PK\x03\x04"),), ("zip", "docx", "odt")),
+    (((0, b"PK\x05\x06"),), ("zip",)),
+    (((0, b"7z\xbc\xaf\x27\x1c"),), ("7z",)),
+    (((0, b"Rar!\x1a\x07"),), ("rar",)),
+    (((0, b"\x1f\x8b"),), ("gz",)),
+    (((0, b"BZh"),), ("bz2",)),
+    (((0, b"\xfd7zXZ\x00"),), ("xz",)),
+    (((257, b"ustar"),), ("tar",)),
+    (((0, b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"),), ("doc",)),
+    (((0, b"{\\rtf"),), ("rtf",)),
+]
+
+# ISO base media brands (bytes 8-12 after "ftyp") that are not plain mp4
+FTYP_BRANDS = {
+    b"heic": "heic", b"heix": "heic", b"mif1": "heic", b"msf1": "heic",
+    b"M4A ": "m4a", b"M4B ": "m4a",
+    b"M4V ": "m4v",
+    b"qt  ": "mov",
+    b"3gp4": "3gp", b"3gp5": "3gp", b"3gp6": "3gp", b"3g2a": "3gp",
+}
+
+# Formats told apart by content rather than a signature
+TEXT_FORMATS = {"txt", "md", "html", "xml", "json", "csv", "yaml", "yml", "svg"}
+
+# Byte order marks of UTF-16 text
+UTF16_BOMS = (b"\xff\xfe", b"\xfe\xff")
+
+# Control characters found in text files
+TEXT_CONTROL_BYTES = b"\t\n\r\f"
+
+# Formats reported by python-magic, when it is installed and the signatures did not match
+MIME_FORMATS = {
+    "application/pdf": "pdf",
+    "application/msword": "doc",
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document": "docx",
+    "application/vnd.oasis.opendocument.text": "odt",
+    "application/x-rar": "rar",
+    "application/x-tar": "tar",
+    "audio/aac": "aac",
+    "audio/x-hx-aac-adts": "aac",
+    "audio/mpeg": "mp3",
+    "audio/x-m4a": "m4a",
+    "video/mp4": "mp4",
+    "video/quicktime": "mov",
+    "video/3gpp": "3gp",
+    "video/x-matroska": "mkv",
+    "video/webm": "webm",
+    "image/heic": "heic",
+}
+
+class UnrecognizedFormatError(ValueError):
+    """Raised when an upload's content does not match any supported format"""
+
+def _extension(filename: str) -> str:
+    """Get a filename's lowercase extension without the dot"""
+    return os.path.splitext(filename or "")[1][1:].lower()
+
+def _match_signatures(head: bytes) -> Tuple[str, ...]:
+    """Get the formats whose magic numbers the content starts with"""
+    for parts, formats in SIGNATURES:
+        if all(head[offset:offset + len(magic)] == magic for offset, magic in parts):
+            return formats
+
+    # ISO base media files (mp4, mov, m4a, heic, ...) are told apart by their brand
+    if head[4:8] == b"ftyp":
+        return (FTYP_BRANDS.get(head[8:12], "mp4"),)
+
+    # Matroska and WebM share the EBML header; WebM declares its doctype early on
+    if head.startswith(b"\x1a\x45\xdf\xa3"):
+        return ("webm",) if b"webm" in head[:64] else ("mkv",)
+
+    # MPEG audio frames without an ID3 tag: ADTS AAC or MP3
+    if len(head) >= 2 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0:
+        return ("aac",) if head[1] & 0xF6 == 0xF0 else ("mp3",)
+
+    return ()
+
+def _magic_format(head: bytes) -> Optional[str]:
+    """Ask python-magic for the format, if it is installed"""
+    try:
+        import magic
+    except ImportError:
+        return None
+
+    try:
+        return MIME_FORMATS.get(magic.from_buffer(head, mime=True))
+    except Exception as e:
+        logger.debug(f"python-magic could not identify the content: {str(e)}")
+        return None
+
+def _decode_text(head: bytes) -> Optional[str]:
+    """Decode the start of a file as text, or None if it is binary"""
+    # UTF-16 text is full of NUL bytes, but starts with a byte order mark
+    if head.startswith(UTF16_BOMS):
+        even = head[:len(head) - len(head) % 2]
+        # The sample may end in the middle of a surrogate pair
+        for trim in (0, 2):
+            try:
+                return even[:len(even) - trim].decode("utf-16")
+            except UnicodeDecodeError:
+                continue
+        return None
+
+    if b"\x00" in head:
+        return None
+    # The sample may end in the middle of a multi-byte character
+    for trim in range(4):
+        try:
+            return head[:len(head) - trim].decode("utf-8")
+        except UnicodeDecodeError:
+            continue
+
+    # Text in a single-byte encoding such as cp1252 or Latin-1; control
+    # characters other than whitespace mean the content is binary
+    if any(byte < 0x20 and byte not in TEXT_CONTROL_BYTES for byte in head):
+        return None
+    return head.decode("latin-1")
+
+def _sniff_text(text: str) -> str:
+    """Guess the format of text content without a recognized extension"""
+    start = text.lstrip("\ufeff \t\r\n")[:512].lower()
+    if "<svg" in start:
+        return "svg"
+    if start.startswith("<!doctype html") or start.startswith("<html"):
+        return "html"
+    if start.startswith("<?xml") or start.startswith("<"):
+        return "xml"
+    if start.startswith("{") or start.startswith("["):
+        return "json"
+    return "txt"
+
+def detect_format(head: bytes, filename: str) -> Optional[str]:
+    """
+    Detect the format of an upload from its first bytes and its filename.
+    Magic numbers decide for binary formats, with python-magic as a fallback;
+    the extension only picks between formats that share a signature (such as
+    zip and docx) and between text formats.
+
+    Args:
+        head: The first SNIFF_BYTES bytes of the upload (fewer for small files)
+        filename: Original filename of the upload
+
+    Returns:
+        The detected format (an extension without the dot), or None if the
+        content is not recognized
+    """
+    extension = _extension(filename)
+
+    candidates = _match_signatures(head)
+    # A UTF-16 byte order mark also reads as the header of an MPEG audio frame
+    if candidates and extension in TEXT_FORMATS and head.startswith(UTF16_BOMS):
+        candidates = ()
+    text = _decode_text(head) if not candidates else None
+    if not candidates and text is None:
+        sniffed = _magic_format(head)
+        candidates = (sniffed,) if sniffed else ()
+
+    if candidates:
+        return extension if extension in candidates else candidates[0]
+
+    if text is not None:
+        if extension in TEXT_FORMATS:
+            return extension
+        return _sniff_text(text) if text.strip() else None
+
+    return None
+
+def with_format(filename: str, detected: str) -> str:
+    """
+    Give a filename the extension of its detected format.
+    Converters pick their input format from the extension, so it has to be right.
+
+    Args:
+        filename: Original filename of the upload
+        detected: Format detected from the content
+
+    Returns:
+        The filename with the detected format's extension
+    """
+    stem, _ = os.path.splitext(os.path.basename(filename or "upload"))
+    return f"{stem or 'upload'}.{detected}"
+
+async def peek_stream(chunks: AsyncIterator[bytes], size: int = SNIFF_BYTES) -> Tuple[bytes, AsyncIterator[bytes]]:
+    """
+    Read the start of a byte stream without consuming it.
+
+    Args:
+        chunks: Async iterator over the content
+        size: Number of bytes to read
+
+    Returns:
+        Tuple of (the first bytes, an iterator over the whole content)
+    """
+    buffered = []
+    total = 0
+    async for chunk in chunks:
+        buffered.append(chunk)
+        total += len(chunk)
+        if total >= size:
+            break
+    head = b"".join(buffered)
+
+    async def replay() -> AsyncIterator[bytes]:
+        if head:
+            yield head
+        async for chunk in chunks:
+            yield chunk
+
+    return head[:size], replay()
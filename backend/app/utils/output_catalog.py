@@ -0,0 +1,145 @@
+import os
+import time
+import logging
+from typing import Any, Dict, Optional
+
+import redis
+
+from app.utils.redis_client import get_redis
+from app.utils.storage_backend import storage_backend
+
+logger = logging.getLogger(__name__)
+
+# Redis key prefixes for catalog entries and the filename lookup
+OUTPUT_KEY_PREFIX = "output:"
+OUTPUT_NAME_KEY_PREFIX = "output:name:"
+
+class OutputCatalog:
+    """
+    Catalog of converted files keyed by a stable result ID.
+    Each entry maps to the file's path, size, content hash, owner and expiry, so
+    downloads, sharing and status lookups never have to search the outputs tree.
+    """
+
+    def __init__(self, redis_client: Optional[redis.Redis] = None):
+        """Initialize the output catalog"""
+        self._redis = redis_client
+
+    @property
+    def redis(self) -> redis.Redis:
+        """Redis client holding the catalog"""
+        if self._redis is None:
+            self._redis = get_redis()
+        return self._redis
+
+    def register(
+        self,
+        result_id: str,
+        path: str,
+        ttl_seconds: int,
+        content_hash: Optional[str] = None,
+        owner: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Add a converted file to the catalog.
+
+        Args:
+            result_id: Stable ID of the conversion result
+            path: Path to the converted file
+            ttl_seconds: Seconds until the file expires
+            content_hash: Optional full-content hash of the file
+            owner: Optional ID of the user who owns the file
+
+        Returns:
+            The catalog entry
+        """
+        entry = {
+            "result_id": result_id,
+            "path": path,
+            "filename": os.path.basename(path),
+            "size": os.path.getsize(path),
+            "hash": content_hash or "",
+            "owner": owner or "",
+            "expires_at": int(time.time()) + ttl_seconds,
+        }
+
+        key = f"{OUTPUT_KEY_PREFIX}{result_id}"
+        name_key = f"{OUTPUT_NAME_KEY_PREFIX}{entry['filename']}"
+        try:
+            pipe = self.redis.pipeline()
+            pipe.hset(key, mapping=entry)
+            pipe.expire(key, ttl_seconds)
+            pipe.set(name_key, result_id, ex=ttl_seconds)
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Failed to catalog output {result_id}: {str(e)}")
+
+        return self._decode(entry)
+
+    def get(self, result_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up a converted file by result ID.
+
+        Args:
+            result_id: Stable ID of the conversion result
+
+        Returns:
+            The catalog entry, or None if it is unknown or its file is gone; with a
+            remote storage backend the file may only be in the object store
+        """
+        raw = self.redis.hgetall(f"{OUTPUT_KEY_PREFIX}{result_id}")
+        if not raw:
+            return None
+
+        entry = self._decode({k.decode("utf-8"): v.decode("utf-8") for k, v in raw.items()})
+        if not os.path.exists(entry["path"]) and not storage_backend.remote:
+            return None
+
+        return entry
+
+    def find_by_filename(self, filename: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up a converted file by its stored filename.
+
+        Args:
+            filename: Basename of the converted file
+
+        Returns:
+            The catalog entry, or None if it is unknown
+        """
+        result_id = self.redis.get(f"{OUTPUT_NAME_KEY_PREFIX}{os.path.basename(filename)}")
+        if not result_id:
+            return None
+        return self.get(result_id.decode("utf-8"))
+
+    def expire(self, result_id: str, ttl_seconds: int) -> None:
+        """
+        Change when a catalog entry expires.
+
+        Args:
+            result_id: Stable ID of the conversion result
+            ttl_seconds: Seconds from now until the entry expires
+        """
+        key = f"{OUTPUT_KEY_PREFIX}{result_id}"
+        filename = self.redis.hget(key, "filename")
+        if not filename:
+            return
+
+        pipe = self.redis.pipeline()
+        pipe.hset(key, "expires_at", int(time.time()) + ttl_seconds)
+        pipe.expire(key, ttl_seconds)
+        pipe.expire(f"{OUTPUT_NAME_KEY_PREFIX}{filename.decode('utf-8')}", ttl_seconds)
+        pipe.execute()
+
+    @staticmethod
+    def _decode(entry: Dict[str, Any]) -> Dict[str, Any]:
+        """Convert an entry read from Redis to its Python types"""
+        return {
+            "result_id": entry["result_id"],
+            "path": entry["path"],
+            "filename": entry["filename"],
+            "size": int(entry["size"]),
+            "hash": entry["hash"] or None,
+            "owner": entry["owner"] or None,
+            "expires_at": int(entry["expires_at"]),
+        }
@@ -0,0 +1,128 @@
+import time
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from app.utils.cancellation import check_cancelled
+
+# Reporter of the conversion running in the current context
+_current_reporter: contextvars.ContextVar[Optional["ProgressReporter"]] = contextvars.ContextVar(
+    "progress_reporter", default=None
+)
+
+class ProgressReporter:
+    """
+    Turns raw progress counts from a converter into percent, stage and ETA updates.
+    Updates are throttled so a fast loop does not flood the result backend.
+    """
+
+    def __init__(self, publish: Callable[[Dict[str, Any]], None], min_interval: float = 0.5):
+        """
+        Initialize the reporter.
+
+        Args:
+            publish: Function receiving each progress update
+            min_interval: Minimum seconds between updates within a stage
+        """
+        self.publish = publish
+        self.min_interval = min_interval
+        self.started_at = time.monotonic()
+
+        self._stage: Optional[str] = None
+        self._stage_started_at = self.started_at
+        self._last_published_at = 0.0
+        self._last_percent: Optional[float] = None
+
+    def update(
+        self,
+        stage: str,
+        done: Optional[float] = None,
+        total: Optional[float] = None,
+        unit: Optional[str] = None
+    ) -> None:
+        """
+        Report how far a conversion has got.
+
+        Args:
+            stage: Name of the current step (e.g. "encoding", "extracting")
+            done: Amount of work finished in this stage
+            total: Total amount of work in this stage, if known
+            unit: Unit of done and total (e.g. "seconds", "pages", "bytes")
+        """
+        now = time.monotonic()
+        new_stage = stage != self._stage
+        if new_stage:
+            self._stage = stage
+            self._stage_started_at = now
+
+        percent = None
+        eta_seconds = None
+        if done is not None and total:
+            percent = round(min(100.0, max(0.0, done * 100.0 / total)), 1)
+            elapsed = now - self._stage_started_at
+            if done > 0:
+                eta_seconds = round(elapsed * (total - done) / done, 1)
+
+        finished = percent is not None and percent >= 100.0
+        if not new_stage and not finished:
+            if now - self._last_published_at < self.min_interval or percent == self._last_percent:
+                return
+
+        self._last_published_at = now
+        self._last_percent = percent
+
+        self.publish({
+            "stage": stage,
+            "percent": percent,
+            "done": done,
+            "total": total,
+            "unit": unit,
+            "eta_seconds": eta_seconds,
+            "elapsed_seconds": round(now - self.started_at, 1),
+        })
+
+@contextmanager
+def progress_context(reporter: ProgressReporter) -> Iterator[ProgressReporter]:
+    """
+    Make a reporter receive the progress of everything run inside the block.
+
+    Args:
+        reporter: The reporter to use
+
+    Yields:
+        The reporter
+    """
+    token = _current_reporter.set(reporter)
+    try:
+        yield reporter
+    finally:
+        _current_reporter.reset(token)
+
+def get_progress_reporter() -> Optional[ProgressReporter]:
+    """Get the reporter of the current context, if any"""
+    return _current_reporter.get()
+
+def report_progress(
+    stage: str,
+    done: Optional[float] = None,
+    total: Optional[float] = None,
+    unit: Optional[str] = None
+) -> None:
+    """
+    Report progress to the current context's reporter; does nothing outside a task.
+    Every report is also a cancellation checkpoint.
+
+    Args:
+        stage: Name of the current step
+        done: Amount of work finished in this stage
+        total: Total amount of work in this stage, if known
+        unit: Unit of done and total
+
+    Raises:
+        ConversionCancelled: If the conversion has been cancelled
+    """
+    check_cancelled()
+
+    reporter = _current_reporter.get()
+    if reporter is not None:
+        reporter.update(stage, done, total, unit)
@@ -0,0 +1,26 @@
+import os
+from typing import Optional
+
+import redis
+import redis.asyncio
+
+# Get Redis URL from environment variable or use default
+redis_url = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+# Shared clients for this process (connections are pooled and opened lazily)
+_redis_client: Optional[redis.Redis] = None
+_async_redis_client: Optional[redis.asyncio.Redis] = None
+
+def get_redis() -> redis.Redis:
+    """Get the shared Redis client for this process"""
+    global _redis_client
+    if _redis_client is None:
+        _redis_client = redis.from_url(redis_url)
+    return _redis_client
+
+def get_async_redis() -> redis.asyncio.Redis:
+    """Get the shared asyncio Redis client for this process, for use on the event loop"""
+    global _async_redis_client
+    if _async_redis_client is None:
+        _async_redis_client = redis.asyncio.from_url(redis_url)
+    return _async_redis_client
@@ -0,0 +1,311 @@
+import os
+import json
+import time
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import redis
+
+from app.utils.file_ops import copy_file
+from app.utils.redis_client import get_redis
+from app.utils.storage_backend import storage_backend
+from app.utils.storage_governor import storage_governor
+
+logger = logging.getLogger(__name__)
+
+# Redis keys used by the cache index
+RESULT_KEY_PREFIX = "result:"
+RESULT_LRU_KEY = "result_cache:lru"
+RESULT_BYTES_KEY = "result_cache:bytes"
+RESULT_STATS_KEY = "result_cache:stats"
+
+# Hits on the in-process level update the shared recency and hit count at most
+# this often per entry, so they stay off the network
+RESULT_TOUCH_INTERVAL_SECONDS = float(os.getenv("RESULT_TOUCH_INTERVAL_SECONDS", "60"))
+
+class ResultCache:
+    """
+    Multi-level cache for conversion results.
+    An in-process LRU sits in front of a Redis index shared by all processes, which
+    points at content-addressed copies of the outputs under outputs/cache.
+    Cached copies count against the outputs store, and the storage governor
+    evicts them through evict() when that store is over its budget.
+    """
+
+    def __init__(
+        self,
+        base_dir: str = os.path.join("outputs", "cache"),
+        max_memory_entries: int = 256,
+        redis_client: Optional[redis.Redis] = None
+    ):
+        """Initialize the cache with its storage directory and limits"""
+        self.base_dir = base_dir
+        self.max_memory_entries = max_memory_entries
+        self._redis = redis_client
+
+        # Cache key -> (cached output path, when its shared recency was last updated),
+        # most recently used last
+        self._memory: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+
+        # In-process hits not yet added to the shared statistics
+        self._unrecorded_memory_hits = 0
+
+        os.makedirs(self.base_dir, exist_ok=True)
+
+    @property
+    def redis(self) -> redis.Redis:
+        """Redis client holding the cache index"""
+        if self._redis is None:
+            self._redis = get_redis()
+        return self._redis
+
+    @staticmethod
+    def make_key(
+        file_hash: str,
+        target_format: str,
+        converters: List[Tuple[str, str]],
+        options: Optional[Dict[str, Any]] = None
+    ) -> str:
+        """
+        Build a cache key for a conversion.
+
+        Args:
+            file_hash: Full-content hash of the input file
+            target_format: Format to convert to
+            converters: (name, version stamp) of each converter doing the work, in order
+            options: Optional conversion options
+
+        Returns:
+            Hex cache key
+        """
+        hash_obj = hashlib.blake2b(digest_size=16)
+        parts = [file_hash, target_format]
+        for converter_name, converter_version in converters:
+            parts.extend((converter_name, converter_version))
+        for part in parts:
+            hash_obj.update(part.encode())
+            hash_obj.update(b"\0")
+        hash_obj.update(json.dumps(options or {}, sort_keys=True).encode())
+        return hash_obj.hexdigest()
+
+    def get(self, cache_key: str) -> Optional[str]:
+        """
+        Get the cached output for a key.
+
+        Args:
+            cache_key: Key built by make_key()
+
+        Returns:
+            Path to the cached output, or None on a miss
+        """
+        entry = self._memory.get(cache_key)
+        if entry and os.path.exists(entry[0]):
+            cached_path, touched_at = entry
+            self._memory.move_to_end(cache_key)
+            self._unrecorded_memory_hits += 1
+
+            now = time.monotonic()
+            if now - touched_at >= RESULT_TOUCH_INTERVAL_SECONDS:
+                self._memory[cache_key] = (cached_path, now)
+                hits, self._unrecorded_memory_hits = self._unrecorded_memory_hits, 0
+                self._record_hit(cache_key, cached_path, "memory_hits", hits)
+            return cached_path
+
+        try:
+            cached = self.redis.hget(f"{RESULT_KEY_PREFIX}{cache_key}", "path")
+        except redis.RedisError as e:
+            logger.warning(f"Result cache index unavailable: {str(e)}")
+            return None
+
+        if cached:
+            cached_path = cached.decode("utf-8")
+            # Outputs cached by another node are fetched from the storage backend
+            if storage_backend.fetch(cached_path):
+                self._remember(cache_key, cached_path)
+                self._record_hit(cache_key, cached_path, "redis_hits")
+                return cached_path
+
+            # The output disappeared from disk, drop the stale entry
+            self.evict(cache_key)
+
+        self._memory.pop(cache_key, None)
+        self._incr_stat("misses")
+        return None
+
+    def materialize(self, cache_key: str, target_path: str) -> Optional[str]:
+        """
+        Expose a cached output at a per-request path without copying its data.
+
+        Args:
+            cache_key: Key built by make_key()
+            target_path: Path where the output should appear
+
+        Returns:
+            Target path on a hit, None on a miss
+        """
+        cached_path = self.get(cache_key)
+        if cached_path is None:
+            return None
+
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        if not os.path.exists(target_path):
+            try:
+                os.link(cached_path, target_path)
+            except OSError:
+                copy_file(cached_path, target_path)
+
+        return target_path
+
+    def put(self, cache_key: str, output_path: str, content_hash: Optional[str] = None) -> str:
+        """
+        Add a finished conversion output to the cache.
+
+        Args:
+            cache_key: Key built by make_key()
+            output_path: Path to the converted file
+            content_hash: Optional full-content hash of the output
+
+        Returns:
+            Path to the cached copy
+        """
+        extension = os.path.splitext(output_path)[1]
+        cached_path = os.path.join(self.base_dir, cache_key[:2], f"{cache_key}{extension}")
+
+        if not os.path.exists(cached_path):
+            os.makedirs(os.path.dirname(cached_path), exist_ok=True)
+            try:
+                os.link(output_path, cached_path)
+            except FileExistsError:
+                pass
+            except OSError:
+                copy_file(output_path, cached_path)
+
+        size = os.path.getsize(cached_path)
+
+        try:
+            key = f"{RESULT_KEY_PREFIX}{cache_key}"
+            if self.redis.hsetnx(key, "path", cached_path):
+                pipe = self.redis.pipeline()
+                pipe.hset(key, mapping={
+                    "size": size,
+                    "hash": content_hash or "",
+                    "created_at": int(time.time()),
+                })
+                pipe.incrby(RESULT_BYTES_KEY, size)
+                pipe.zadd(RESULT_LRU_KEY, {cache_key: time.time()})
+                pipe.execute()
+                storage_backend.publish(cached_path)
+                storage_governor.track(cached_path, "outputs")
+            storage_governor.enforce("outputs")
+        except redis.RedisError as e:
+            logger.warning(f"Failed to index cached result {cache_key}: {str(e)}")
+
+        self._remember(cache_key, cached_path)
+        return cached_path
+
+    def get_content_hash(self, cache_key: str) -> Optional[str]:
+        """
+        Get the content hash recorded for a cached output.
+
+        Args:
+            cache_key: Key built by make_key()
+
+        Returns:
+            Hex digest of the output, or None if it was not recorded
+        """
+        try:
+            content_hash = self.redis.hget(f"{RESULT_KEY_PREFIX}{cache_key}", "hash")
+        except redis.RedisError:
+            return None
+        return content_hash.decode("utf-8") if content_hash else None
+
+    def evict(self, cache_key: str) -> bool:
+        """
+        Remove an entry and its cached output.
+
+        Args:
+            cache_key: Key built by make_key()
+
+        Returns:
+            True if this process removed the entry
+        """
+        self._memory.pop(cache_key, None)
+        key = f"{RESULT_KEY_PREFIX}{cache_key}"
+
+        try:
+            # Only the process that wins the ZREM adjusts the byte count
+            if not self.redis.zrem(RESULT_LRU_KEY, cache_key):
+                self.redis.delete(key)
+                return False
+
+            entry = self.redis.hgetall(key)
+            pipe = self.redis.pipeline()
+            pipe.delete(key)
+            pipe.decrby(RESULT_BYTES_KEY, int(entry.get(b"size", 0)))
+            pipe.hincrby(RESULT_STATS_KEY, "evictions", 1)
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Failed to evict cached result {cache_key}: {str(e)}")
+            return False
+
+        cached_path = entry.get(b"path", b"").decode("utf-8")
+        if cached_path:
+            if os.path.exists(cached_path):
+                os.remove(cached_path)
+            storage_backend.delete(cached_path)
+            storage_governor.untrack(cached_path)
+
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get cache usage and hit-rate statistics across all processes.
+
+        Returns:
+            Dictionary of counters, total size and hit rate
+        """
+        raw = self.redis.hgetall(RESULT_STATS_KEY)
+        counters = {k.decode("utf-8"): int(v) for k, v in raw.items()}
+        hits = counters.get("memory_hits", 0) + counters.get("redis_hits", 0)
+        lookups = hits + counters.get("misses", 0)
+
+        return {
+            "memory_hits": counters.get("memory_hits", 0),
+            "redis_hits": counters.get("redis_hits", 0),
+            "misses": counters.get("misses", 0),
+            "evictions": counters.get("evictions", 0),
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "entries": self.redis.zcard(RESULT_LRU_KEY),
+            "bytes": int(self.redis.get(RESULT_BYTES_KEY) or 0),
+            "memory_entries": len(self._memory),
+        }
+
+    def _remember(self, cache_key: str, cached_path: str) -> None:
+        """Add an entry to the in-process LRU, whose shared recency was just updated"""
+        self._memory[cache_key] = (cached_path, time.monotonic())
+        self._memory.move_to_end(cache_key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def _record_hit(self, cache_key: str, cached_path: str, level: str, count: int = 1) -> None:
+        """Count hits and mark the entry as recently used"""
+        storage_governor.touch(cached_path, "outputs")
+        try:
+            pipe = self.redis.pipeline()
+            pipe.hincrby(RESULT_STATS_KEY, level, count)
+            pipe.zadd(RESULT_LRU_KEY, {cache_key: time.time()}, xx=True)
+            pipe.execute()
+        except redis.RedisError:
+            pass
+
+    def _incr_stat(self, name: str) -> None:
+        """Increment a shared statistics counter"""
+        try:
+            self.redis.hincrby(RESULT_STATS_KEY, name, 1)
+        except redis.RedisError:
+            pass
+
+# Create a singleton instance
+result_cache = ResultCache()
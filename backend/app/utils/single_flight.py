@@ -0,0 +1,330 @@
+import os
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import redis
+
+from app.utils.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Redis key prefix of the in-flight conversion locks
+FLIGHT_KEY_PREFIX = "flight:"
+
+# Redis key prefix of the set of requests subscribed to a running task
+FLIGHT_SUBSCRIBERS_KEY_PREFIX = "flight:subscribers:"
+
+# Redis key prefix of each request's subscription: the task running its
+# conversion, who owns it and where its output goes
+FLIGHT_TASK_KEY_PREFIX = "flight:task:"
+
+# How long a lock outlives a worker that died without releasing it. Running
+# tasks refresh their lock, so it only has to cover the time between refreshes
+FLIGHT_TTL_SECONDS = int(os.getenv("FLIGHT_TTL_SECONDS", str(3600 + 300)))
+
+# Subscriptions are kept as long as outputs, so finished requests can still be looked up
+FLIGHT_RECORD_TTL_SECONDS = int(os.getenv("FILE_TTL_SECONDS", str(24 * 3600)))
+
+def _decode(value: Any) -> Any:
+    """Decode a Redis reply that may be bytes"""
+    return value.decode() if isinstance(value, bytes) else value
+
+class SingleFlight:
+    """
+    Coalesces identical conversions that are in flight at the same time.
+    The first request for a (content hash, target, options) key takes a Redis
+    lock holding its task ID and runs the conversion; later requests for the same
+    key find the lock and subscribe to that task instead of starting their own.
+    Every subscriber keeps its own ID, owner and output filename, so the finished
+    output can be handed to each of them separately.
+    The lock lives in Redis, so requests on any API process or node coalesce.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: int = FLIGHT_TTL_SECONDS,
+        record_ttl_seconds: int = FLIGHT_RECORD_TTL_SECONDS,
+        redis_client: Optional[redis.Redis] = None
+    ):
+        """Initialize the coalescer with the lifetime of its locks and subscriptions"""
+        self.ttl_seconds = ttl_seconds
+        self.record_ttl_seconds = record_ttl_seconds
+        self._redis = redis_client
+
+    @property
+    def redis(self) -> redis.Redis:
+        """Redis client holding the locks"""
+        if self._redis is None:
+            self._redis = get_redis()
+        return self._redis
+
+    def acquire(
+        self,
+        key: str,
+        task_id: str,
+        owner: Optional[str] = None,
+        output_filename: Optional[str] = None
+    ) -> Optional[str]:
+        """
+        Claim a conversion for a task, or subscribe to the task already running it.
+
+        Args:
+            key: Cache key of the conversion
+            task_id: ID of the request, used as its task ID and result ID
+            owner: Optional ID of the user who made the request
+            output_filename: Custom filename for the request's output
+
+        Returns:
+            None if the caller should run the conversion, otherwise the ID of the
+            task already running it
+        """
+        flight_key = f"{FLIGHT_KEY_PREFIX}{key}"
+        try:
+            # Retry once in case the leader released the lock between the two calls
+            for _ in range(2):
+                if self.redis.set(flight_key, task_id, nx=True, ex=self.ttl_seconds):
+                    pipe = self.redis.pipeline()
+                    self._subscribe(pipe, key, task_id, task_id, owner, output_filename)
+                    pipe.execute()
+                    return None
+
+                leader = self._subscribe_to_leader(key, task_id, owner, output_filename)
+                if leader:
+                    return leader
+        except redis.RedisError as e:
+            # Without Redis every request runs its own conversion
+            logger.warning(f"Failed to coalesce conversion {key}: {str(e)}")
+        return None
+
+    def _subscribe_to_leader(
+        self,
+        key: str,
+        task_id: str,
+        owner: Optional[str],
+        output_filename: Optional[str]
+    ) -> Optional[str]:
+        """Subscribe a request to the task holding a conversion's lock, if the lock is still held"""
+        flight_key = f"{FLIGHT_KEY_PREFIX}{key}"
+
+        def subscribe_if_held(pipe: redis.client.Pipeline) -> Optional[str]:
+            leader = _decode(pipe.get(flight_key))
+            if leader:
+                pipe.multi()
+                self._subscribe(pipe, key, leader, task_id, owner, output_filename)
+            return leader
+
+        # Watching the lock means a leader releasing it meanwhile aborts the subscription
+        return self.redis.transaction(subscribe_if_held, flight_key, value_from_callable=True)
+
+    def _subscribe(
+        self,
+        pipe: redis.client.Pipeline,
+        key: str,
+        leader: str,
+        task_id: str,
+        owner: Optional[str],
+        output_filename: Optional[str]
+    ) -> None:
+        """Queue the commands recording a request's subscription to a task on a pipeline"""
+        subscribers_key = f"{FLIGHT_SUBSCRIBERS_KEY_PREFIX}{leader}"
+        record_key = f"{FLIGHT_TASK_KEY_PREFIX}{task_id}"
+        pipe.hset(record_key, mapping={
+            "leader": leader,
+            "key": key,
+            "owner": owner or "",
+            "output_filename": output_filename or "",
+            "detached": "0",
+        })
+        pipe.expire(record_key, self.record_ttl_seconds)
+        pipe.sadd(subscribers_key, task_id)
+        pipe.expire(subscribers_key, self.ttl_seconds)
+
+    def refresh(self, key: str, task_id: str) -> None:
+        """
+        Extend a conversion's lock while its task is still running it.
+
+        Args:
+            key: Cache key of the conversion
+            task_id: ID of the task running the conversion
+        """
+        flight_key = f"{FLIGHT_KEY_PREFIX}{key}"
+        try:
+            if _decode(self.redis.get(flight_key)) == task_id:
+                pipe = self.redis.pipeline()
+                pipe.expire(flight_key, self.ttl_seconds)
+                pipe.expire(f"{FLIGHT_SUBSCRIBERS_KEY_PREFIX}{task_id}", self.ttl_seconds)
+                pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Failed to refresh conversion {key}: {str(e)}")
+
+    @asynccontextmanager
+    async def keep_alive(self, key: str, task_id: str) -> AsyncIterator[None]:
+        """
+        Refresh a conversion's lock in the background for as long as the block runs.
+
+        Args:
+            key: Cache key of the conversion
+            task_id: ID of the task running the conversion
+        """
+        loop = asyncio.get_event_loop()
+
+        async def refresh_periodically() -> None:
+            while True:
+                await asyncio.sleep(self.ttl_seconds / 3)
+                await loop.run_in_executor(None, self.refresh, key, task_id)
+
+        refresher = loop.create_task(refresh_periodically())
+        try:
+            yield
+        finally:
+            refresher.cancel()
+
+    def release(self, key: str, task_id: str) -> Optional[List[Dict[str, Any]]]:
+        """
+        Release a conversion's lock once its task has finished.
+        The lock is only removed if it is still held by the given task.
+
+        Args:
+            key: Cache key of the conversion
+            task_id: ID of the task that ran the conversion
+
+        Returns:
+            The subscriptions still attached to the task (including the task's own,
+            unless it was cancelled), or None if the task did not hold the lock
+        """
+        flight_key = f"{FLIGHT_KEY_PREFIX}{key}"
+        subscribers_key = f"{FLIGHT_SUBSCRIBERS_KEY_PREFIX}{task_id}"
+
+        def release_if_held(pipe: redis.client.Pipeline) -> Optional[List[str]]:
+            if _decode(pipe.get(flight_key)) != task_id:
+                return None
+            subscriber_ids = [_decode(subscriber_id) for subscriber_id in pipe.smembers(subscribers_key)]
+            pipe.multi()
+            pipe.delete(flight_key, subscribers_key)
+            return subscriber_ids
+
+        try:
+            subscriber_ids = self.redis.transaction(
+                release_if_held, flight_key, subscribers_key, value_from_callable=True
+            )
+            if subscriber_ids is None:
+                return None
+
+            return [
+                subscription
+                for subscription in self.get_subscriptions(sorted(subscriber_ids))
+                if subscription is not None and not subscription["detached"]
+            ]
+        except redis.RedisError as e:
+            logger.warning(f"Failed to release conversion {key}: {str(e)}")
+            return None
+
+    def get_subscription(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up a request's subscription.
+
+        Args:
+            task_id: ID of the request
+
+        Returns:
+            Dictionary with the request's "task_id", the "leader" task running its
+            conversion, the conversion's cache "key", its "owner", "output_filename"
+            and whether it was "detached" by a cancellation, or None if the request
+            was not coalesced through Redis
+        """
+        return self.get_subscriptions([task_id])[0]
+
+    def get_subscriptions(self, task_ids: List[str]) -> List[Optional[Dict[str, Any]]]:
+        """
+        Look up the subscriptions of many requests in one round trip.
+
+        Args:
+            task_ids: IDs of the requests
+
+        Returns:
+            The subscription of each request, as from get_subscription(), in order
+        """
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            for task_id in task_ids:
+                pipe.hgetall(f"{FLIGHT_TASK_KEY_PREFIX}{task_id}")
+            raws = pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Failed to look up conversions: {str(e)}")
+            return [None] * len(task_ids)
+
+        subscriptions = []
+        for task_id, raw in zip(task_ids, raws):
+            if not raw:
+                subscriptions.append(None)
+                continue
+            record = {_decode(field): _decode(value) for field, value in raw.items()}
+            subscriptions.append({
+                "task_id": task_id,
+                "leader": record.get("leader") or task_id,
+                "key": record.get("key"),
+                "owner": record.get("owner") or None,
+                "output_filename": record.get("output_filename") or None,
+                "detached": record.get("detached") == "1",
+            })
+        return subscriptions
+
+    def leader_of(self, task_id: str) -> str:
+        """
+        Get the ID of the task running a request's conversion.
+
+        Args:
+            task_id: ID of the request
+
+        Returns:
+            The leader's task ID, or the request's own ID if it was not coalesced
+        """
+        subscription = self.get_subscription(task_id)
+        return subscription["leader"] if subscription else task_id
+
+    def detach(self, task_id: str) -> Optional[int]:
+        """
+        Unsubscribe a request from the task running its conversion, e.g. when it is cancelled.
+        Once nobody is subscribed, the lock is removed so the task can be stopped
+        without later identical requests attaching to it.
+
+        Args:
+            task_id: ID of the request
+
+        Returns:
+            The number of requests still subscribed, or None if the request was
+            not subscribed (already detached, finished or unknown)
+        """
+        subscription = self.get_subscription(task_id)
+        if subscription is None or subscription["detached"]:
+            return None
+
+        leader = subscription["leader"]
+        flight_key = f"{FLIGHT_KEY_PREFIX}{subscription['key']}"
+        subscribers_key = f"{FLIGHT_SUBSCRIBERS_KEY_PREFIX}{leader}"
+        record_key = f"{FLIGHT_TASK_KEY_PREFIX}{task_id}"
+
+        def detach_if_subscribed(pipe: redis.client.Pipeline) -> Optional[int]:
+            # A released lock means the task finished and the output was handed out
+            if _decode(pipe.get(flight_key)) != leader or not pipe.sismember(subscribers_key, task_id):
+                return None
+            remaining = pipe.scard(subscribers_key) - 1
+            pipe.multi()
+            pipe.hset(record_key, "detached", "1")
+            pipe.srem(subscribers_key, task_id)
+            if remaining == 0:
+                pipe.delete(flight_key)
+            return remaining
+
+        try:
+            return self.redis.transaction(
+                detach_if_subscribed, flight_key, subscribers_key, value_from_callable=True
+            )
+        except redis.RedisError as e:
+            logger.warning(f"Failed to detach conversion {task_id}: {str(e)}")
+            return None
+
+# Create a singleton instance
+single_flight = SingleFlight()
@@ -0,0 +1,332 @@
+import os
+import logging
+from typing import Iterator, Optional
+from urllib.parse import quote
+
+from app.utils import file_ops
+
+logger = logging.getLogger(__name__)
+
+# Which backend holds the stored files: "local" or "s3"
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local")
+
+# Settings for S3-compatible object storage (AWS S3, MinIO, ...)
+S3_BUCKET = os.getenv("S3_BUCKET", "format-conversion")
+S3_PREFIX = os.getenv("S3_PREFIX", "")
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL")
+S3_PUBLIC_ENDPOINT_URL = os.getenv("S3_PUBLIC_ENDPOINT_URL")
+S3_REGION = os.getenv("S3_REGION", "us-east-1")
+S3_PRESIGN_DOWNLOADS = os.getenv("S3_PRESIGN_DOWNLOADS", "1") == "1"
+
+# S3 requires every multipart part except the last to be at least 5MB
+S3_PART_SIZE = int(os.getenv("S3_PART_SIZE", str(8 * 1024 * 1024)))
+
+# Size of the chunks read from files and object bodies
+READ_CHUNK_SIZE = 1024 * 1024  # 1MB
+
+class StorageBackend:
+    """
+    Where stored files live beyond the local disk of one node.
+    Files are addressed by their local path (e.g. outputs/2024/01/31/report_ab12cd34_ef56ab78.pdf),
+    so the rest of the code keeps working with paths; the local directories act as
+    a working copy of the backend on every node.
+    """
+
+    # Whether files written on one node need publishing before other nodes can read them
+    remote = False
+
+    def publish(self, path: str) -> None:
+        """
+        Make a local file readable from every node.
+
+        Args:
+            path: Path to the local file
+        """
+
+    def fetch(self, path: str) -> bool:
+        """
+        Make a stored file available at its local path.
+
+        Args:
+            path: Path of the file
+
+        Returns:
+            True if the file is available locally
+        """
+        return os.path.exists(path)
+
+    def delete(self, path: str) -> None:
+        """
+        Delete a stored file from the backend.
+
+        Args:
+            path: Path of the file
+        """
+
+    def size(self, path: str) -> Optional[int]:
+        """
+        Get the size of a stored file.
+
+        Args:
+            path: Path of the file
+
+        Returns:
+            Size in bytes, or None if the file is not stored
+        """
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return None
+
+    def read_range(self, path: str, start: int, end: int) -> Iterator[bytes]:
+        """
+        Read a byte range of a stored file.
+
+        Args:
+            path: Path of the file
+            start: First byte to read
+            end: Last byte to read (inclusive)
+
+        Returns:
+            Iterator over the range's data in chunks
+        """
+        with open(path, "rb") as f:
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = f.read(min(READ_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+    def presigned_url(self, path: str, expires_in: int = 3600, filename: Optional[str] = None) -> Optional[str]:
+        """
+        Get a URL clients can download a stored file from directly.
+
+        Args:
+            path: Path of the file
+            expires_in: Seconds until the URL stops working
+            filename: Optional download filename
+
+        Returns:
+            The URL, or None if files must be served through the API
+        """
+        return None
+
+class LocalStorageBackend(StorageBackend):
+    """Files live on a local or shared POSIX filesystem"""
+
+    def delete(self, path: str) -> None:
+        if os.path.exists(path):
+            os.remove(path)
+
+class S3MultipartWriter:
+    """
+    Streams data into an object with a multipart upload.
+    Data is buffered only up to one part, so memory use does not grow with the file.
+    """
+
+    def __init__(self, client, bucket: str, key: str, part_size: int = S3_PART_SIZE):
+        """Start the multipart upload"""
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.part_size = part_size
+        self.written = 0
+
+        self._buffer = bytearray()
+        self._parts = []
+        self._upload_id = client.create_multipart_upload(Bucket=bucket, Key=key)["UploadId"]
+
+    def write(self, data: bytes) -> None:
+        """Add data to the object, uploading each part once it is full"""
+        self._buffer += data
+        self.written += len(data)
+        while len(self._buffer) >= self.part_size:
+            self._upload_part(bytes(self._buffer[:self.part_size]))
+            del self._buffer[:self.part_size]
+
+    def close(self) -> None:
+        """Upload the last part and complete the object"""
+        if self._buffer or not self._parts:
+            self._upload_part(bytes(self._buffer))
+            self._buffer = bytearray()
+
+        self.client.complete_multipart_upload(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self._upload_id,
+            MultipartUpload={"Parts": self._parts}
+        )
+
+    def abort(self) -> None:
+        """Cancel the upload and discard the parts sent so far"""
+        self.client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self._upload_id)
+
+    def _upload_part(self, data: bytes) -> None:
+        """Upload one part"""
+        part_number = len(self._parts) + 1
+        response = self.client.upload_part(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self._upload_id,
+            PartNumber=part_number,
+            Body=data
+        )
+        self._parts.append({"ETag": response["ETag"], "PartNumber": part_number})
+
+    def __enter__(self) -> "S3MultipartWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+class S3StorageBackend(StorageBackend):
+    """Files live in an S3-compatible bucket shared by every node"""
+
+    remote = True
+
+    def __init__(
+        self,
+        bucket: str = S3_BUCKET,
+        prefix: str = S3_PREFIX,
+        endpoint_url: Optional[str] = S3_ENDPOINT_URL,
+        public_endpoint_url: Optional[str] = S3_PUBLIC_ENDPOINT_URL,
+        region: str = S3_REGION,
+        presign_downloads: bool = S3_PRESIGN_DOWNLOADS
+    ):
+        """Initialize the backend with its bucket and endpoint"""
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.endpoint_url = endpoint_url
+        self.public_endpoint_url = public_endpoint_url or endpoint_url
+        self.region = region
+        self.presign_downloads = presign_downloads
+        self._client = None
+        self._public_client = None
+
+    def _make_client(self, endpoint_url: Optional[str]):
+        """Create a boto3 S3 client"""
+        try:
+            import boto3
+        except ImportError:
+            raise RuntimeError("The s3 storage backend requires boto3. Install it with: pip install boto3")
+
+        # Credentials come from the standard AWS environment variables or config files
+        return boto3.client("s3", endpoint_url=endpoint_url, region_name=self.region)
+
+    @property
+    def client(self):
+        """S3 client used for reads and writes"""
+        if self._client is None:
+            self._client = self._make_client(self.endpoint_url)
+        return self._client
+
+    @property
+    def public_client(self):
+        """S3 client used to sign URLs for the endpoint clients can reach"""
+        if self._public_client is None:
+            if self.public_endpoint_url == self.endpoint_url:
+                self._public_client = self.client
+            else:
+                self._public_client = self._make_client(self.public_endpoint_url)
+        return self._public_client
+
+    def key(self, path: str) -> str:
+        """Get the object key of a local path"""
+        relative = os.path.relpath(path).replace(os.sep, "/")
+        return f"{self.prefix}/{relative}" if self.prefix else relative
+
+    def open_writer(self, path: str) -> S3MultipartWriter:
+        """
+        Start streaming a new object.
+
+        Args:
+            path: Path of the file the object stores
+
+        Returns:
+            A writer; use it as a context manager to complete or abort the upload
+        """
+        return S3MultipartWriter(self.client, self.bucket, self.key(path))
+
+    def publish(self, path: str) -> None:
+        with open(path, "rb") as f, self.open_writer(path) as writer:
+            for chunk in iter(lambda: f.read(READ_CHUNK_SIZE), b""):
+                writer.write(chunk)
+
+    def fetch(self, path: str) -> bool:
+        if os.path.exists(path):
+            return True
+
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=self.key(path))
+        except self.client.exceptions.NoSuchKey:
+            return False
+
+        # Download next to the target and rename, so readers never see a partial file
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.part"
+        try:
+            with open(temp_path, "wb") as f:
+                for chunk in response["Body"].iter_chunks(READ_CHUNK_SIZE):
+                    f.write(chunk)
+            file_ops.move_file(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        return True
+
+    def delete(self, path: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=self.key(path))
+
+    def size(self, path: str) -> Optional[int]:
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self.key(path))["ContentLength"]
+        except self.client.exceptions.ClientError:
+            return None
+
+    def read_range(self, path: str, start: int, end: int) -> Iterator[bytes]:
+        response = self.client.get_object(
+            Bucket=self.bucket,
+            Key=self.key(path),
+            Range=f"bytes={start}-{end}"
+        )
+        yield from response["Body"].iter_chunks(READ_CHUNK_SIZE)
+
+    def presigned_url(self, path: str, expires_in: int = 3600, filename: Optional[str] = None) -> Optional[str]:
+        if not self.presign_downloads:
+            return None
+
+        params = {"Bucket": self.bucket, "Key": self.key(path)}
+        if filename:
+            params["ResponseContentDisposition"] = f"attachment; filename*=utf-8''{quote(filename)}"
+
+        return self.public_client.generate_presigned_url("get_object", Params=params, ExpiresIn=expires_in)
+
+def get_storage_backend(name: str = STORAGE_BACKEND) -> StorageBackend:
+    """
+    Create the storage backend selected by name.
+
+    Args:
+        name: "local" or "s3"
+
+    Returns:
+        The storage backend
+
+    Raises:
+        ValueError: If the backend is unknown
+    """
+    if name == "local":
+        return LocalStorageBackend()
+    if name == "s3":
+        return S3StorageBackend()
+    raise ValueError(f"Unknown storage backend: {name}")
+
+# Create a singleton instance
+storage_backend = get_storage_backend()
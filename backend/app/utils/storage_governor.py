@@ -0,0 +1,275 @@
+import os
+import json
+import time
+import logging
+from typing import Any, Callable, Dict, Optional
+
+import redis
+
+from app.utils.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Hash of store -> bytes used
+STORAGE_USAGE_KEY = "storage:usage"
+
+# Hash of store -> bytes used by one user
+STORAGE_USER_KEY_PREFIX = "storage:user:"
+
+# Hash of path -> what was counted for it, so each file is subtracted exactly once
+STORAGE_FILES_KEY = "storage:files"
+
+# Hash of inode -> number of tracked paths linking to it, so hard-linked data is counted once
+STORAGE_INODES_KEY = "storage:inodes"
+
+# Sorted set of evictable path -> last use timestamp, one per store
+STORAGE_LRU_KEY_PREFIX = "storage:lru:"
+
+# Disk budgets per store; 0 disables eviction for that store
+STORAGE_BUDGETS = {
+    "uploads": int(os.getenv("UPLOADS_MAX_BYTES", str(20 * 1024 ** 3))),
+    "outputs": int(os.getenv("OUTPUTS_MAX_BYTES", str(20 * 1024 ** 3))),
+}
+
+class StorageGovernor:
+    """
+    Keeps the upload and output stores within their disk budgets.
+    Bytes are counted per store and per user as files are created and removed, and
+    when a store goes over budget its least recently used evictable files are
+    deleted. A store counts the data of hard-linked paths once, until the last of
+    them is removed; each user is charged for every path they own.
+    This is the only place files are evicted for space.
+    """
+
+    def __init__(
+        self,
+        budgets: Optional[Dict[str, int]] = None,
+        redis_client: Optional[redis.Redis] = None
+    ):
+        """Initialize the governor with its per-store budgets"""
+        self.budgets = dict(STORAGE_BUDGETS if budgets is None else budgets)
+        self._redis = redis_client
+
+        # Store -> function deleting one evictable path, returning True if it did
+        self._evictors: Dict[str, Callable[[str], bool]] = {}
+
+    @property
+    def redis(self) -> redis.Redis:
+        """Redis client holding the usage counters"""
+        if self._redis is None:
+            self._redis = get_redis()
+        return self._redis
+
+    def register_evictor(self, store: str, evictor: Callable[[str], bool]) -> None:
+        """
+        Set the function used to delete a store's files under disk pressure.
+
+        Args:
+            store: Name of the store
+            evictor: Function taking a path and returning True if it was deleted;
+                it must untrack the paths it deletes
+        """
+        self._evictors[store] = evictor
+
+    def track(
+        self,
+        path: str,
+        store: str,
+        user_id: Optional[str] = None,
+        counted: bool = True,
+        evictable: bool = True
+    ) -> None:
+        """
+        Count a new file against a store and its owner.
+
+        Args:
+            path: Path to the file
+            store: Name of the store the file belongs to
+            user_id: Optional ID of the user who owns the file
+            counted: Whether the bytes count against the store, False for links
+                whose data is already counted under another path. Other links to
+                the same data are detected and counted once either way
+            evictable: Whether the file may be evicted when the store is full
+        """
+        stat = os.stat(path)
+        size = stat.st_size
+        inode = f"{stat.st_dev}:{stat.st_ino}"
+        record = json.dumps({"store": store, "user": user_id, "size": size, "counted": counted, "inode": inode})
+
+        try:
+            if not self.redis.hsetnx(STORAGE_FILES_KEY, path, record):
+                # Already counted
+                return
+
+            # Only the first tracked link to the data adds its bytes to the store
+            first_link = counted and self.redis.hincrby(STORAGE_INODES_KEY, inode, 1) == 1
+
+            pipe = self.redis.pipeline()
+            if first_link:
+                pipe.hincrby(STORAGE_USAGE_KEY, store, size)
+            if user_id:
+                pipe.hincrby(f"{STORAGE_USER_KEY_PREFIX}{user_id}", store, size)
+            if evictable:
+                pipe.zadd(f"{STORAGE_LRU_KEY_PREFIX}{store}", {path: time.time()})
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Failed to track storage for {path}: {str(e)}")
+
+    def untrack(self, path: str) -> None:
+        """
+        Subtract a removed file from its store and owner.
+
+        Args:
+            path: Path to the file
+        """
+        try:
+            # Read and delete together so concurrent callers subtract only once
+            pipe = self.redis.pipeline(transaction=True)
+            pipe.hget(STORAGE_FILES_KEY, path)
+            pipe.hdel(STORAGE_FILES_KEY, path)
+            raw, removed = pipe.execute()
+            if not removed or not raw:
+                return
+
+            record = json.loads(raw)
+
+            # The data's bytes leave the store with its last tracked link
+            last_link = False
+            if record["counted"]:
+                inode = record.get("inode")
+                if inode is None:
+                    last_link = True
+                elif self.redis.hincrby(STORAGE_INODES_KEY, inode, -1) <= 0:
+                    self.redis.hdel(STORAGE_INODES_KEY, inode)
+                    last_link = True
+
+            pipe = self.redis.pipeline()
+            if last_link:
+                pipe.hincrby(STORAGE_USAGE_KEY, record["store"], -record["size"])
+            if record["user"]:
+                pipe.hincrby(f"{STORAGE_USER_KEY_PREFIX}{record['user']}", record["store"], -record["size"])
+            pipe.zrem(f"{STORAGE_LRU_KEY_PREFIX}{record['store']}", path)
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Failed to untrack storage for {path}: {str(e)}")
+
+    def touch(self, path: str, store: str) -> None:
+        """
+        Mark an evictable file as recently used.
+
+        Args:
+            path: Path to the file
+            store: Name of the store the file belongs to
+        """
+        try:
+            self.redis.zadd(f"{STORAGE_LRU_KEY_PREFIX}{store}", {path: time.time()}, xx=True)
+        except redis.RedisError:
+            pass
+
+    def set_evictable(self, path: str, store: str, evictable: bool) -> None:
+        """
+        Allow or prevent eviction of a tracked file.
+
+        Args:
+            path: Path to the file
+            store: Name of the store the file belongs to
+            evictable: Whether the file may be evicted
+        """
+        key = f"{STORAGE_LRU_KEY_PREFIX}{store}"
+        try:
+            if evictable:
+                self.redis.zadd(key, {path: time.time()})
+            else:
+                self.redis.zrem(key, path)
+        except redis.RedisError as e:
+            logger.warning(f"Failed to update eviction state of {path}: {str(e)}")
+
+    def bytes_used(self, store: str) -> int:
+        """Get the bytes counted against a store"""
+        return int(self.redis.hget(STORAGE_USAGE_KEY, store) or 0)
+
+    def enforce(self, store: str) -> int:
+        """
+        Evict least recently used files until a store fits its budget.
+        Only one process evicts from a store at a time; others return straight away.
+
+        Args:
+            store: Name of the store
+
+        Returns:
+            Number of bytes freed
+        """
+        budget = self.budgets.get(store)
+        evictor = self._evictors.get(store)
+        if not budget or evictor is None:
+            return 0
+
+        try:
+            used = self.bytes_used(store)
+            if used <= budget:
+                return 0
+
+            lock_key = f"storage:evict:{store}"
+            if not self.redis.set(lock_key, 1, nx=True, ex=300):
+                return 0
+        except redis.RedisError as e:
+            logger.warning(f"Storage usage unavailable: {str(e)}")
+            return 0
+
+        lru_key = f"{STORAGE_LRU_KEY_PREFIX}{store}"
+        start_used = used
+        try:
+            while used > budget:
+                candidates = self.redis.zrange(lru_key, 0, 9)
+                if not candidates:
+                    logger.warning(f"The {store} store is over budget with nothing left to evict")
+                    break
+
+                for member in candidates:
+                    path = member.decode("utf-8")
+                    # Files still in use leave the LRU too and re-enter it when released
+                    evictor(path)
+                    self.redis.zrem(lru_key, path)
+
+                    used = self.bytes_used(store)
+                    if used <= budget:
+                        break
+        finally:
+            self.redis.delete(lock_key)
+
+        freed = max(0, start_used - used)
+        if freed:
+            logger.info(f"Evicted {freed} bytes from the {store} store")
+        return freed
+
+    def usage(self, user_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Get the current usage of every store.
+
+        Args:
+            user_id: Optional user whose own usage is included
+
+        Returns:
+            Dictionary of bytes used, budget and evictable file count per store
+        """
+        totals = {k.decode("utf-8"): int(v) for k, v in self.redis.hgetall(STORAGE_USAGE_KEY).items()}
+
+        stores = {}
+        for store in sorted(set(totals) | set(self.budgets)):
+            stores[store] = {
+                "bytes": totals.get(store, 0),
+                "max_bytes": self.budgets.get(store, 0),
+                "evictable_files": self.redis.zcard(f"{STORAGE_LRU_KEY_PREFIX}{store}"),
+            }
+
+        result = {"stores": stores}
+        if user_id:
+            raw = self.redis.hgetall(f"{STORAGE_USER_KEY_PREFIX}{user_id}")
+            result["user"] = {
+                "user_id": user_id,
+                "stores": {k.decode("utf-8"): int(v) for k, v in raw.items()},
+            }
+        return result
+
+# Create a singleton instance
+storage_governor = StorageGovernor()
@@ -0,0 +1,188 @@
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from celery import states
+
+from app.celery_worker import celery
+from app.utils.redis_client import get_async_redis
+
+logger = logging.getLogger(__name__)
+
+class TaskResultWaiter:
+    """
+    Follows Celery task states without blocking the event loop.
+    The Redis result backend publishes every stored state (started, progress
+    updates and the final result) on a channel named after its result key, so one
+    pub/sub connection per process is shared by every waiting request instead of
+    each one polling or holding a thread.
+    """
+
+    def __init__(self):
+        """Initialize the waiter"""
+        # Result key -> queues of the requests following it
+        self._listeners: Dict[bytes, List[asyncio.Queue]] = {}
+        self._pubsub = None
+        self._reader: Optional[asyncio.Task] = None
+
+    async def watch(self, task_id: str, heartbeat: Optional[float] = None) -> AsyncIterator[Optional[Dict[str, Any]]]:
+        """
+        Follow the states of a task until it finishes.
+        The current state is yielded first (PENDING if nothing is stored yet).
+        Close the iterator with aclose() when stopping early.
+
+        Args:
+            task_id: ID of the Celery task
+            heartbeat: Optional seconds of silence after which None is yielded
+
+        Yields:
+            Decoded task metadata with "status" and "result" keys, or None on a heartbeat
+        """
+        key = celery.backend.get_key_for_task(task_id)
+        queue: asyncio.Queue = asyncio.Queue()
+
+        listeners = self._listeners.setdefault(key, [])
+        listeners.append(queue)
+        try:
+            if len(listeners) == 1:
+                await self._subscribe(key)
+
+            # The task may have stored states before the subscription took effect
+            raw = await get_async_redis().get(key)
+            meta = self._decode(raw) if raw else {"status": states.PENDING, "result": None}
+            yield meta
+            if meta["status"] in states.READY_STATES:
+                return
+
+            while True:
+                try:
+                    meta = await asyncio.wait_for(queue.get(), heartbeat)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+
+                yield meta
+                if meta["status"] in states.READY_STATES:
+                    return
+        finally:
+            listeners.remove(queue)
+            if not listeners:
+                del self._listeners[key]
+                await self._unsubscribe(key)
+
+    async def wait(self, task_id: str, timeout: float) -> Any:
+        """
+        Wait for a task to finish and return its result.
+
+        Args:
+            task_id: ID of the Celery task
+            timeout: Seconds to wait before giving up
+
+        Returns:
+            The task's return value
+
+        Raises:
+            TimeoutError: If the task does not finish in time
+            Exception: The task's exception if it failed
+        """
+        try:
+            meta = await asyncio.wait_for(self._wait_ready(task_id), timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"Task {task_id} did not finish within {timeout} seconds")
+
+        if meta["status"] == states.SUCCESS:
+            return meta["result"]
+
+        result = meta["result"]
+        if isinstance(result, BaseException):
+            raise result
+        raise RuntimeError(f"Task {task_id} ended in state {meta['status']}")
+
+    async def _wait_ready(self, task_id: str) -> Dict[str, Any]:
+        """Get the metadata of a task once it is in a ready state"""
+        events = self.watch(task_id)
+        try:
+            async for meta in events:
+                if meta["status"] in states.READY_STATES:
+                    return meta
+        finally:
+            await events.aclose()
+
+    async def close(self) -> None:
+        """Stop listening and release the pub/sub connection"""
+        if self._reader is not None:
+            self._reader.cancel()
+            self._reader = None
+        if self._pubsub is not None:
+            await self._pubsub.close()
+            self._pubsub = None
+
+    async def _subscribe(self, key: bytes) -> None:
+        """Subscribe to a result channel, starting the reader on first use"""
+        if self._pubsub is None:
+            self._pubsub = get_async_redis().pubsub()
+        await self._pubsub.subscribe(key)
+
+        if self._reader is None or self._reader.done():
+            self._reader = asyncio.get_running_loop().create_task(self._read_messages())
+
+    async def _unsubscribe(self, key: bytes) -> None:
+        """Unsubscribe from a result channel nobody is waiting on"""
+        if self._pubsub is None:
+            return
+        try:
+            await self._pubsub.unsubscribe(key)
+        except Exception as e:
+            logger.warning(f"Failed to unsubscribe from {key!r}: {str(e)}")
+
+    async def _read_messages(self) -> None:
+        """Hand published results to the requests waiting on them"""
+        while True:
+            try:
+                message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Reconnect and subscribe again to everything still being waited on
+                logger.warning(f"Task result subscription failed: {str(e)}")
+                await asyncio.sleep(1.0)
+                try:
+                    if self._listeners:
+                        await self._pubsub.subscribe(*self._listeners.keys())
+                except Exception:
+                    pass
+                self._wake_from_stored_results()
+                continue
+
+            if message is None or message["type"] != "message":
+                continue
+
+            meta = self._decode(message["data"])
+            for queue in self._listeners.get(message["channel"], []):
+                queue.put_nowait(meta)
+
+    def _wake_from_stored_results(self) -> None:
+        """Re-read stored states for tasks that may have changed while disconnected"""
+        for key in list(self._listeners):
+            asyncio.get_running_loop().create_task(self._check_stored_result(key))
+
+    async def _check_stored_result(self, key: bytes) -> None:
+        """Hand a task's stored state to the requests following it"""
+        try:
+            raw = await get_async_redis().get(key)
+        except Exception:
+            return
+        if not raw:
+            return
+
+        meta = self._decode(raw)
+        for queue in self._listeners.get(key, []):
+            queue.put_nowait(meta)
+
+    @staticmethod
+    def _decode(raw: bytes) -> Dict[str, Any]:
+        """Decode a stored result, turning failures back into exceptions"""
+        return celery.backend.decode_result(raw)
+
+# Create a singleton instance
+task_result_waiter = TaskResultWaiter()
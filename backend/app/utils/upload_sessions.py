@@ -0,0 +1,339 @@
+import os
+import time
+import uuid
+import asyncio
+import functools
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+import redis
+
+from app.utils.blob_store import BlobStore
+from app.utils.expiry_index import ExpiryIndex
+from app.utils.file_manager import CHUNK_SIZE, new_content_hasher
+from app.utils.file_ops import StreamWriter
+from app.utils.redis_client import get_redis
+
+# Redis key prefix for upload sessions
+UPLOAD_KEY_PREFIX = "upload:"
+
+# Sessions that see no activity for this long are dropped
+UPLOAD_SESSION_TTL = 24 * 3600
+
+# How long a request may hold an upload's lock before it is considered gone
+UPLOAD_LOCK_TTL = 600
+
+class UploadOffsetMismatch(ValueError):
+    """Raised when a chunk does not start where the upload currently ends"""
+
+    def __init__(self, expected_offset: int):
+        super().__init__(f"Chunk must start at offset {expected_offset}")
+        self.expected_offset = expected_offset
+
+class UploadLengthMismatch(ValueError):
+    """Raised when a chunk's body is not as long as the range it declares"""
+
+    def __init__(self, declared: int, received: int):
+        super().__init__(f"Chunk declares {declared} bytes but {received} were received")
+        self.declared = declared
+        self.received = received
+
+class UploadSessionBusy(RuntimeError):
+    """Raised when another request is already writing to the same upload"""
+
+class UploadSessionManager:
+    """
+    Manages resumable chunked uploads.
+    Chunks are written straight into a staging file next to the blob store and
+    hashed as they arrive, so finishing an upload is a rename rather than a copy.
+    Session state lives in Redis so any API process can take the next chunk.
+    """
+
+    def __init__(
+        self,
+        blob_store: BlobStore,
+        expiry_index: ExpiryIndex,
+        redis_client: Optional[redis.Redis] = None,
+        max_cached_hashers: int = 1024
+    ):
+        """Initialize the session manager"""
+        self.blob_store = blob_store
+        self.expiry_index = expiry_index
+        self._redis = redis_client
+        self.max_cached_hashers = max_cached_hashers
+
+        # Upload ID -> (offset, hash object) for uploads this process has written to
+        self._hashers: "OrderedDict[str, Tuple[int, Any]]" = OrderedDict()
+
+    @property
+    def redis(self) -> redis.Redis:
+        """Redis client holding the session state"""
+        if self._redis is None:
+            self._redis = get_redis()
+        return self._redis
+
+    def create_session(
+        self,
+        filename: str,
+        conversion_type: Optional[str] = None,
+        size: Optional[int] = None,
+        user_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Start a new upload.
+
+        Args:
+            filename: Original filename
+            conversion_type: Optional type of conversion, inferred from the content when the upload is finished
+            size: Optional total size of the upload in bytes
+            user_id: Optional user ID for user-based directories
+
+        Returns:
+            The new session
+        """
+        upload_id = str(uuid.uuid4())
+
+        # Create the empty staging file the chunks are written into
+        temp_path = self.blob_store.temp_path(upload_id)
+        open(temp_path, "wb").close()
+        self.expiry_index.schedule(temp_path, UPLOAD_SESSION_TTL)
+
+        session = {
+            "upload_id": upload_id,
+            "filename": os.path.basename(filename),
+            "conversion_type": conversion_type or "",
+            "size": size if size is not None else -1,
+            "offset": 0,
+            "user_id": user_id or "",
+            "created_at": int(time.time()),
+            "state": "uploading",
+        }
+
+        key = f"{UPLOAD_KEY_PREFIX}{upload_id}"
+        pipe = self.redis.pipeline()
+        pipe.hset(key, mapping=session)
+        pipe.expire(key, UPLOAD_SESSION_TTL)
+        pipe.execute()
+
+        return self._decode(session)
+
+    def get_session(self, upload_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get an upload session.
+
+        Args:
+            upload_id: ID of the upload
+
+        Returns:
+            The session, or None if it does not exist
+        """
+        raw = self.redis.hgetall(f"{UPLOAD_KEY_PREFIX}{upload_id}")
+        if not raw:
+            return None
+        return self._decode({k.decode("utf-8"): v.decode("utf-8") for k, v in raw.items()})
+
+    async def write_chunk(
+        self,
+        upload_id: str,
+        offset: int,
+        chunks: AsyncIterator[bytes],
+        length: Optional[int] = None
+    ) -> int:
+        """
+        Append a chunk of data to an upload.
+        Bytes written before a dropped connection are kept, so the client can
+        resume from the offset reported by the session. A chunk that arrives in
+        full with a different length than declared is discarded.
+
+        Args:
+            upload_id: ID of the upload
+            offset: Byte offset where the chunk starts
+            chunks: Async iterator over the chunk's data
+            length: Optional number of bytes the chunk declares
+
+        Returns:
+            The upload's new offset
+
+        Raises:
+            KeyError: If the upload does not exist
+            UploadOffsetMismatch: If the chunk does not start at the current offset
+            UploadLengthMismatch: If the chunk is not as long as declared
+            UploadSessionBusy: If another request is writing to the upload
+            ValueError: If the chunk goes past the declared upload size
+        """
+        if not await self._run_blocking(self._acquire_lock, upload_id):
+            raise UploadSessionBusy(f"Upload {upload_id} is already receiving data")
+
+        writer = None
+        rejected = False
+        try:
+            # Read under the lock, so the session cannot be finished in the meantime
+            session = await self._run_blocking(self.get_session, upload_id)
+            if session is None:
+                raise KeyError(upload_id)
+            if session["state"] != "uploading":
+                raise UploadSessionBusy(f"Upload {upload_id} is being finished")
+
+            if offset != session["offset"]:
+                raise UploadOffsetMismatch(session["offset"])
+
+            temp_path = self.blob_store.temp_path(upload_id)
+            hash_obj = await self._get_hasher(upload_id, temp_path, offset)
+
+            fd = os.open(temp_path, os.O_WRONLY)
+            try:
+                # Drop anything an interrupted request wrote past the recorded offset
+                os.ftruncate(fd, offset)
+                os.lseek(fd, offset, os.SEEK_SET)
+
+                max_bytes = session["size"] - offset if session["size"] is not None else None
+                writer = StreamWriter(fd, hash_obj, max_bytes)
+                await writer.write_from(chunks)
+            finally:
+                os.close(fd)
+
+            if length is not None and writer.written != length:
+                # The next chunk truncates the file back to the recorded offset, and
+                # the running hash, which took in the rejected bytes, is rebuilt from disk
+                rejected = True
+                self._hashers.pop(upload_id, None)
+                raise UploadLengthMismatch(length, writer.written)
+        finally:
+            written = writer.written if writer and not rejected else 0
+            if written:
+                new_offset = offset + written
+                self._remember_hasher(upload_id, new_offset, hash_obj)
+                await self._run_blocking(self._save_offset, upload_id, new_offset)
+            await self._run_blocking(self.redis.delete, self._lock_key(upload_id))
+
+        return offset + written
+
+    async def finalize(self, upload_id: str) -> Tuple[str, str, Dict[str, Any]]:
+        """
+        Finish an upload.
+
+        Args:
+            upload_id: ID of the upload
+
+        Returns:
+            Tuple of (staging_path, file_hash, session)
+
+        Raises:
+            KeyError: If the upload does not exist
+            UploadSessionBusy: If a chunk is being written or the upload is already being finished
+            ValueError: If the upload is incomplete
+        """
+        # Shares write_chunk's lock, so no chunk lands while the upload is hashed and handed over
+        if not await self._run_blocking(self._acquire_lock, upload_id):
+            raise UploadSessionBusy(f"Upload {upload_id} is receiving data or being finished")
+
+        key = f"{UPLOAD_KEY_PREFIX}{upload_id}"
+        try:
+            session = await self._run_blocking(self.get_session, upload_id)
+            if session is None:
+                raise KeyError(upload_id)
+            if session["state"] != "uploading":
+                raise UploadSessionBusy(f"Upload {upload_id} is already being finished")
+
+            if session["size"] is not None and session["offset"] != session["size"]:
+                raise ValueError(f"Upload is incomplete: {session['offset']} of {session['size']} bytes received")
+
+            # Later chunks and completions are refused even once the lock is released
+            await self._run_blocking(self.redis.hset, key, "state", "finalizing")
+            try:
+                temp_path = self.blob_store.temp_path(upload_id)
+                hash_obj = await self._get_hasher(upload_id, temp_path, session["offset"])
+            except BaseException:
+                # Let the client retry the completion
+                await self._run_blocking(self.redis.hset, key, "state", "uploading")
+                raise
+            self._hashers.pop(upload_id, None)
+
+            await self._run_blocking(self.redis.delete, key)
+            await self._run_blocking(self.expiry_index.cancel, temp_path)
+        finally:
+            await self._run_blocking(self.redis.delete, self._lock_key(upload_id))
+
+        return temp_path, hash_obj.hexdigest(), session
+
+    def abort(self, upload_id: str) -> None:
+        """
+        Cancel an upload and remove its data.
+
+        Args:
+            upload_id: ID of the upload
+        """
+        self._hashers.pop(upload_id, None)
+        self.redis.delete(f"{UPLOAD_KEY_PREFIX}{upload_id}")
+
+        temp_path = self.blob_store.temp_path(upload_id)
+        self.expiry_index.cancel(temp_path)
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+    @staticmethod
+    def _lock_key(upload_id: str) -> str:
+        """Redis key of the lock held while an upload is written to or finished"""
+        return f"{UPLOAD_KEY_PREFIX}{upload_id}:lock"
+
+    def _acquire_lock(self, upload_id: str) -> bool:
+        """Take an upload's lock, returning False if another request holds it"""
+        return bool(self.redis.set(self._lock_key(upload_id), 1, nx=True, ex=UPLOAD_LOCK_TTL))
+
+    def _save_offset(self, upload_id: str, offset: int) -> None:
+        """Record how much of an upload has been received and keep it alive"""
+        key = f"{UPLOAD_KEY_PREFIX}{upload_id}"
+        pipe = self.redis.pipeline()
+        pipe.hset(key, "offset", offset)
+        pipe.expire(key, UPLOAD_SESSION_TTL)
+        pipe.execute()
+        self.expiry_index.schedule(self.blob_store.temp_path(upload_id), UPLOAD_SESSION_TTL)
+
+    @staticmethod
+    async def _run_blocking(func, *args, **kwargs):
+        """Run a blocking Redis or disk call in the default executor, off the event loop"""
+        return await asyncio.get_event_loop().run_in_executor(None, functools.partial(func, *args, **kwargs))
+
+    async def _get_hasher(self, upload_id: str, temp_path: str, offset: int):
+        """Get the running hash of an upload, rebuilding it from disk if this process lost it"""
+        cached = self._hashers.get(upload_id)
+        if cached and cached[0] == offset:
+            return cached[1]
+
+        # Another process took the previous chunks, so hash what is on disk
+        return await asyncio.get_event_loop().run_in_executor(None, self._hash_prefix, temp_path, offset)
+
+    def _hash_prefix(self, temp_path: str, length: int):
+        """Hash the first bytes of a file"""
+        hash_obj = new_content_hasher()
+        with open(temp_path, "rb") as f:
+            remaining = length
+            while remaining > 0:
+                chunk = f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                hash_obj.update(chunk)
+                remaining -= len(chunk)
+        return hash_obj
+
+    def _remember_hasher(self, upload_id: str, offset: int, hash_obj) -> None:
+        """Keep the running hash of an upload, bounded in number"""
+        self._hashers[upload_id] = (offset, hash_obj)
+        self._hashers.move_to_end(upload_id)
+        while len(self._hashers) > self.max_cached_hashers:
+            self._hashers.popitem(last=False)
+
+    @staticmethod
+    def _decode(session: Dict[str, Any]) -> Dict[str, Any]:
+        """Convert a session read from Redis to its Python types"""
+        size = int(session["size"])
+        return {
+            "upload_id": session["upload_id"],
+            "filename": session["filename"],
+            "conversion_type": session["conversion_type"] or None,
+            "size": size if size >= 0 else None,
+            "offset": int(session["offset"]),
+            "user_id": session["user_id"] or None,
+            "created_at": int(session["created_at"]),
+            "state": session.get("state", "uploading"),
+        }
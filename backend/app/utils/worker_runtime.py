@@ -0,0 +1,93 @@
+import os
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Threads of the default executor shared by every conversion in a worker process
+WORKER_EXECUTOR_THREADS = int(os.getenv("WORKER_EXECUTOR_THREADS", str(min(32, (os.cpu_count() or 1) + 4))))
+
+class WorkerRuntime:
+    """
+    Event loop that lives as long as the worker process.
+    The loop runs in its own thread and tasks hand it coroutines, so loop-bound
+    state such as semaphores, executors and async clients survives from one task
+    to the next instead of being rebuilt (and left bound to a closed loop) per task.
+    """
+
+    def __init__(self, executor_threads: int = WORKER_EXECUTOR_THREADS):
+        """Initialize the runtime; the loop starts on first use or with start()"""
+        self.executor_threads = executor_threads
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def start(self) -> asyncio.AbstractEventLoop:
+        """
+        Start the event loop thread if it is not running yet.
+
+        Returns:
+            The running loop
+        """
+        with self._lock:
+            if self.loop is not None and self._thread is not None and self._thread.is_alive():
+                return self.loop
+
+            self.loop = asyncio.new_event_loop()
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.executor_threads,
+                thread_name_prefix="conversion"
+            )
+            self.loop.set_default_executor(self._executor)
+
+            self._thread = threading.Thread(target=self._run_loop, name="worker-runtime", daemon=True)
+            self._thread.start()
+            logger.info(f"Worker runtime started in process {os.getpid()}")
+            return self.loop
+
+    def run(self, coro: Awaitable[Any]) -> Any:
+        """
+        Run a coroutine on the worker loop and wait for its result.
+        If the caller is interrupted, e.g. by a task time limit, the coroutine is cancelled.
+
+        Args:
+            coro: Coroutine to run
+
+        Returns:
+            The coroutine's result
+        """
+        loop = self.start()
+        future = asyncio.run_coroutine_threadsafe(coro, loop)
+        try:
+            return future.result()
+        except BaseException:
+            future.cancel()
+            raise
+
+    def stop(self) -> None:
+        """Stop the loop and its executor, e.g. when the worker process shuts down"""
+        with self._lock:
+            if self.loop is None:
+                return
+
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            if self._thread is not None:
+                self._thread.join(timeout=10)
+            self.loop.close()
+            self._executor.shutdown(wait=False)
+
+            self.loop = None
+            self._thread = None
+            self._executor = None
+
+    def _run_loop(self) -> None:
+        """Run the loop until stop() is called"""
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+# Create a singleton instance
+worker_runtime = WorkerRuntime()